@@ -0,0 +1,340 @@
+"""Upgrade the configurations of many instruments at once, e.g. on release day.
+
+Each instrument settings area is upgraded in its own process with its own file access, logger and
+git repository, as if upgrade.py had been run on the instrument. For example:
+
+    python fleet.py C:\\settings\\NDXLET C:\\settings\\NDXMERLIN --workers 4
+
+Steps which only apply to some instruments check the name of the instrument, which is taken to be
+the name of the settings area (e.g. NDXLET). Steps which ask for input fail, as there is no one to
+answer.
+
+Steps which change things shared by every instrument on the machine running the upgrade (the
+database, the calibrations repository and the EPICS tree) are performed once, before the
+instruments are upgraded, rather than by every instrument at the same time; set MYSQL_PASSWORD (or
+UPGRADE_SQLITE_DATABASE) for the database steps. With --skip_shared_steps they are not performed.
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from multiprocessing import get_context
+
+# Output from the upgrade of each instrument (other than its log) is written to this file in its
+# log folder
+CONSOLE_FILENAME = "console.txt"
+
+# The log folder for the steps which are performed once for all of the instruments
+SHARED_STEPS_LOG_FOLDER = "shared"
+
+
+@dataclass
+class InstrumentResult:
+    instrument: str  # Name of the instrument
+    config_root: str  # The settings area which was upgraded
+    status: int | str  # Status code of the upgrade, 0 for success
+    duration: float  # Time the upgrade took in seconds
+    error: str | None = None  # Error which stopped the upgrade, if any
+
+    @property
+    def succeeded(self) -> bool:
+        return self.status == 0
+
+
+def instrument_name(config_root: str) -> str:
+    """The name of the instrument a settings area is for.
+
+    Args:
+        config_root: the settings area e.g. C:\\Instrument\\Settings\\config\\NDXLET
+
+    Returns: the name of the instrument e.g. NDXLET
+    """
+    return os.path.basename(os.path.normpath(config_root))
+
+
+def is_shared_step(upgrade_step) -> bool:
+    """Whether an upgrade step changes something shared by every instrument on the machine.
+
+    Args:
+        upgrade_step: the step
+
+    Returns: True if the step writes a shared resource e.g. the database
+    """
+    from src.common_upgrades.utils.resources import SHARED_RESOURCES
+
+    writes = getattr(upgrade_step, "writes", None)
+    return writes is not None and not SHARED_RESOURCES.isdisjoint(writes)
+
+
+def instrument_steps(upgrade_steps: list) -> list:
+    """The upgrade steps to perform for each instrument. Shared steps are performed once for the
+    fleet, so they are replaced by steps which do nothing, keeping the versions.
+
+    Args:
+        upgrade_steps: version and step of every upgrade step
+
+    Returns: version and step of every upgrade step, with the shared steps doing nothing
+    """
+    from src.upgrade_step_noop import UpgradeStepNoOp
+
+    return [
+        (version, UpgradeStepNoOp() if is_shared_step(upgrade_step) else upgrade_step)
+        for version, upgrade_step in upgrade_steps
+    ]
+
+
+@contextlib.contextmanager
+def _worker(config_root: str, log_dir: str):
+    """Set up a fresh worker process to upgrade a settings area. This must be done before the
+    upgrade is imported since the upgrade reads its settings from the environment on import.
+
+    Args:
+        config_root: the settings area to upgrade
+        log_dir: the folder to write the log and the console output to
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    os.environ["ICPCONFIGROOT"] = os.path.join(config_root, "configurations")
+    with (
+        open(os.path.join(log_dir, CONSOLE_FILENAME), mode="a") as console,
+        contextlib.redirect_stdout(console),
+        contextlib.redirect_stderr(console),
+    ):
+        yield
+
+
+def upgrade_shared_steps(config_root: str, log_root: str) -> InstrumentResult:
+    """Perform the shared upgrade steps, in order, on the machine running the upgrade. Runs in a
+    fresh worker process. The database steps skip what already exists, so the shared steps can be
+    performed again for each fleet.
+
+    Args:
+        config_root: a settings area of the fleet, for the steps to be given
+        log_root: the folder to write the log folder of the shared steps to
+
+    Returns: the result of the shared steps
+    """
+    log_dir = os.path.join(log_root, SHARED_STEPS_LOG_FOLDER)
+    start = time.monotonic()
+    status = 0
+    error = None
+    with _worker(config_root, log_dir):
+        try:
+            from src.common_upgrades.sql_utilities import SqlConnection
+            from src.file_access import FileAccess
+            from src.local_logger import LocalLogger
+            from upgrade import UPGRADE_STEPS, configure_database
+
+            configure_database()
+            logger = LocalLogger(log_dir)
+            file_access = FileAccess(logger, config_root)
+            with SqlConnection():
+                for version, upgrade_step in UPGRADE_STEPS:
+                    if not is_shared_step(upgrade_step):
+                        continue
+                    logger.info("Performing shared step from {}".format(version))
+                    status = upgrade_step.perform(file_access, logger)
+                    if status != 0:
+                        break
+        except Exception as e:
+            status = -1
+            error = "{}: {}".format(type(e).__name__, e)
+    return InstrumentResult(
+        SHARED_STEPS_LOG_FOLDER, config_root, status, time.monotonic() - start, error
+    )
+
+
+def upgrade_instrument(config_root: str, log_root: str) -> InstrumentResult:
+    """Upgrade the configuration of one instrument, without the shared steps. Runs in a fresh
+    worker process.
+
+    Args:
+        config_root: the settings area to upgrade
+        log_root: the folder to write the log folder of each instrument to
+
+    Returns: the result of the upgrade
+    """
+    instrument = instrument_name(config_root)
+    log_dir = os.path.join(log_root, instrument)
+
+    start = time.monotonic()
+    error = None
+    with _worker(config_root, log_dir):
+        try:
+            from src.file_access import FileAccess
+            from src.git_utils import RepoFactory
+            from src.local_logger import LocalLogger
+            from src.upgrade import Upgrade
+            from upgrade import UPGRADE_STEPS, configure_database
+
+            configure_database()
+            logger = LocalLogger(log_dir)
+            config_upgrade = Upgrade(
+                file_access=FileAccess(logger, config_root, instrument=instrument),
+                logger=logger,
+                upgrade_steps=instrument_steps(UPGRADE_STEPS),
+                git_repo=RepoFactory.get_repo(config_root),
+            )
+            status = config_upgrade.upgrade()
+            logger.info(RepoFactory.timing_summary())
+        except Exception as e:
+            status = -1
+            error = "{}: {}".format(type(e).__name__, e)
+    return InstrumentResult(instrument, config_root, status, time.monotonic() - start, error)
+
+
+def _print_result(result: InstrumentResult) -> None:
+    print(
+        "{} {} in {:.1f}s".format(
+            result.instrument, "upgraded" if result.succeeded else "FAILED", result.duration
+        ),
+        flush=True,
+    )
+
+
+def upgrade_fleet(
+    config_roots: list[str],
+    log_root: str,
+    max_workers: int | None = None,
+    shared_steps: bool = True,
+) -> list[InstrumentResult]:
+    """Upgrade the configurations of many instruments at the same time.
+
+    Args:
+        config_roots: the settings areas to upgrade
+        log_root: the folder to write the log folder of each instrument to
+        max_workers: the maximum number of instruments to upgrade at once; defaults to the number
+            of processors
+        shared_steps: whether to perform the shared steps, once, before upgrading the instruments;
+            the instruments are not upgraded if they fail
+
+    Returns: the result of each upgrade, in the order of the settings areas
+    """
+    if max_workers is None:
+        max_workers = min(len(config_roots), os.cpu_count() or 1)
+
+    if shared_steps and len(config_roots) > 0:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            try:
+                shared = executor.submit(upgrade_shared_steps, config_roots[0], log_root).result()
+            except Exception as e:
+                shared = InstrumentResult(
+                    SHARED_STEPS_LOG_FOLDER, config_roots[0], -1, 0.0, "Worker failed: {}".format(e)
+                )
+        _print_result(shared)
+        if not shared.succeeded:
+            error = "Not upgraded, shared steps failed: {}".format(
+                shared.error or "status {}".format(shared.status)
+            )
+            return [
+                InstrumentResult(instrument_name(config_root), config_root, -1, 0.0, error)
+                for config_root in config_roots
+            ]
+
+    results = {}
+    # A new process for every instrument, so that nothing is carried over from the last one
+    with ProcessPoolExecutor(
+        max_workers=max(max_workers, 1), mp_context=get_context("spawn"), max_tasks_per_child=1
+    ) as executor:
+        futures = {
+            executor.submit(upgrade_instrument, config_root, log_root): config_root
+            for config_root in config_roots
+        }
+        for future in as_completed(futures):
+            config_root = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = InstrumentResult(
+                    instrument_name(config_root),
+                    config_root,
+                    -1,
+                    0.0,
+                    "Worker failed: {}".format(e),
+                )
+            results[config_root] = result
+            _print_result(result)
+    return [results[config_root] for config_root in config_roots]
+
+
+def summarise(results: list[InstrumentResult]) -> str:
+    """Summarise the upgrade of a fleet of instruments.
+
+    Args:
+        results: the result of each upgrade
+
+    Returns: a line for each instrument followed by the totals
+    """
+    width = max([len(result.instrument) for result in results] + [len("Instrument")])
+    lines = ["{:<{}}  {:<6}  {:>8}  {}".format("Instrument", width, "Result", "Time", "Details")]
+    for result in results:
+        details = result.error or ("" if result.succeeded else "status {}".format(result.status))
+        lines.append(
+            "{:<{}}  {:<6}  {:>7.1f}s  {}".format(
+                result.instrument,
+                width,
+                "OK" if result.succeeded else "FAILED",
+                result.duration,
+                details,
+            ).rstrip()
+        )
+    failed = sum(1 for result in results if not result.succeeded)
+    lines.append(
+        "{} of {} instruments upgraded, {} failed".format(
+            len(results) - failed, len(results), failed
+        )
+    )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upgrade the configurations of many instruments.")
+    parser.add_argument("config_roots", nargs="*", help="The settings areas to upgrade")
+    parser.add_argument(
+        "-f",
+        "--file",
+        type=str,
+        help="A file listing the settings areas to upgrade, one per line",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="The maximum number of instruments to upgrade at once",
+    )
+    parser.add_argument(
+        "-l",
+        "--log_dir",
+        type=str,
+        default=os.path.join(os.environ.get("ICPVARDIR", "."), "logs", "upgrade", "fleet"),
+        help="The folder to write the logs of each instrument to",
+    )
+    parser.add_argument(
+        "--skip_shared_steps",
+        action="store_true",
+        help="Do not perform the steps which change the database, calibrations repository or EPICS "
+        "tree of this machine",
+    )
+    args = parser.parse_args()
+
+    config_roots = [os.path.abspath(config_root) for config_root in args.config_roots]
+    if args.file is not None:
+        with open(args.file) as roots_file:
+            config_roots.extend(
+                os.path.abspath(line.strip()) for line in roots_file if line.strip()
+            )
+    if len(config_roots) == 0:
+        parser.error("No settings areas to upgrade")
+
+    fleet_results = upgrade_fleet(
+        config_roots,
+        os.path.abspath(args.log_dir),
+        args.workers,
+        shared_steps=not args.skip_shared_steps,
+    )
+    print(summarise(fleet_results))
+    sys.exit(0 if all(result.succeeded for result in fleet_results) else 1)
@@ -0,0 +1,148 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.local_logger import LocalLogger
+
+# Number of files which are synced to disk at the same time
+SYNC_WORKERS = 16
+
+# Maximum number of temporary files held open waiting to be synced
+MAX_OPEN_FILES = 256
+
+
+def temporary_filename(path: str, index: int, removed_folders: list[str]) -> str:
+    """A temporary file to write a file to before renaming it into place.
+
+    This is next to the file, unless the file is in a folder which is to be removed in which case
+    it is next to that folder.
+
+    Args:
+        path: the file
+        index: number of the file in the files being written
+        removed_folders: the folders being removed
+
+    Returns:
+        path of the temporary file
+    """
+    folder = os.path.dirname(path)
+    for removed_folder in removed_folders:
+        if folder == removed_folder or folder.startswith(os.path.join(removed_folder, "")):
+            folder = os.path.dirname(removed_folder)
+            break
+    return os.path.join(
+        folder, ".{}.{}.{}.upgrade".format(os.path.basename(path), os.getpid(), index)
+    )
+
+
+def _sync_directory(directory: str) -> None:
+    """Sync a directory so that the files renamed into it survive a crash. Directories can not be
+    opened on Windows, where renames are made durable by the file system, so nothing is done.
+
+    Args:
+        directory: the directory
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class AtomicBulkWriter(object):
+    """Writes many files so that a failure part way through leaves no file half-written.
+
+    Every file is first written to a temporary file next to it, and the temporary files are synced
+    to disk together rather than one after another, which is much quicker on network shares. Only
+    once all of them are safely written are they renamed into place, after which each directory
+    which has changed is synced once.
+    """
+
+    def __init__(self, logger: LocalLogger, sync_workers: int = SYNC_WORKERS) -> None:
+        """Initialise.
+
+        Args:
+            logger: Logger to use.
+            sync_workers: number of files to sync to disk at the same time
+        """
+        self._logger = logger
+        self._sync_workers = sync_workers
+        self._temporary_files = []
+        self._bytes_written = 0
+        self._start = None
+
+    def write(self, files: dict[str, str | bytes], removed_folders: list[str] = ()) -> None:
+        """Write files to temporary files and sync them to disk, without changing any file. If
+        any can not be written, the temporary files are removed.
+
+        Args:
+            files: dictionary of path to the new contents of the file as text or bytes
+            removed_folders: the folders which will be removed before the files are renamed into
+                place, so temporary files must not be written in them
+        """
+        self._start = time.monotonic()
+        items = list(files.items())
+        try:
+            with ThreadPoolExecutor(max_workers=self._sync_workers) as executor:
+                for batch_start in range(0, len(items), MAX_OPEN_FILES):
+                    batch = items[batch_start : batch_start + MAX_OPEN_FILES]
+                    open_files = []
+                    try:
+                        for index, (path, contents) in enumerate(batch, start=batch_start):
+                            filename = temporary_filename(path, index, removed_folders)
+                            os.makedirs(os.path.dirname(filename), exist_ok=True)
+                            f = open(filename, mode="wb" if isinstance(contents, bytes) else "w")
+                            open_files.append(f)
+                            self._temporary_files.append((filename, path))
+                            f.write(contents)
+                            f.flush()
+                        list(executor.map(lambda f: os.fsync(f.fileno()), open_files))
+                        self._bytes_written += sum(os.fstat(f.fileno()).st_size for f in open_files)
+                    finally:
+                        for f in open_files:
+                            f.close()
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        """Remove the temporary files, leaving every file as it was."""
+        for filename, _ in self._temporary_files:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+        self._temporary_files = []
+
+    def replace(self) -> None:
+        """Rename the temporary files into place, then sync each directory which has changed."""
+        directories = {}
+        for filename, path in self._temporary_files:
+            self._logger.info("Writing file {}".format(path))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(filename, path)
+            directories[os.path.dirname(path)] = None
+            directories[os.path.dirname(filename)] = None
+        for directory in directories:
+            _sync_directory(directory)
+
+        if self._temporary_files:
+            duration = time.monotonic() - self._start
+            self._logger.info(
+                "Wrote {} files ({:.1f} kB) in {:.2f}s, {:.1f} files/s, {:.1f} kB/s, "
+                "{} directory syncs".format(
+                    len(self._temporary_files),
+                    self._bytes_written / 1024,
+                    duration,
+                    len(self._temporary_files) / max(duration, 1e-6),
+                    self._bytes_written / 1024 / max(duration, 1e-6),
+                    len(directories),
+                )
+            )
+        self._temporary_files = []
+        self._bytes_written = 0
@@ -5,6 +5,7 @@ from xml.parsers.expat import ExpatError
 
 from src.common_upgrades.utils.constants import FILTER_REGEX, IOC_FILE, SYNOPTIC_FOLDER
 from src.common_upgrades.utils.macro import Macro
+from src.common_upgrades.xml_transforms import XmlTransform, apply_xml_transforms
 from src.file_access import FileAccess
 from src.local_logger import LocalLogger
 
@@ -90,9 +91,34 @@ class ChangeMacrosInXML(object):
         Returns:
             None
         """
+        transform = self.add_macro_transform(
+            ioc_name, macro_to_add, pattern, description, default_value
+        )
+        apply_xml_transforms(self._file_access, [transform])
+
+    def add_macro_transform(
+        self,
+        ioc_name: str,
+        macro_to_add: Macro,
+        pattern: str,
+        description: str = "No description",
+        default_value: str | None = None,
+    ) -> XmlTransform:
+        """The transform of the ioc files made by add_macro, so it can be combined with others.
+
+        Args:
+            ioc_name: Name of the IOC to add the macro to
+            macro_to_add: Macro class with desired name and value
+            pattern: Regex pattern describing what values the macro accepts e.g. "^(0|1)$" for 0/1
+            description: Description of macro purpose
+            default_value: An optional default value for the macro
+        Returns:
+            The transform.
+        """
         assert macro_to_add.name is not None
         assert macro_to_add.value is not None
-        for path, ioc_xml in self._file_access.get_config_files(IOC_FILE):
+
+        def edit(path: str, ioc_xml: Document) -> None:
             for ioc in self.ioc_tag_generator(path, ioc_xml, ioc_name):
                 macros = ioc.getElementsByTagName("macros")[0]
                 if not find_macro_with_name(macros, macro_to_add.name):
@@ -102,7 +128,7 @@ class ChangeMacrosInXML(object):
 
                     macros.appendChild(new_macro)
 
-            self._file_access.write_xml_file(path, ioc_xml)
+        return XmlTransform(IOC_FILE, edit)
 
     def change_macros(self, ioc_name: str, macros_to_change: list[tuple[Macro, Macro]]) -> None:
         """Changes macros in all xml files that contain the correct macros for a specified ioc.
@@ -114,7 +140,24 @@ class ChangeMacrosInXML(object):
         Returns:
             None.
         """
-        for path, ioc_xml in self._file_access.get_config_files(IOC_FILE):
+        apply_xml_transforms(
+            self._file_access, [self.change_macros_transform(ioc_name, macros_to_change)]
+        )
+
+    def change_macros_transform(
+        self, ioc_name: str, macros_to_change: list[tuple[Macro, Macro]]
+    ) -> XmlTransform:
+        """The transform of the ioc files made by change_macros, so it can be combined with others.
+
+        Args:
+            ioc_name: Name of the IOC to change macros within.
+            macros_to_change: List of 2-tuples of old_macro and new_macro Macro classes.
+
+        Returns:
+            The transform.
+        """
+
+        def edit(path: str, ioc_xml: Document) -> None:
             for ioc in self.ioc_tag_generator(path, ioc_xml, ioc_name):
                 macros = ioc.getElementsByTagName("macros")[0]
                 for macro in macros.getElementsByTagName("macro"):
@@ -126,7 +169,7 @@ class ChangeMacrosInXML(object):
                                 change_macro_name(macro, old_macro.name, new_macro.name)
                                 change_macro_value(macro, old_macro.value, new_macro.value)
 
-            self._file_access.write_xml_file(path, ioc_xml)
+        return XmlTransform(IOC_FILE, edit)
 
     def change_ioc_name(self, old_ioc_name: str, new_ioc_name: str) -> None:
         """Replaces all instances of old_ioc_name with new_ioc_name in an XML tree
@@ -137,7 +180,23 @@ class ChangeMacrosInXML(object):
         Returns:
             None
         """
-        for path, ioc_xml in self._file_access.get_config_files(IOC_FILE):
+        apply_xml_transforms(
+            self._file_access, [self.change_ioc_name_transform(old_ioc_name, new_ioc_name)]
+        )
+
+    def change_ioc_name_transform(self, old_ioc_name: str, new_ioc_name: str) -> XmlTransform:
+        """The transform of the ioc files made by change_ioc_name, so it can be combined with
+        others.
+
+        Args:
+            old_ioc_name: String, the old ioc prefix (without _XX number suffix)
+            new_ioc_name: String, The desired new IOC prefix (without _XX number suffix)
+
+        Returns:
+            The transform.
+        """
+
+        def edit(path: str, ioc_xml: Document) -> None:
             for ioc in ioc_xml.getElementsByTagName("ioc"):
                 ioc_name_with_suffix = ioc.getAttribute("name")
                 if old_ioc_name in ioc_name_with_suffix:
@@ -146,7 +205,7 @@ class ChangeMacrosInXML(object):
                     ).upper()
                     ioc.setAttribute("name", ioc_replacement)
 
-            self._file_access.write_xml_file(path, ioc_xml)
+        return XmlTransform(IOC_FILE, edit)
 
     def change_ioc_name_in_synoptics(self, old_ioc_name: str, new_ioc_name: str) -> None:
         """Replaces instances of old_ioc_name with new_ioc_name
@@ -2,9 +2,18 @@ from typing import Generator
 from xml.dom.minidom import Document, Element, Text
 
 from src.common_upgrades.utils.constants import BLOCK_FILE
-from src.file_access import FileAccess
+from src.common_upgrades.xml_transforms import (
+    SYNOPTIC_FILES,
+    XmlTransform,
+    apply_xml_transforms,
+)
+from src.file_access import FileAccess, LazyXmlDocument
 from src.local_logger import LocalLogger
 
+# Characters which may be written as entities in xml, so text containing them may not appear as
+# is in the contents of a file
+XML_ESCAPED_CHARACTERS = "&<>\"'"
+
 
 class ChangePVsInXML(object):
     """Changes pvs in XML files."""
@@ -45,28 +54,28 @@ class ChangePVsInXML(object):
                 self._logger.info("{} found in {}".format(filter_text, path))
                 yield node
 
-    def _replace_text_in_elements(
-        self,
-        old_text: str,
-        new_text: str,
-        element_name: str,
-        input_files: Generator[tuple[str, Document], None, None],
-    ) -> None:
-        """Replaces all instances of old_text with new_text in all element_name elements
-         of one or more XML files
+    def _replace_text_in_elements_transform(
+        self, old_text: str, new_text: str, element_name: str, file_type: str
+    ) -> XmlTransform:
+        """Transform replacing all instances of old_text with new_text in all element_name elements
+         of a type of XML file
         Args:
             old_text: String, old text to find
             new_text: String, new text to substitute
             element_name: String, tag name of the elements where to look for old_text
-            input_files: Iterable, XML files where to substitute text
+            file_type: String, XML files where to substitute text
+
+        Returns:
+            The transform.
         """
-        for path, xml in input_files:
+
+        def edit(path: str, xml: Document) -> None:
             for node in self.node_text_filter(old_text, element_name, path, xml):
                 if isinstance(node.firstChild, Text):
                     replacement = node.firstChild.nodeValue.replace(old_text, new_text)
                     node.firstChild.replaceWholeText(replacement)
 
-            self._file_access.write_xml_file(path, xml)
+        return XmlTransform(file_type, edit)
 
     def change_pv_name(self, old_pv_name: str, new_pv_name: str) -> None:
         """Replaces all instances of old_pv_name with new_pv_name in the blocks config
@@ -76,8 +85,29 @@ class ChangePVsInXML(object):
             new_pv_name: String, The desired new pv name
 
         """
-        self.change_pv_name_in_blocks(old_pv_name, new_pv_name)
-        self.change_pv_names_in_synoptics(old_pv_name, new_pv_name)
+        apply_xml_transforms(
+            self._file_access, self.change_pv_name_transforms(old_pv_name, new_pv_name)
+        )
+
+    def change_pv_name_transforms(self, old_pv_name: str, new_pv_name: str) -> list[XmlTransform]:
+        """The transforms of the blocks and synoptics made by change_pv_name, so they can be
+        combined with others.
+
+        Args:
+            old_pv_name: String, the old pv name
+            new_pv_name: String, The desired new pv name
+
+        Returns:
+            The transforms.
+        """
+        return [
+            self._replace_text_in_elements_transform(
+                old_pv_name, new_pv_name, "read_pv", BLOCK_FILE
+            ),
+            self._replace_text_in_elements_transform(
+                old_pv_name, new_pv_name, "address", SYNOPTIC_FILES
+            ),
+        ]
 
     def change_pv_name_in_blocks(self, old_pv_name: str, new_pv_name: str) -> None:
         """Move any blocks pointing at old_pv_name to point at new_pv_name.
@@ -86,11 +116,13 @@ class ChangePVsInXML(object):
             old_pv_name: The old PV to remove references to
             new_pv_name: The new PV to replace it with
         """
-        self._replace_text_in_elements(
-            old_pv_name,
-            new_pv_name,
-            "read_pv",
-            self._file_access.get_config_files(BLOCK_FILE),
+        apply_xml_transforms(
+            self._file_access,
+            [
+                self._replace_text_in_elements_transform(
+                    old_pv_name, new_pv_name, "read_pv", BLOCK_FILE
+                )
+            ],
         )
 
     def change_pv_names_in_synoptics(self, old_pv_name: str, new_pv_name: str) -> None:
@@ -100,8 +132,13 @@ class ChangePVsInXML(object):
             old_pv_name: The old PV to remove references to
             new_pv_name: The new PV to replace it with
         """
-        self._replace_text_in_elements(
-            old_pv_name, new_pv_name, "address", self._file_access.get_synoptic_files()
+        apply_xml_transforms(
+            self._file_access,
+            [
+                self._replace_text_in_elements_transform(
+                    old_pv_name, new_pv_name, "address", SYNOPTIC_FILES
+                )
+            ],
         )
 
     def get_number_of_instances_of_pv(self, pv_names: str | list[str]) -> int:
@@ -113,10 +150,39 @@ class ChangePVsInXML(object):
             The number of occurrences in both the config and the synoptic
         """
         num_of_instances = 0
-        for pv_name in pv_names:
-            for path, xml in self._file_access.get_config_files(BLOCK_FILE):
-                num_of_instances += len(list(self.node_text_filter(pv_name, "read_pv", path, xml)))
-            for path, xml in self._file_access.get_synoptic_files():
-                num_of_instances += len(list(self.node_text_filter(pv_name, "address", path, xml)))
+        for element_name, files in (
+            ("read_pv", self._file_access.get_config_files(BLOCK_FILE, read_only=True)),
+            ("address", self._file_access.get_synoptic_files(read_only=True)),
+        ):
+            for path, xml in files:
+                for pv_name in self._pv_names_possibly_in(pv_names, xml):
+                    num_of_instances += len(
+                        list(self.node_text_filter(pv_name, element_name, path, xml))
+                    )
 
         return num_of_instances
+
+    @staticmethod
+    def _pv_names_possibly_in(pv_names: list[str], xml: Document) -> list[str]:
+        """The pv names which may be in some xml, so that files which do not contain the pv names
+        are not parsed.
+
+        Args:
+            pv_names: the pv names to look for
+            xml: the xml, either a document or a document which has not been parsed yet
+
+        Returns:
+            the pv names which are in the contents of the file, or may be because they are written
+            as entities
+        """
+        if not isinstance(xml, LazyXmlDocument) or xml.parsed:
+            return list(pv_names)
+        contents = xml.raw_bytes()
+        if b"&#" in contents:
+            return list(pv_names)
+        return [
+            pv_name
+            for pv_name in pv_names
+            if any(character in pv_name for character in XML_ESCAPED_CHARACTERS)
+            or pv_name.encode("utf-8") in contents
+        ]
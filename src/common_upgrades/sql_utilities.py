@@ -3,19 +3,92 @@
 # ruff: noqa: ANN204, ANN205, E501, ANN001, ANN201
 import os
 import re
+import time
 from getpass import getpass
 
 import mysql.connector
 
+# Maximum number of statements, and characters, sent to the server in one go by run_sql_list
+SQL_BATCH_STATEMENTS = 100
+SQL_BATCH_CHARACTERS = 1024 * 1024
+
+# Minimum number of seconds between progress messages from run_sql_list
+SQL_PROGRESS_INTERVAL = 10
+
+# A connection unused for longer than this many seconds is checked before it is reused
+SQL_LIVENESS_CHECK_INTERVAL = 60
+
+
+def mysql_connection_factory(logger):
+    """Connect to the local MySQL server as root, only asking for the password if it is not known.
+
+    Args:
+        logger: the logger to use
+
+    Returns:
+        mysql connection
+    """
+    root_pass = (
+        SqlConnection._password
+        or os.getenv("MYSQL_PASSWORD")
+        or getpass("Please enter db root password: ")
+    )
+    connection = mysql.connector.connect(user="root", password=root_pass)
+    SqlConnection._password = root_pass
+    return connection
+
 
 class SqlConnection:
-    """Class to allow sql access. Should be used in the top scope and sessions are got using get_session."""
+    """Class to allow sql access. Should be used in the top scope and sessions are got using get_session.
 
+    Scopes may be nested; they share one physical connection which is closed when the outermost
+    scope is left.
+
+    Connections are made by connection_factory, a function taking the logger and returning an
+    object with the mysql connection interface. It defaults to mysql_connection_factory and can be
+    replaced, e.g. with a SqliteConnection to run schema steps without a MySQL server.
+    """
+
+    connection_factory = mysql_connection_factory
     _connection = None
+    _password = None
+    _scopes = 0
+    _last_used = 0.0
 
     def __init__(self):
         pass
 
+    @staticmethod
+    def _connect(logger):
+        """Connect to the database using the connection factory, retrying until it succeeds.
+
+        Args:
+            logger: the logger to use
+        """
+        while SqlConnection._connection is None:
+            try:
+                SqlConnection._connection = SqlConnection.connection_factory(logger)
+            except Exception as e:
+                SqlConnection._password = None
+                logger.error("Failed to connect to database: {}".format(e))
+
+    @staticmethod
+    def _check_alive(logger):
+        """Reconnect if the connection has dropped, e.g. timed out while a long step ran.
+
+        Args:
+            logger: the logger to use
+        """
+        try:
+            if SqlConnection._connection.is_connected():
+                return
+            logger.info("Database connection lost, reconnecting")
+            SqlConnection._connection.reconnect()
+        except Exception as e:
+            logger.error("Failed to reconnect to database: {}".format(e))
+            SqlConnection._connection = None
+            SqlConnection._connect(logger)
+
     @staticmethod
     def get_session(logger):
         """Get the database session; creates one if needed.
@@ -26,24 +99,26 @@ class SqlConnection:
         Returns:
             sql connection
         """
-        while SqlConnection._connection is None:
-            try:
-                root_pass = os.getenv("MYSQL_PASSWORD") or getpass(
-                    "Please enter db root password: "
-                )
-                SqlConnection._connection = mysql.connector.connect(user="root", password=root_pass)
-            except Exception as e:
-                logger.error("Failed to connect to database: {}".format(e))
+        now = time.monotonic()
+        if SqlConnection._connection is None:
+            SqlConnection._connect(logger)
+        elif now - SqlConnection._last_used > SQL_LIVENESS_CHECK_INTERVAL:
+            SqlConnection._check_alive(logger)
+        SqlConnection._last_used = now
         return SqlConnection._connection
 
     def __enter__(self):
+        SqlConnection._scopes += 1
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        # close connection if this class created it
-        if SqlConnection._connection is not None:
-            SqlConnection._connection.close()
-            SqlConnection._connection = None
+        SqlConnection._scopes = max(SqlConnection._scopes - 1, 0)
+        # close connection when the outermost scope is left
+        if SqlConnection._scopes == 0:
+            if SqlConnection._connection is not None:
+                SqlConnection._connection.close()
+                SqlConnection._connection = None
+            SqlConnection._password = None
 
 
 def run_sql(logger, sql):
@@ -61,49 +136,517 @@ def run_sql(logger, sql):
     cursor.close()
 
 
-def run_sql_list(logger, sql_list):
+def _sql_batches(sql_list, batch_statements, batch_characters):
+    """Groups compatible statements together so they can be sent to the server at once.
+
+    Consecutive plain statements are joined into multi statement packets, unless they contain a
+    semicolon themselves (e.g. a stored procedure body) in which case they are sent alone.
+    Consecutive parameterised statements with the same sql are grouped for executemany.
+
+    Args:
+        sql_list: iterable of statements, each either a string or a tuple of sql and parameters
+        batch_statements: maximum number of statements in a batch
+        batch_characters: maximum number of characters in a multi statement packet
+
+    Yields:
+        Tuple: the sql, the parameters for executemany (None for a multi statement packet) and the
+            number of statements in the batch
+    """
+    packet = []
+    packet_characters = 0
+    many_sql = None
+    many_params = []
+
+    for item in sql_list:
+        if isinstance(item, tuple):
+            sql, params = item
+            if packet:
+                yield ";\n".join(packet), None, len(packet)
+                packet, packet_characters = [], 0
+            if many_sql is not None and (sql != many_sql or len(many_params) >= batch_statements):
+                yield many_sql, many_params, len(many_params)
+                many_params = []
+            many_sql = sql
+            many_params.append(params)
+            continue
+
+        if many_sql is not None:
+            yield many_sql, many_params, len(many_params)
+            many_sql, many_params = None, []
+        if ";" in item:
+            if packet:
+                yield ";\n".join(packet), None, len(packet)
+                packet, packet_characters = [], 0
+            yield item, None, 1
+            continue
+        if packet and (
+            len(packet) >= batch_statements or packet_characters + len(item) > batch_characters
+        ):
+            yield ";\n".join(packet), None, len(packet)
+            packet, packet_characters = [], 0
+        packet.append(item)
+        packet_characters += len(item)
+
+    if packet:
+        yield ";\n".join(packet), None, len(packet)
+    if many_sql is not None:
+        yield many_sql, many_params, len(many_params)
+
+
+def run_sql_list(
+    logger,
+    sql_list,
+    commit_every=None,
+    batch_statements=SQL_BATCH_STATEMENTS,
+    batch_characters=SQL_BATCH_CHARACTERS,
+):
     """Sends a list of SQL statement to the database.
 
+    Statements are sent in batches (see _sql_batches) and all results are read back, so an error in
+    any statement is raised.
+
     Args:
         logger: the logger to use to log messages
-        sql_list: The statement to send
+        sql_list: The statements to send, each either a string or a tuple of sql and parameters.
+            May be any iterable, e.g. a generator streaming from a file.
+        commit_every: commit after at least this many statements; None to commit once at the end
+        batch_statements: maximum number of statements sent to the server at once
+        batch_characters: maximum number of characters in a multi statement packet
     """
-    cursor = SqlConnection.get_session(logger).cursor()
+    session = SqlConnection.get_session(logger)
+    cursor = session.cursor()
     assert cursor is not None
-    for sql in sql_list:
-        cursor.execute(sql, multi=True)
-        # for result in cursor.execute(sql, multi=True):
-        # pass
 
-    SqlConnection.get_session(logger).commit()
-    cursor.close()
+    start = time.monotonic()
+    last_progress = start
+    executed = 0
+    uncommitted = 0
+    try:
+        for sql, params, count in _sql_batches(sql_list, batch_statements, batch_characters):
+            if params is not None:
+                cursor.executemany(sql, params)
+            else:
+                # Read the result of every statement, so that an error in any of them is raised
+                cursor.execute(sql, map_results=True)
+                while True:
+                    if cursor.with_rows:
+                        cursor.fetchall()
+                    if not cursor.nextset():
+                        break
+
+            executed += count
+            uncommitted += count
+            if commit_every is not None and uncommitted >= commit_every:
+                session.commit()
+                uncommitted = 0
 
+            now = time.monotonic()
+            if now - last_progress >= SQL_PROGRESS_INTERVAL:
+                logger.info(
+                    "Executed {} statements ({:.0f} statements/s)".format(
+                        executed, executed / (now - start)
+                    )
+                )
+                last_progress = now
+
+        session.commit()
+    finally:
+        cursor.close()
+
+    elapsed = time.monotonic() - start
+    logger.info(
+        "Executed {} statements in {:.2f}s ({:.0f} statements/s)".format(
+            executed, elapsed, executed / elapsed if elapsed > 0 else 0
+        )
+    )
+
+
+# Characters which may change the state of the SQL script splitter
+_QUOTES = "'\"`"
+
+
+def _next_special(line, start, delimiter):
+    """Find the next position in a line where the SQL script splitter may need to change state.
+
+    Args:
+        line: the line to search
+        start: position to search from
+        delimiter: the current statement delimiter
+
+    Returns:
+        the position, or the length of the line if there is none
+    """
+    position = len(line)
+    for special in (delimiter[0], "'", '"', "`", "-", "#", "/"):
+        found = line.find(special, start, position)
+        if found != -1:
+            position = found
+    return position
+
+
+def split_sql_statements(lines):
+    """Generator giving the complete statements in an SQL script, one at a time.
+
+    Understands quoted strings and identifiers (so delimiters inside them are ignored), comments
+    (-- and # to end of line and /* */ blocks, except MySQL /*! */ executable comments which are
+    kept) and the mysql client DELIMITER command. Only the current statement is held in
+    memory so arbitrarily large scripts can be streamed.
+
+    Args:
+        lines: iterable of the lines of the script, e.g. an open file
 
-def run_sql_file(logger, file):
+    Yields:
+        str: a statement without its trailing delimiter
+    """
+    delimiter = ";"
+    statement = []
+    quote = None  # The open quote character when inside a quoted string or identifier
+    in_comment = False  # Whether inside a /* */ comment which is being dropped
+
+    for line in lines:
+        if (
+            line.lstrip()[:10].upper().startswith("DELIMITER")
+            and quote is None
+            and not in_comment
+            and not "".join(statement).strip()
+        ):
+            words = line.split(None, 2)
+            if len(words) >= 2 and words[0].upper() == "DELIMITER":
+                delimiter = words[1]
+                statement = []
+                continue
+
+        position = 0
+        length = len(line)
+        while position < length:
+            if in_comment:
+                end = line.find("*/", position)
+                if end == -1:
+                    break
+                in_comment = False
+                position = end + 2
+            elif quote is not None:
+                end = line.find(quote, position)
+                escape = line.find("\\", position, length if end == -1 else end)
+                if quote != "`" and escape != -1:
+                    statement.append(line[position : escape + 2])
+                    position = escape + 2
+                elif end == -1:
+                    statement.append(line[position:])
+                    break
+                elif line.startswith(quote * 2, end):
+                    statement.append(line[position : end + 2])
+                    position = end + 2
+                else:
+                    statement.append(line[position : end + 1])
+                    position = end + 1
+                    quote = None
+            else:
+                special = _next_special(line, position, delimiter)
+                statement.append(line[position:special])
+                position = special
+                if position >= length:
+                    break
+                if line.startswith(delimiter, position):
+                    text = "".join(statement).strip()
+                    if text:
+                        yield text
+                    statement = []
+                    position += len(delimiter)
+                elif line[position] in _QUOTES:
+                    quote = line[position]
+                    statement.append(quote)
+                    position += 1
+                elif line[position] == "#" or (
+                    line.startswith("--", position)
+                    and (
+                        line[position + 2 : position + 3] in " \t\r\n"
+                        or not line[:position].strip()
+                    )
+                ):
+                    statement.append("\n")
+                    break
+                elif line.startswith("/*", position) and not line.startswith("/*!", position):
+                    in_comment = True
+                    position += 2
+                else:
+                    statement.append(line[position])
+                    position += 1
+
+    text = "".join(statement).strip()
+    if text:
+        yield text
+
+
+# An identifier, optionally quoted with backticks
+_IDENTIFIER = r"(?:`[^`]+`|[\w$]+)"
+# An optionally schema qualified name, captured as schema and name
+_QUALIFIED_NAME = r"(?:({i})\s*\.\s*)?({i})".format(i=_IDENTIFIER)
+
+_USE_REGEX = re.compile(r"USE\s+({})\s*$".format(_IDENTIFIER), re.IGNORECASE)
+_CREATE_SCHEMA_REGEX = re.compile(
+    r"CREATE\s+(?:DATABASE|SCHEMA)\s+(?:IF\s+NOT\s+EXISTS\s+)?({})".format(_IDENTIFIER),
+    re.IGNORECASE,
+)
+_CREATE_TABLE_REGEX = re.compile(
+    r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?{}".format(_QUALIFIED_NAME), re.IGNORECASE
+)
+_CREATE_INDEX_REGEX = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+|FULLTEXT\s+|SPATIAL\s+)?INDEX\s+({})\s+(?:USING\s+\w+\s+)?ON\s+{}".format(
+        _IDENTIFIER, _QUALIFIED_NAME
+    ),
+    re.IGNORECASE,
+)
+_ALTER_TABLE_REGEX = re.compile(
+    r"ALTER\s+TABLE\s+{}\s+(.*)$".format(_QUALIFIED_NAME), re.IGNORECASE | re.DOTALL
+)
+_ADD_INDEX_REGEX = re.compile(
+    r"ADD\s+(?:UNIQUE\s+(?:INDEX\s+|KEY\s+)?|FULLTEXT\s+(?:INDEX\s+|KEY\s+)?|SPATIAL\s+(?:INDEX\s+|KEY\s+)?|INDEX\s+|KEY\s+)({})".format(
+        _IDENTIFIER
+    ),
+    re.IGNORECASE,
+)
+_ADD_CONSTRAINT_REGEX = re.compile(r"ADD\s+CONSTRAINT\s+({})".format(_IDENTIFIER), re.IGNORECASE)
+_ADD_COLUMN_REGEX = re.compile(r"ADD\s+(?:COLUMN\s+)?({})".format(_IDENTIFIER), re.IGNORECASE)
+_DROP_SCHEMA_REGEX = re.compile(
+    r"DROP\s+(?:DATABASE|SCHEMA)\s+(?:IF\s+EXISTS\s+)?({})".format(_IDENTIFIER), re.IGNORECASE
+)
+_DROP_TABLE_REGEX = re.compile(
+    r"DROP\s+(?:TEMPORARY\s+)?TABLES?\s+(?:IF\s+EXISTS\s+)?(.*)$", re.IGNORECASE | re.DOTALL
+)
+_QUALIFIED_NAME_REGEX = re.compile(_QUALIFIED_NAME)
+
+# Schemas belonging to the server itself, which are never introspected
+_SYSTEM_SCHEMAS = ("mysql", "information_schema", "performance_schema", "sys")
+
+
+def _unquote(identifier):
+    """Normalise an identifier for comparison, removing backticks and ignoring case.
+
+    Args:
+        identifier: the identifier, possibly quoted
+
+    Returns:
+        the bare identifier in lower case
+    """
+    return identifier.strip("`").lower()
+
+
+def _split_clauses(sql):
+    """Split the clauses of an ALTER TABLE statement on the commas between them.
+
+    Args:
+        sql: the clauses of the statement
+
+    Returns:
+        list of the clauses
+    """
+    clauses = []
+    depth = 0
+    quote = None
+    start = 0
+    for position, character in enumerate(sql):
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character in _QUOTES:
+            quote = character
+        elif character == "(":
+            depth += 1
+        elif character == ")":
+            depth -= 1
+        elif character == "," and depth == 0:
+            clauses.append(sql[start:position].strip())
+            start = position + 1
+    clauses.append(sql[start:].strip())
+    return clauses
+
+
+class _ExistingSchema:
+    """The schemas, tables, columns, indexes and constraints already in the database.
+
+    Introspected from information_schema once, then kept up to date with the statements sent.
+    """
+
+    def __init__(self, logger):
+        """Load the existing objects from information_schema.
+
+        Args:
+            logger: the logger to use
+        """
+        self.current_schema = None
+        self.schemas = set()
+        self.tables = set()
+        self.columns = set()
+        self.indexes = set()
+
+        not_system = "NOT IN ({})".format(", ".join("'{}'".format(s) for s in _SYSTEM_SCHEMAS))
+        cursor = SqlConnection.get_session(logger).cursor()
+        try:
+            cursor.execute(
+                "SELECT SCHEMA_NAME FROM information_schema.SCHEMATA WHERE SCHEMA_NAME "
+                + not_system
+            )
+            self.schemas = {row[0].lower() for row in cursor.fetchall()}
+            cursor.execute(
+                "SELECT TABLE_SCHEMA, TABLE_NAME FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA " + not_system
+            )
+            self.tables = {(row[0].lower(), row[1].lower()) for row in cursor.fetchall()}
+            cursor.execute(
+                "SELECT TABLE_SCHEMA, TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA " + not_system
+            )
+            self.columns = {tuple(v.lower() for v in row) for row in cursor.fetchall()}
+            cursor.execute(
+                "SELECT TABLE_SCHEMA, TABLE_NAME, INDEX_NAME FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA "
+                + not_system
+                + " UNION SELECT TABLE_SCHEMA, TABLE_NAME, CONSTRAINT_NAME "
+                "FROM information_schema.TABLE_CONSTRAINTS WHERE TABLE_SCHEMA " + not_system
+            )
+            self.indexes = {tuple(v.lower() for v in row) for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+        logger.info(
+            "Database has {} schemas, {} tables, {} columns and {} indexes".format(
+                len(self.schemas), len(self.tables), len(self.columns), len(self.indexes)
+            )
+        )
+
+    def _table(self, schema, name):
+        """The schema and name of a table, using the current schema if it is not qualified.
+
+        Returns:
+            Tuple: the schema (None if not known) and name of the table
+        """
+        schema = _unquote(schema) if schema else self.current_schema
+        return schema, _unquote(name)
+
+    def _clause_exists(self, schema, table, clause):
+        """Whether the object added by an ALTER TABLE clause already exists.
+
+        Returns:
+            True if the clause adds an index, constraint or column which is already present
+        """
+        for regex, objects in (
+            (_ADD_INDEX_REGEX, self.indexes),
+            (_ADD_CONSTRAINT_REGEX, self.indexes),
+            (_ADD_COLUMN_REGEX, self.columns),
+        ):
+            match = regex.match(clause)
+            if match is not None:
+                return (schema, table, _unquote(match.group(1))) in objects
+        return False
+
+    def is_present(self, statement):
+        """Whether a statement only creates objects which are already present.
+
+        Args:
+            statement: the statement
+
+        Returns:
+            True if the statement can be skipped
+        """
+        match = _CREATE_SCHEMA_REGEX.match(statement)
+        if match is not None:
+            return _unquote(match.group(1)) in self.schemas
+
+        match = _CREATE_TABLE_REGEX.match(statement)
+        if match is not None:
+            return self._table(match.group(1), match.group(2)) in self.tables
+
+        match = _CREATE_INDEX_REGEX.match(statement)
+        if match is not None:
+            schema, table = self._table(match.group(2), match.group(3))
+            return (schema, table, _unquote(match.group(1))) in self.indexes
+
+        match = _ALTER_TABLE_REGEX.match(statement)
+        if match is not None:
+            schema, table = self._table(match.group(1), match.group(2))
+            return all(
+                self._clause_exists(schema, table, clause)
+                for clause in _split_clauses(match.group(3))
+            )
+        return False
+
+    def apply(self, statement):
+        """Update the known objects with the effect of a statement which is being sent.
+
+        Args:
+            statement: the statement
+        """
+        match = _USE_REGEX.match(statement)
+        if match is not None:
+            self.current_schema = _unquote(match.group(1))
+            return
+
+        match = _CREATE_SCHEMA_REGEX.match(statement)
+        if match is not None:
+            self.schemas.add(_unquote(match.group(1)))
+            return
+
+        match = _CREATE_TABLE_REGEX.match(statement)
+        if match is not None:
+            self.tables.add(self._table(match.group(1), match.group(2)))
+            return
+
+        match = _DROP_SCHEMA_REGEX.match(statement)
+        if match is not None:
+            schema = _unquote(match.group(1))
+            self.schemas.discard(schema)
+            self.tables = {t for t in self.tables if t[0] != schema}
+            self.columns = {c for c in self.columns if c[0] != schema}
+            self.indexes = {i for i in self.indexes if i[0] != schema}
+            return
+
+        match = _DROP_TABLE_REGEX.match(statement)
+        if match is not None:
+            for name in _QUALIFIED_NAME_REGEX.finditer(match.group(1)):
+                table = self._table(name.group(1), name.group(2))
+                self.tables.discard(table)
+                self.columns = {c for c in self.columns if c[:2] != table}
+                self.indexes = {i for i in self.indexes if i[:2] != table}
+
+    def missing(self, statements, logger):
+        """Generator filtering out statements which only create objects that are already present.
+
+        Args:
+            statements: iterable of statements
+            logger: the logger to use
+
+        Yields:
+            str: the statements which need to be sent
+        """
+        skipped = 0
+        for statement in statements:
+            if self.is_present(statement):
+                skipped += 1
+                continue
+            self.apply(statement)
+            yield statement
+        logger.info("Skipped {} statements creating objects which already exist".format(skipped))
+
+
+def run_sql_file(logger, file, skip_existing=False):
     """Sends an SQL statement to the database.
 
     Args:
         logger: the logger to use to log messages
         file: The file of sql statement to send
+        skip_existing: if True only send the statements which create a schema, table, column or
+            index that is not already in the database, so the file can be applied again
     """
     if not os.path.exists(file):
         logger.error(f"Failed to open {file}")
         return -1
-    statement_list = []
-    lines = []
-    with open(file) as f:
-        lines = f.readlines()
-    statement = ""
-    for line in lines:
-        if re.match(r"--", line) or re.match(r"#", line):
-            continue
-        statement = statement + line
-        if re.search(r";[ ]*$", line):
-            statement_list.append(statement)
-            statement = ""
 
     logger.info(f"Applying DB schema from {file}")
-    run_sql_list(logger, statement_list)
+    with open(file) as f:
+        statements = split_sql_statements(f)
+        if skip_existing:
+            statements = _ExistingSchema(logger).missing(statements, logger)
+        run_sql_list(logger, statements)
     return 0
 
 
@@ -0,0 +1,585 @@
+"""SQLite stand in for the MySQL server used by the sql utilities"""
+
+# ruff: noqa: ANN204, ANN205, E501, ANN001, ANN201, ANN002, ANN003
+import glob
+import re
+import sqlite3
+
+from src.common_upgrades.sql_utilities import (
+    _IDENTIFIER,
+    _QUALIFIED_NAME,
+    _split_clauses,
+    _unquote,
+    split_sql_statements,
+)
+
+# Statements with no SQLite equivalent which do not change the schema or data, they are recorded
+# but not run
+_IGNORED_REGEX = re.compile(r"(?:/\*!|GRANT\b)", re.IGNORECASE)
+
+_USE_REGEX = re.compile(r"USE\s+({})\s*$".format(_IDENTIFIER), re.IGNORECASE)
+_CREATE_SCHEMA_REGEX = re.compile(
+    r"CREATE\s+(?:DATABASE|SCHEMA)\s+(IF\s+NOT\s+EXISTS\s+)?({})".format(_IDENTIFIER),
+    re.IGNORECASE,
+)
+_CREATE_TABLE_REGEX = re.compile(
+    r"CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?{}\s*\((.*)\)".format(_QUALIFIED_NAME),
+    re.IGNORECASE | re.DOTALL,
+)
+_CREATE_INDEX_REGEX = re.compile(
+    r"CREATE\s+(UNIQUE\s+)?INDEX\s+({i})\s+ON\s+{q}\s*(\(.*\))".format(
+        i=_IDENTIFIER, q=_QUALIFIED_NAME
+    ),
+    re.IGNORECASE | re.DOTALL,
+)
+_ALTER_TABLE_REGEX = re.compile(
+    r"ALTER\s+TABLE\s+{}\s+(.*)".format(_QUALIFIED_NAME), re.IGNORECASE | re.DOTALL
+)
+_INSERT_IGNORE_REGEX = re.compile(r"INSERT\s+IGNORE\b", re.IGNORECASE)
+
+# Index definitions inside a CREATE TABLE or after ALTER TABLE ... ADD
+_INDEX_CLAUSE_REGEX = re.compile(
+    r"(UNIQUE)?\s*(?:KEY|INDEX)?\s*({})?\s*(\(.*\))".format(_IDENTIFIER),
+    re.IGNORECASE | re.DOTALL,
+)
+_INDEX_CLAUSE_START_REGEX = re.compile(r"(?:UNIQUE|KEY|INDEX)\b", re.IGNORECASE)
+_CONSTRAINT_CLAUSE_REGEX = re.compile(
+    r"(?:CONSTRAINT(?:\s+({}))?\s+)?(PRIMARY\s+KEY|UNIQUE|FOREIGN\s+KEY)\b(.*)".format(_IDENTIFIER),
+    re.IGNORECASE | re.DOTALL,
+)
+_ADD_REGEX = re.compile(r"ADD\s+(?:COLUMN\s+)?(.*)", re.IGNORECASE | re.DOTALL)
+
+# MySQL column attributes SQLite does not understand
+_COLUMN_ATTRIBUTE_REGEXES = (
+    (re.compile(r"\benum\s*\((?:[^()']|'[^']*')*\)", re.IGNORECASE), "TEXT"),
+    (re.compile(r"\bCOMMENT\s+'(?:[^'\\]|\\.|'')*'", re.IGNORECASE), ""),
+    (re.compile(r"\b(?:CHARACTER\s+SET|CHARSET|COLLATE)\s*=?\s*\w+", re.IGNORECASE), ""),
+    (re.compile(r"\bON\s+UPDATE\s+CURRENT_TIMESTAMP(?:\s*\(\d*\))?", re.IGNORECASE), ""),
+    (re.compile(r"\bCURRENT_TIMESTAMP\s*\(\d*\)", re.IGNORECASE), "CURRENT_TIMESTAMP"),
+    (re.compile(r"\b(?:AUTO_INCREMENT|UNSIGNED)\b", re.IGNORECASE), ""),
+)
+
+_AUTO_INCREMENT_REGEX = re.compile(r"\bAUTO_INCREMENT\b", re.IGNORECASE)
+_AUTO_INCREMENT_COLUMN = "{} INTEGER PRIMARY KEY AUTOINCREMENT"
+_PRIMARY_KEY_REGEX = re.compile(r"PRIMARY\s+KEY\b", re.IGNORECASE)
+
+# Prefix length of an indexed column e.g. name(20)
+_KEY_PART_LENGTH_REGEX = re.compile(r"({})\s*\(\d+\)".format(_IDENTIFIER))
+
+# User tables in an SQLite schema
+_TABLES_QUERY = (
+    "SELECT name FROM {}.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+)
+
+# Tables which emulate the parts of information_schema used by the upgrade
+_INFORMATION_SCHEMA_TABLES = (
+    "CREATE TABLE information_schema.SCHEMATA (SCHEMA_NAME TEXT)",
+    "CREATE TABLE information_schema.TABLES (TABLE_SCHEMA TEXT, TABLE_NAME TEXT)",
+    (
+        "CREATE TABLE information_schema.COLUMNS (TABLE_SCHEMA TEXT, TABLE_NAME TEXT, "
+        "COLUMN_NAME TEXT, ORDINAL_POSITION INTEGER, COLUMN_TYPE TEXT)"
+    ),
+    "CREATE TABLE information_schema.STATISTICS (TABLE_SCHEMA TEXT, TABLE_NAME TEXT, INDEX_NAME TEXT)",
+    (
+        "CREATE TABLE information_schema.TABLE_CONSTRAINTS (TABLE_SCHEMA TEXT, TABLE_NAME TEXT, "
+        "CONSTRAINT_NAME TEXT)"
+    ),
+)
+
+
+def _quote(identifier):
+    """Quote an identifier for SQLite.
+
+    Args:
+        identifier: the unquoted identifier
+
+    Returns:
+        str: the quoted identifier
+    """
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+class SqliteDatabase:
+    """An SQLite database which stands in for the MySQL server, e.g. to run and time schema steps
+    on a machine without MySQL.
+
+    Each MySQL schema is an attached SQLite database. The MySQL dialect used by the schema files is
+    translated to SQLite: column attributes SQLite does not have are dropped, indexes become
+    CREATE INDEX statements, constraints are recorded by name and version comments and grants
+    are ignored. Only the statements the schema steps use are translated. The parts of information_schema used by the upgrade are
+    emulated, so run_sql_file(..., skip_existing=True) behaves as it would against MySQL.
+
+    Unqualified table names resolve to the first attached schema with a table of that name, which
+    is the current schema for the single schema files the upgrade applies.
+
+    Use connect as the SqlConnection connection factory:
+        SqlConnection.connection_factory = SqliteDatabase().connect
+    """
+
+    def __init__(self, database=":memory:"):
+        """Open the database.
+
+        Args:
+            database: file the database is stored in, schemas are stored in files alongside it
+                named <database>-<schema>. By default the database is held in memory.
+        """
+        self.database = database
+        self.statements = []
+        self.ignored = []
+        self._index_names = {}
+        self._constraints = set()
+        self._connection = sqlite3.connect(database)
+        self._connection.execute("ATTACH DATABASE ':memory:' AS information_schema")
+        for create_table in _INFORMATION_SCHEMA_TABLES:
+            self._connection.execute(create_table)
+        if database != ":memory:":
+            for schema_file in sorted(glob.glob(glob.escape(database) + "-*")):
+                self._attach(schema_file[len(database) + 1 :])
+        self._load_index_names()
+
+    def connect(self, logger=None):
+        """Create a connection to the database, suitable for use as a connection factory.
+
+        Args:
+            logger: the logger to use, unused
+
+        Returns:
+            SqliteConnection: new connection
+        """
+        return SqliteConnection(self)
+
+    def close(self):
+        """Close the database."""
+        self._connection.close()
+
+    def schemas(self):
+        """The names of the schemas in the database.
+
+        Returns:
+            List[str]: schema names
+        """
+        return [
+            row[1]
+            for row in self._connection.execute("PRAGMA database_list")
+            if row[1] not in ("main", "temp", "information_schema")
+        ]
+
+    def _attach(self, schema):
+        """Attach the SQLite database holding a schema.
+
+        Args:
+            schema: name of the schema
+        """
+        location = ":memory:" if self.database == ":memory:" else self.database + "-" + schema
+        self._connection.commit()
+        self._connection.execute("ATTACH DATABASE ? AS {}".format(_quote(schema)), (location,))
+
+    def _load_index_names(self):
+        """Map the names of the indexes in the attached schemas back to their MySQL names."""
+        for schema in self.schemas():
+            for name, table in self._connection.execute(
+                "SELECT name, tbl_name FROM {}.sqlite_master WHERE type = 'index' "
+                "AND sql IS NOT NULL".format(_quote(schema))
+            ):
+                mysql_name = name[len(table) + 2 :] if name.startswith(table + "__") else name
+                self._index_names[(schema, name)] = (table, mysql_name)
+
+    def _table_schema(self, schema, table, current_schema):
+        """Find the schema a table is in.
+
+        Args:
+            schema: the quoted schema the table name was qualified with, if any
+            table: the unquoted table name
+            current_schema: schema selected with USE, if any
+
+        Returns:
+            str: the schema name, None for the main database
+        """
+        if schema:
+            return _unquote(schema)
+        if current_schema is not None:
+            return current_schema
+        for candidate in self.schemas():
+            if (table,) in self._connection.execute(_TABLES_QUERY.format(_quote(candidate))):
+                return candidate
+        return None
+
+    def _qualified(self, schema, name):
+        """Qualify a name with its schema for SQLite.
+
+        Returns:
+            str: the qualified name
+        """
+        return _quote(name) if schema is None else "{}.{}".format(_quote(schema), _quote(name))
+
+    def _refresh_information_schema(self):
+        """Rebuild the emulated information_schema tables from the SQLite catalogue."""
+        execute = self._connection.execute
+        for table in ("SCHEMATA", "TABLES", "COLUMNS", "STATISTICS", "TABLE_CONSTRAINTS"):
+            execute("DELETE FROM information_schema.{}".format(table))
+        for schema in self.schemas():
+            execute("INSERT INTO information_schema.SCHEMATA VALUES (?)", (schema,))
+            tables = [row[0] for row in execute(_TABLES_QUERY.format(_quote(schema)))]
+            for table in tables:
+                execute("INSERT INTO information_schema.TABLES VALUES (?, ?)", (schema, table))
+                columns = list(
+                    execute("PRAGMA {}.table_info({})".format(_quote(schema), _quote(table)))
+                )
+                execute_many = self._connection.executemany
+                execute_many(
+                    "INSERT INTO information_schema.COLUMNS VALUES (?, ?, ?, ?, ?)",
+                    [(schema, table, c[1], c[0] + 1, c[2]) for c in columns],
+                )
+                if any(c[5] for c in columns):
+                    execute(
+                        "INSERT INTO information_schema.STATISTICS VALUES (?, ?, 'PRIMARY')",
+                        (schema, table),
+                    )
+        self._connection.executemany(
+            "INSERT INTO information_schema.STATISTICS VALUES (?, ?, ?)",
+            [(schema, table, name) for (schema, _), (table, name) in self._index_names.items()],
+        )
+        self._connection.executemany(
+            "INSERT INTO information_schema.TABLE_CONSTRAINTS VALUES (?, ?, ?)",
+            sorted(self._constraints),
+        )
+
+    def _index(self, schema, table, name, unique, key_parts):
+        """Translate an index definition into a CREATE INDEX statement.
+
+        SQLite index names are unique within a schema rather than a table, so they are prefixed
+        with the table name.
+
+        Args:
+            schema: schema of the table
+            table: name of the table
+            name: MySQL name of the index, None to name it after the first column
+            unique: whether it is a unique index
+            key_parts: the bracketed, comma separated list of indexed columns
+
+        Returns:
+            str: the statement
+        """
+        key_parts = _KEY_PART_LENGTH_REGEX.sub(r"\1", key_parts)
+        if name is None:
+            name = _unquote(_split_clauses(key_parts.strip()[1:-1])[0].split()[0])
+        sqlite_name = "{}__{}".format(table, name)
+        self._index_names[(schema, sqlite_name)] = (table, name)
+        return "CREATE {}INDEX IF NOT EXISTS {} ON {} {}".format(
+            "UNIQUE " if unique else "",
+            self._qualified(schema, sqlite_name),
+            _quote(table),
+            key_parts,
+        )
+
+    def _column(self, definition):
+        """Translate a MySQL column definition to SQLite.
+
+        Returns:
+            str: the definition
+        """
+        for regex, replacement in _COLUMN_ATTRIBUTE_REGEXES:
+            definition = regex.sub(replacement, definition)
+        return " ".join(definition.split())
+
+    def _table_clause(self, schema, table, clause, indexes):
+        """Translate a clause of a CREATE TABLE or ALTER TABLE ... ADD statement.
+
+        Args:
+            schema: schema of the table
+            table: name of the table
+            clause: the clause
+            indexes: list to add the CREATE INDEX statements for index clauses to
+
+        Returns:
+            str: the clause to keep in the table definition, None if there is none
+        """
+        match = _CONSTRAINT_CLAUSE_REGEX.match(clause)
+        if match is not None:
+            name, kind, rest = match.groups()
+            if name is not None:
+                self._constraints.add((schema, table, _unquote(name)))
+            kind = kind.upper()
+            if kind.startswith("PRIMARY"):
+                return "PRIMARY KEY " + _KEY_PART_LENGTH_REGEX.sub(r"\1", rest.strip())
+            if kind == "UNIQUE":
+                index = _INDEX_CLAUSE_REGEX.match(rest.strip())
+                key_name = index.group(2) if index.group(2) else name
+                indexes.append(
+                    self._index(
+                        schema,
+                        table,
+                        _unquote(key_name) if key_name else None,
+                        True,
+                        index.group(3),
+                    )
+                )
+            return None
+
+        if _INDEX_CLAUSE_START_REGEX.match(clause):
+            index = _INDEX_CLAUSE_REGEX.match(clause)
+            kind = (index.group(1) or "").upper()
+            name = _unquote(index.group(2)) if index.group(2) else None
+            indexes.append(self._index(schema, table, name, kind == "UNIQUE", index.group(3)))
+            return None
+
+        return self._column(clause)
+
+    def _auto_increment(self, column, clauses):
+        """Make an AUTO_INCREMENT column the INTEGER PRIMARY KEY of the table, the only kind of
+        column SQLite gives the next id.
+
+        Args:
+            column: name of the AUTO_INCREMENT column
+            clauses: the translated clauses of the table definition
+
+        Returns:
+            List[str]: the clauses, with the primary key on the column alone removed
+        """
+        result = []
+        for clause in clauses:
+            if clause is None:
+                continue
+            primary_key = _PRIMARY_KEY_REGEX.match(clause)
+            if primary_key is not None:
+                key_parts = _split_clauses(clause[primary_key.end() :].strip()[1:-1])
+                if [_unquote(part) for part in key_parts] == [column]:
+                    continue
+            elif _unquote(clause.split()[0]) == column:
+                clause = _AUTO_INCREMENT_COLUMN.format(_quote(column))
+            result.append(clause)
+        return result
+
+    def translate(self, statement, current_schema):
+        """Translate a MySQL statement to SQLite.
+
+        Args:
+            statement: the statement
+            current_schema: schema selected with USE, if any
+
+        Returns:
+            List[str]: the SQLite statements to run, empty if the statement is ignored
+        """
+        if _IGNORED_REGEX.match(statement):
+            return []
+
+        match = _CREATE_SCHEMA_REGEX.match(statement)
+        if match is not None:
+            schema = _unquote(match.group(2))
+            if schema in self.schemas():
+                if match.group(1):
+                    return []
+                raise sqlite3.OperationalError("database {} already exists".format(schema))
+            self._attach(schema)
+            return []
+
+        match = _CREATE_TABLE_REGEX.match(statement)
+        if match is not None:
+            if_not_exists, schema, table, body = match.groups()
+            table = _unquote(table)
+            schema = _unquote(schema) if schema else current_schema
+            indexes = []
+            clauses = [
+                self._table_clause(schema, table, clause, indexes)
+                for clause in _split_clauses(body)
+            ]
+            auto_increment = [c for c in _split_clauses(body) if _AUTO_INCREMENT_REGEX.search(c)]
+            if auto_increment:
+                clauses = self._auto_increment(_unquote(auto_increment[0].split()[0]), clauses)
+            create_table = "CREATE TABLE {}{} ({})".format(
+                if_not_exists or "",
+                self._qualified(schema, table),
+                ", ".join(clause for clause in clauses if clause is not None),
+            )
+            return [create_table] + indexes
+
+        match = _CREATE_INDEX_REGEX.match(statement)
+        if match is not None:
+            kind, name, schema, table, key_parts = match.groups()
+            table = _unquote(table)
+            schema = self._table_schema(schema, table, current_schema)
+            return [self._index(schema, table, _unquote(name), kind is not None, key_parts)]
+
+        match = _ALTER_TABLE_REGEX.match(statement)
+        if match is not None:
+            schema, table, clauses = match.groups()
+            table = _unquote(table)
+            schema = self._table_schema(schema, table, current_schema)
+            alters = []
+            for clause in _split_clauses(clauses):
+                add = _ADD_REGEX.match(clause)
+                if add is None:
+                    self.ignored.append("ALTER TABLE {} {}".format(table, clause))
+                    continue
+                indexes = []
+                column = self._table_clause(schema, table, add.group(1), indexes)
+                if column is not None and not column.upper().startswith("PRIMARY KEY"):
+                    alters.append(
+                        "ALTER TABLE {} ADD COLUMN {}".format(
+                            self._qualified(schema, table), column
+                        )
+                    )
+                alters.extend(indexes)
+            return alters
+
+        return [_INSERT_IGNORE_REGEX.sub("INSERT OR IGNORE", statement)]
+
+
+class SqliteCursor:
+    """Cursor translating the MySQL statements it is sent to SQLite."""
+
+    def __init__(self, connection):
+        """Initialise.
+
+        Args:
+            connection: the SqliteConnection the cursor belongs to
+        """
+        self._connection = connection
+        self._rows = []
+        self._pending = []
+        self.with_rows = False
+
+    def _run(self, statement, params=None):
+        """Run one MySQL statement.
+
+        Args:
+            statement: the statement
+            params: parameters for %s placeholders in the statement
+
+        Returns:
+            Tuple[List[Tuple], bool]: rows of the statement and whether it returns rows
+        """
+        database = self._connection.database
+        database.statements.append(statement)
+
+        match = _USE_REGEX.match(statement)
+        if match is not None:
+            schema = _unquote(match.group(1))
+            if schema not in database.schemas():
+                raise sqlite3.OperationalError("unknown database {}".format(schema))
+            self._connection.current_schema = schema
+            return [], False
+
+        translated = database.translate(statement, self._connection.current_schema)
+        if not translated:
+            database.ignored.append(statement)
+        if "information_schema" in statement.lower():
+            database._refresh_information_schema()
+
+        rows, with_rows = [], False
+        for sql in translated:
+            if params is None:
+                cursor = database._connection.execute(sql)
+            else:
+                cursor = database._connection.execute(sql.replace("%s", "?"), params)
+            with_rows = cursor.description is not None
+            rows = cursor.fetchall()
+        return rows, with_rows
+
+    def execute(self, operation, params=None, map_results=False):
+        """Execute MySQL statements.
+
+        As with mysql.connector, only the first statement is run here when map_results is True;
+        each call to nextset runs the next one.
+
+        Args:
+            operation: the statement, or statements separated by ; if map_results is True
+            params: parameters for %s placeholders in the statement
+            map_results: whether the operation contains several statements
+        """
+        if map_results and params is None:
+            statements = list(split_sql_statements(operation.splitlines(keepends=True)))
+        else:
+            statements = [operation.strip().rstrip(";")]
+        self._pending = statements[1:]
+        if statements:
+            self._rows, self.with_rows = self._run(statements[0], params)
+        else:
+            self._rows, self.with_rows = [], False
+
+    def nextset(self):
+        """Run the next statement of the last execute.
+
+        Returns:
+            True if there was another statement, otherwise None
+        """
+        if not self._pending:
+            return None
+        self._rows, self.with_rows = self._run(self._pending.pop(0))
+        return True
+
+    def executemany(self, operation, seq_params):
+        """Execute a MySQL statement once for each set of parameters.
+
+        Args:
+            operation: the statement
+            seq_params: the parameters for each execution
+        """
+        for params in seq_params:
+            self._run(operation.strip().rstrip(";"), params)
+        self._rows, self.with_rows, self._pending = [], False, []
+
+    def fetchall(self):
+        """The rows returned by the last statement.
+
+        Returns:
+            List[Tuple]: rows
+        """
+        return self._rows
+
+    def close(self):
+        """Close the cursor."""
+        self._rows, self._pending = [], []
+
+
+class SqliteConnection:
+    """A connection to an SqliteDatabase with the interface of a mysql.connector connection.
+
+    Closing the connection leaves the database open so it can be reconnected to, as SqlConnection
+    does at the end of each scope. As with MySQL, work which has not been committed is lost.
+    """
+
+    def __init__(self, database):
+        """Initialise.
+
+        Args:
+            database: the SqliteDatabase to connect to
+        """
+        self.database = database
+        self.current_schema = None
+        self._connected = True
+
+    def cursor(self):
+        """Create a cursor.
+
+        Returns:
+            SqliteCursor: the cursor
+        """
+        return SqliteCursor(self)
+
+    def commit(self):
+        """Commit the current transaction."""
+        self.database._connection.commit()
+
+    def rollback(self):
+        """Roll back the current transaction."""
+        self.database._connection.rollback()
+
+    def is_connected(self):
+        """Whether the connection is open.
+
+        Returns:
+            True if it is open
+        """
+        return self._connected
+
+    def reconnect(self, *args, **kwargs):
+        """Reopen the connection, without a current schema as for a new MySQL session."""
+        self.current_schema = None
+        self._connected = True
+
+    def close(self):
+        """Close the connection, rolling back changes which have not been committed."""
+        if self._connected:
+            self.rollback()
+        self._connected = False
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import src
+from src.common_upgrades.utils.constants import STEP_CACHE_FOLDER
+from src.common_upgrades.utils.resources import RESOURCE_PATHS
+from src.file_access import FileAccess
+from src.local_logger import LocalLogger
+from src.upgrade_step import UpgradeStep
+
+# Version of the cache format, bump this if the format of an entry changes
+CACHE_FORMAT_VERSION = 1
+
+INDEX_FILENAME = "index.json"
+BLOBS_FOLDER = "blobs"
+
+# Maximum number of results kept in the cache, the least recently used are dropped when it is saved
+MAX_CACHE_ENTRIES = 100
+
+
+def _code_fingerprint() -> str:
+    """Hash of the source of the upgrade, so that results are not replayed once a step changes.
+
+    Returns:
+        Hex digest of the python files of the src package.
+    """
+    digest = hashlib.sha256()
+    src_folder = os.path.dirname(os.path.abspath(src.__file__))
+    for root, directories, files in os.walk(src_folder):
+        directories.sort()
+        for name in sorted(files):
+            if name.endswith(".py"):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, src_folder).encode())
+                with open(path, mode="rb") as f:
+                    digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+class StepResultCache(object):
+    """A persistent cache of the files written by upgrade steps.
+
+    Entries are keyed by the step, the instrument and a hash of the files of every resource the
+    step reads or writes. If the step is run again on the same files, for example when a restored
+    backup is upgraded again, the files it wrote are put back instead of performing the step.
+
+    Only steps which opt in with cacheable, and which declare their resources, all of which are
+    files in the configuration repository, are cached; anything else may depend on state the cache
+    can not see. At most max_entries results are kept, along with the files they wrote.
+    """
+
+    def __init__(
+        self,
+        logger: LocalLogger,
+        cache_folder: str = STEP_CACHE_FOLDER,
+        max_entries: int = MAX_CACHE_ENTRIES,
+    ) -> None:
+        """Initialise.
+
+        Args:
+            logger: Logger to use.
+            cache_folder: The folder the cache is loaded from and saved to.
+            max_entries: The maximum number of results to keep.
+        """
+        self._logger = logger
+        self._cache_folder = cache_folder
+        self._max_entries = max(max_entries, 1)
+        # Blobs written after this by other upgrades may belong to results they have not saved yet
+        self._loaded_at = time.time()
+        self._lock = threading.Lock()
+        self._code = None
+        self._entries = self._load()
+        self._changed = False
+
+    @property
+    def _index_filename(self) -> str:
+        return os.path.join(self._cache_folder, INDEX_FILENAME)
+
+    def _blob_filename(self, digest: str) -> str:
+        return os.path.join(self._cache_folder, BLOBS_FOLDER, digest[:2], digest)
+
+    def _load(self) -> dict[str, dict]:
+        """Load the cache index from file, starting a new one if it is missing or unreadable.
+
+        Returns:
+            Dictionary of key to cache entry.
+        """
+        try:
+            with open(self._index_filename) as index_file:
+                index = json.load(index_file)
+        except FileNotFoundError:
+            return {}
+        except (IOError, ValueError) as e:
+            self._logger.info(f"Ignoring unreadable step cache {self._index_filename}: {e}")
+            return {}
+
+        if not isinstance(index, dict) or index.get("version") != CACHE_FORMAT_VERSION:
+            self._logger.info(f"Ignoring out of date step cache {self._index_filename}")
+            return {}
+        return index.get("entries", {})
+
+    def save(self) -> None:
+        """Save the cache index to file if it has changed since it was loaded, dropping the least
+        recently used results beyond the maximum and the files which are no longer used."""
+        with self._lock:
+            if not self._changed:
+                return
+            for key in list(self._entries)[: -self._max_entries]:
+                del self._entries[key]
+            os.makedirs(self._cache_folder, exist_ok=True)
+            temporary_filename = f"{self._index_filename}.{os.getpid()}.tmp"
+            with open(temporary_filename, mode="w") as index_file:
+                json.dump({"version": CACHE_FORMAT_VERSION, "entries": self._entries}, index_file)
+            os.replace(temporary_filename, self._index_filename)
+            self._changed = False
+            self._remove_unused_blobs()
+
+    def _remove_unused_blobs(self) -> None:
+        """Remove the files of the cache which no result uses."""
+        used = {digest for entry in self._entries.values() for digest in entry["files"].values()}
+        for root, _, files in os.walk(os.path.join(self._cache_folder, BLOBS_FOLDER)):
+            for name in files:
+                blob_filename = os.path.join(root, name)
+                try:
+                    if name not in used and os.path.getmtime(blob_filename) < self._loaded_at:
+                        os.remove(blob_filename)
+                except OSError as e:
+                    self._logger.info(f"Unable to remove {blob_filename} from step cache: {e}")
+
+    @staticmethod
+    def _paths(file_access: FileAccess, resources: frozenset) -> list[str] | None:
+        """The paths, relative to the configuration directory, of the files of some resources.
+
+        Returns:
+            Sorted list of paths; None if a resource is not files in the configuration repository.
+        """
+        paths = set()
+        for resource in resources:
+            resource_paths = RESOURCE_PATHS.get(resource)
+            if not resource_paths:
+                return None
+            for resource_path in resource_paths:
+                if file_access.is_dir(resource_path):
+                    paths.update(
+                        file_access.get_file_paths(resource_path, excluded_directories=(".git",))
+                    )
+                elif file_access.exists(resource_path):
+                    paths.add(resource_path)
+        root = os.path.abspath(file_access.config_base)
+        return sorted(os.path.relpath(os.path.join(root, path), root) for path in paths)
+
+    @staticmethod
+    def _hash_files(file_access: FileAccess, paths: list[str]) -> dict[str, str]:
+        """Hash the contents of some files.
+
+        Returns:
+            Dictionary of path to hex digest of its contents.
+        """
+        return {path: hashlib.sha256(file_access.read_bytes(path)).hexdigest() for path in paths}
+
+    def key(self, version: str, upgrade_step: UpgradeStep, file_access: FileAccess) -> str | None:
+        """The key of the result of performing a step on the current files.
+
+        Args:
+            version: The version the step upgrades from.
+            upgrade_step: The step.
+            file_access: Object to allow for file access.
+
+        Returns:
+            The key; None if the result of the step can not be cached.
+        """
+        if getattr(upgrade_step, "cacheable", False) is not True:
+            return None
+        reads = getattr(upgrade_step, "reads", None)
+        writes = getattr(upgrade_step, "writes", None)
+        if not isinstance(reads, (set, frozenset)) or not isinstance(writes, (set, frozenset)):
+            return None
+        if len(writes) == 0:
+            return None
+        paths = self._paths(file_access, frozenset(reads) | frozenset(writes))
+        if paths is None:
+            return None
+
+        if self._code is None:
+            self._code = _code_fingerprint()
+        step_type = type(upgrade_step)
+        digest = hashlib.sha256()
+        for part in (
+            self._code,
+            version,
+            f"{step_type.__module__}.{step_type.__qualname__}",
+            file_access.instrument,
+        ):
+            digest.update(part.encode() + b"\0")
+        for path, file_hash in self._hash_files(file_access, paths).items():
+            digest.update(path.encode() + b"\0" + file_hash.encode() + b"\0")
+        return digest.hexdigest()
+
+    def replay(self, key: str, file_access: FileAccess) -> bool:
+        """Put back the files written by a step, if its result is in the cache.
+
+        Args:
+            key: The key of the result.
+            file_access: Object to allow for file access.
+
+        Returns:
+            True if the result was replayed; False if it is not in the cache.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # Most recently used results are kept the longest
+                self._entries[key] = entry
+                self._changed = True
+        if entry is None:
+            return False
+        if not all(
+            os.path.exists(self._blob_filename(digest)) for digest in entry["files"].values()
+        ):
+            self._logger.info("Step cache is missing files, performing the step")
+            return False
+
+        written = self._paths(file_access, frozenset(entry["writes"])) or []
+        current = self._hash_files(file_access, written)
+        changed = 0
+        removed = [path for path in written if path not in entry["files"]]
+        for path in removed:
+            file_access.remove_file(path)
+            changed += 1
+        self._remove_empty_folders(file_access, entry["writes"], removed)
+        for path, digest in entry["files"].items():
+            if current.get(path) == digest:
+                continue
+            with open(self._blob_filename(digest), mode="rb") as blob:
+                contents = blob.read()
+            file_access.create_directories(path)
+            file_access.write_file(path, contents, mode="wb", file_full=True)
+            changed += 1
+
+        if changed == 0:
+            self._logger.info("Inputs unchanged since the step was last performed, skipping it")
+        else:
+            self._logger.info(f"Inputs unchanged, replayed {changed} file(s) from the step cache")
+        return True
+
+    @staticmethod
+    def _remove_empty_folders(
+        file_access: FileAccess, writes: list[str], removed: list[str]
+    ) -> None:
+        """Remove the folders left empty by removing files, up to the folders of the resources.
+
+        Args:
+            file_access: Object to allow for file access.
+            writes: The resources the files were in.
+            removed: The paths of the files which were removed, relative to the configuration.
+        """
+        root = os.path.abspath(file_access.config_base)
+        resource_folders = {
+            os.path.abspath(os.path.join(root, path))
+            for resource in writes
+            for path in RESOURCE_PATHS.get(resource, [])
+        }
+        folders = {os.path.dirname(os.path.join(root, path)) for path in removed}
+        # Deepest first, so that a folder is only checked once the folders in it are removed
+        for folder in sorted(folders, key=len, reverse=True):
+            while (
+                folder not in resource_folders
+                and folder.startswith(root + os.sep)
+                and file_access.is_dir(folder)
+                and len(file_access.listdir(folder)) == 0
+            ):
+                file_access.delete_folder(folder)
+                folder = os.path.dirname(folder)
+
+    def record(self, key: str, upgrade_step: UpgradeStep, file_access: FileAccess) -> None:
+        """Record the files written by a step which has been performed.
+
+        Args:
+            key: The key of the result, from before the step was performed.
+            upgrade_step: The step.
+            file_access: Object to allow for file access.
+        """
+        writes = sorted(upgrade_step.writes)
+        paths = self._paths(file_access, frozenset(writes)) or []
+        files = {}
+        for path in paths:
+            contents = file_access.read_bytes(path)
+            digest = hashlib.sha256(contents).hexdigest()
+            blob_filename = self._blob_filename(digest)
+            if not os.path.exists(blob_filename):
+                os.makedirs(os.path.dirname(blob_filename), exist_ok=True)
+                temporary_filename = f"{blob_filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(temporary_filename, mode="wb") as blob:
+                    blob.write(contents)
+                os.replace(temporary_filename, blob_filename)
+            files[path] = digest
+
+        with self._lock:
+            self._entries[key] = {"writes": writes, "files": files}
+            self._changed = True
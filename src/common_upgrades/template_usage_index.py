@@ -0,0 +1,130 @@
+import json
+import os
+import re
+
+from src.common_upgrades.utils.constants import TEMPLATE_INDEX_FILENAME
+from src.file_access import FileAccess
+from src.local_logger import LocalLogger
+
+# Version of the index file format, bump this if the format of an entry changes
+INDEX_FORMAT_VERSION = 1
+
+SUBSTITUTIONS_EXTENSION = ".substitutions"
+
+# Directory names (glob patterns) which are not searched for substitutions files. Unlike
+# EXCLUDED_DIRECTORIES this keeps db, where installed support modules put their substitutions files.
+EXCLUDED_DIRECTORIES = (".git", "O.*", "bin")
+
+# Matches the name of a template file e.g. slits.template in "$(JAWS)/db/slits.template"
+TEMPLATE_REGEX = re.compile(r"[\w\-.]+\.template")
+
+
+class TemplateUsageIndex(object):
+    """A persistent index of the templates referenced by each substitutions file in a tree.
+
+    Entries are keyed by path and are only rescanned if the modification time or size of the
+    substitutions file has changed since the index was last saved.
+    """
+
+    def __init__(
+        self,
+        file_access: FileAccess,
+        logger: LocalLogger,
+        index_filename: str = TEMPLATE_INDEX_FILENAME,
+    ) -> None:
+        """Initialise.
+
+        Args:
+            file_access: Object to allow for file access.
+            logger: Logger to use.
+            index_filename: The file the index is loaded from and saved to.
+        """
+        self._file_access = file_access
+        self._logger = logger
+        self._index_filename = index_filename
+        self._entries = self._load()
+        self._changed = False
+
+    def _load(self) -> dict[str, dict]:
+        """Load the index from file, starting a new one if it is missing or unreadable.
+
+        Returns:
+            Dictionary of path to index entry.
+        """
+        try:
+            with open(self._index_filename) as index_file:
+                index = json.load(index_file)
+        except FileNotFoundError:
+            return {}
+        except (IOError, ValueError) as e:
+            self._logger.info(f"Ignoring unreadable template index {self._index_filename}: {e}")
+            return {}
+
+        if not isinstance(index, dict) or index.get("version") != INDEX_FORMAT_VERSION:
+            self._logger.info(f"Ignoring out of date template index {self._index_filename}")
+            return {}
+        return index.get("files", {})
+
+    def save(self) -> None:
+        """Save the index to file if it has changed since it was loaded."""
+        if not self._changed:
+            return
+        os.makedirs(os.path.dirname(self._index_filename), exist_ok=True)
+        # Written to a temporary file and renamed so that the index is never seen half written
+        temporary_filename = f"{self._index_filename}.{os.getpid()}.tmp"
+        with open(temporary_filename, mode="w") as index_file:
+            json.dump({"version": INDEX_FORMAT_VERSION, "files": self._entries}, index_file)
+        os.replace(temporary_filename, self._index_filename)
+        self._changed = False
+
+    def refresh(self, directory: str) -> None:
+        """Bring the index up to date with the substitutions files in a directory tree.
+
+        Args:
+            directory: The directory to search.
+        """
+        scanned = 0
+        seen = set()
+        for path in self._file_access.get_file_paths(
+            directory, SUBSTITUTIONS_EXTENSION, excluded_directories=EXCLUDED_DIRECTORIES
+        ):
+            seen.add(path)
+            mtime, size = self._file_access.get_file_signature(path)
+            entry = self._entries.get(path)
+            if entry is not None and entry["mtime"] == mtime and entry["size"] == size:
+                continue
+
+            scanned += 1
+            templates = set()
+            for line in self._file_access.open_file(path):
+                templates.update(TEMPLATE_REGEX.findall(line))
+            self._entries[path] = {"mtime": mtime, "size": size, "templates": sorted(templates)}
+            self._changed = True
+
+        prefix = os.path.join(directory, "")
+        removed = [p for p in self._entries if p.startswith(prefix) and p not in seen]
+        for path in removed:
+            del self._entries[path]
+        self._changed = self._changed or len(removed) > 0
+
+        self._logger.info(
+            f"Template index for {directory}: {len(seen)} substitutions files, "
+            f"{scanned} rescanned, {len(removed)} removed"
+        )
+
+    def files_using_template(self, template: str, directory: str | None = None) -> list[str]:
+        """Get the substitutions files which reference a template.
+
+        Args:
+            template: The file name of the template e.g. slits.template
+            directory: Optional directory tree to restrict the results to.
+
+        Returns:
+            Sorted list of paths to substitutions files referencing the template.
+        """
+        prefix = "" if directory is None else os.path.join(directory, "")
+        return sorted(
+            path
+            for path, entry in self._entries.items()
+            if path.startswith(prefix) and template in entry["templates"]
+        )
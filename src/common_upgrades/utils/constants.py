@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 EPICS_ROOT = os.environ["EPICS_ROOT"]
 SUPPORT_ROOT = os.path.abspath(os.path.join(EPICS_ROOT, "support"))
@@ -20,7 +21,17 @@ DEVICE_SCREEN_FILE = "screens.xml"
 GLOBALS_FILENAME = os.path.abspath(os.path.join(CONFIG_ROOT, "globals.txt"))
 DASHBOARD_DB_FILENAME = os.path.abspath(os.path.join(CONFIG_ROOT, "dashboard.db"))
 
+# Motor controller settings folders in the config area
+CONTROLLERS = ["galil", "galilmul", "mclennan", "linmot", "smc100_01", "twincat"]
+
 MOTION_SET_POINTS_FOLDER = os.path.abspath(os.path.join(CONFIG_ROOT, "motionSetPoints"))
 
+# Persistent caches which allow reruns of the upgrade to avoid repeating expensive scans
+UPGRADE_CACHE_FOLDER = os.path.abspath(
+    os.path.join(os.environ.get("ICPVARDIR", tempfile.gettempdir()), "tmp", "upgrade")
+)
+TEMPLATE_INDEX_FILENAME = os.path.join(UPGRADE_CACHE_FOLDER, "template_usage_index.json")
+STEP_CACHE_FOLDER = os.path.join(UPGRADE_CACHE_FOLDER, "step_results")
+
 # Matches an ioc name and its numbered IOCs e.g. GALIL matches GALIL_01, GALIL_02
 FILTER_REGEX = r"^{}(_[\d]{{2}})?$"
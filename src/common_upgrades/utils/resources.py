@@ -0,0 +1,48 @@
+import os
+
+from src.common_upgrades.utils.constants import (
+    COMPONENT_FOLDER,
+    CONFIG_FOLDER,
+    CONFIG_ROOT,
+    CONTROLLERS,
+    DASHBOARD_DB_FILENAME,
+    DEVICE_SCREENS_FOLDER,
+    GLOBALS_FILENAME,
+    SYNOPTIC_FOLDER,
+)
+
+# Resources which upgrade steps read and write. Steps which do not write a resource the other uses
+# can be run at the same time.
+
+# iocs.xml, blocks.xml etc. of the configurations and components
+CONFIG_XML = "config xml"
+SYNOPTICS = "synoptics"
+DEVICE_SCREENS = "device screens"
+GLOBALS = "globals"
+DASHBOARD_DB = "dashboard db"
+GITIGNORE = "gitignore"
+# motor controller settings folders e.g. galil
+CONTROLLER_SETTINGS = "controller settings"
+# the MySQL database
+DATABASE = "database"
+CALIBRATIONS_REPO = "calibrations repo"
+# the EPICS tree, including support
+EPICS_TREE = "epics tree"
+
+# Resources outside the config area, which are shared by every configuration on the machine
+SHARED_RESOURCES = frozenset({DATABASE, CALIBRATIONS_REPO, EPICS_TREE})
+
+# The paths in the config git repository of each resource, resources outside the repository have
+# no paths
+RESOURCE_PATHS = {
+    CONFIG_XML: [CONFIG_FOLDER, COMPONENT_FOLDER],
+    SYNOPTICS: [SYNOPTIC_FOLDER],
+    DEVICE_SCREENS: [DEVICE_SCREENS_FOLDER],
+    GLOBALS: [GLOBALS_FILENAME],
+    DASHBOARD_DB: [DASHBOARD_DB_FILENAME],
+    GITIGNORE: [os.path.abspath(os.path.join(CONFIG_ROOT, os.pardir, ".gitignore"))],
+    CONTROLLER_SETTINGS: [os.path.abspath(os.path.join(CONFIG_ROOT, c)) for c in CONTROLLERS],
+    DATABASE: [],
+    CALIBRATIONS_REPO: [],
+    EPICS_TREE: [],
+}
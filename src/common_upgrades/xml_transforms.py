@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+from xml.dom.minidom import Document
+
+from src.file_access import FileAccess
+
+# File type of transforms which apply to every synoptic rather than to a config file
+SYNOPTIC_FILES = "synoptics"
+
+
+@dataclass
+class XmlTransform:
+    file_type: str  # The config file the transform edits e.g. iocs.xml, or SYNOPTIC_FILES
+    edit: Callable[[str, Document], None]  # Edits the xml of one file in place given its path
+
+
+def _file_types(transforms: Iterable[XmlTransform]) -> list[str]:
+    """The file types edited by some transforms.
+
+    Args:
+        transforms: the transforms
+
+    Returns:
+        The file types in the order they are first edited.
+    """
+    return list(dict.fromkeys(transform.file_type for transform in transforms))
+
+
+def _xml_files(file_access: FileAccess, file_type: str) -> Iterator[tuple[str, Document]]:
+    """All the files of a type which transforms edit.
+
+    Args:
+        file_access: Object to allow for file access.
+        file_type: The type of file e.g. iocs.xml, or SYNOPTIC_FILES
+
+    Returns:
+        Iterator giving the path and xml of each file.
+    """
+    if file_type == SYNOPTIC_FILES:
+        return iter(file_access.get_synoptic_files())
+    return iter(file_access.get_config_files(file_type))
+
+
+def apply_xml_transforms(file_access: FileAccess, transforms: list[XmlTransform]) -> None:
+    """Apply transforms to the xml files, reading and writing each file once whatever the number of
+    transforms which edit it.
+
+    Args:
+        file_access: Object to allow for file access.
+        transforms: The transforms, applied to each file in order.
+    """
+    for file_type in _file_types(transforms):
+        edits = [transform.edit for transform in transforms if transform.file_type == file_type]
+        for path, xml in _xml_files(file_access, file_type):
+            for edit in edits:
+                edit(path, xml)
+            file_access.write_xml_file(path, xml)
+
+
+def fuse_xml_transforms(
+    file_access: FileAccess, transforms_of_steps: list[list[XmlTransform]]
+) -> tuple[list[dict[str, Document]], Exception | None]:
+    """Apply the transforms of consecutive upgrade steps in a single pass over the xml files.
+
+    Each file is read once and the transforms of every step are applied to it in order. The xml of
+    the file after each step which edits it is kept, so the files can be written and committed
+    version by version as if the steps had been performed one after another.
+
+    Args:
+        file_access: Object to allow for file access.
+        transforms_of_steps: The transforms of each step, in order.
+
+    Returns:
+        Tuple of the files written by each step which succeeded, as a dictionary of path to xml,
+        and the error which stopped the next step, or None if all of them succeeded.
+    """
+    failed_step = len(transforms_of_steps)
+    error = None
+    edits_of_steps = [
+        {
+            file_type: [t.edit for t in transforms if t.file_type == file_type]
+            for file_type in _file_types(transforms)
+        }
+        for transforms in transforms_of_steps
+    ]
+    written = [{} for _ in transforms_of_steps]
+
+    all_transforms = [transform for transforms in transforms_of_steps for transform in transforms]
+    for file_type in _file_types(all_transforms):
+        steps = [index for index, edits in enumerate(edits_of_steps) if file_type in edits]
+        files = _xml_files(file_access, file_type)
+        while steps[0] < failed_step:
+            try:
+                path, xml = next(files)
+            except StopIteration:
+                break
+            except Exception as e:
+                # The first step to edit the files would have failed reading them
+                failed_step, error = steps[0], e
+                break
+
+            for index in steps:
+                if index >= failed_step:
+                    break
+                try:
+                    for edit in edits_of_steps[index][file_type]:
+                        edit(path, xml)
+                except Exception as e:
+                    failed_step, error = index, e
+                    break
+                # the xml is edited in place so it is copied unless no later step edits it
+                last_step = index == steps[-1] or steps[steps.index(index) + 1] >= failed_step
+                written[index][path] = xml if last_step else xml.cloneNode(deep=True)
+
+    return written[:failed_step], error
@@ -1,9 +1,23 @@
 # ruff: noqa: ANN204, ANN205, E501, ANN001, ANN201, ANN202
+import io
+import itertools
+import locale
+import mmap
 import os
+import re
 import shutil
+import socket
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
 from xml.dom import minidom
 from xml.parsers.expat import ExpatError
 
+from src.atomic_bulk_writer import AtomicBulkWriter
 from src.common_upgrades.utils.constants import (
     COMPONENT_FOLDER,
     CONFIG_FOLDER,
@@ -13,20 +27,393 @@ from src.common_upgrades.utils.constants import (
     SYNOPTIC_FOLDER,
 )
 
+# Directory names (glob patterns, case sensitive) which are never searched by get_file_paths.
+# These are version control and EPICS build output directories.
+EXCLUDED_DIRECTORIES = (".git", "O.*", "bin", "db")
+
+# Maximum number of written xml documents CachingFileAccess keeps in memory before staging them to disk
+MAX_CACHED_DOCUMENTS = 200
+
+# Default number of threads used to walk the top level directories of a tree in parallel
+WALK_WORKERS = min(8, os.cpu_count() or 1)
+
+
+def _scan_directory(path, excluded_directories):
+    """Lists a directory using the file type information from scandir.
+
+    Args:
+        path: the directory to list
+        excluded_directories: glob patterns of directory names to leave out
+
+    Returns:
+        Tuple: sorted names of the files and sorted names of the directories to descend into
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+    except OSError:
+        # Match os.walk, which silently skips directories it can not list
+        return [], []
+
+    files = []
+    directories = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if not is_dir:
+            files.append(entry.name)
+        elif not entry.is_symlink() and not any(
+            fnmatchcase(entry.name, pattern) for pattern in excluded_directories
+        ):
+            directories.append(entry.name)
+    return files, directories
+
+
+def _walk_files(path, relative_path, extension, excluded_directories):
+    """Generator giving the files in a directory tree, files in a directory before its subdirectories.
+
+    Args:
+        path: the directory to walk
+        relative_path: the directory to walk as it should appear in the yielded paths
+        extension: file extension to filter by, empty for all files
+        excluded_directories: glob patterns of directory names to prune from the walk
+
+    Yields:
+        str: The path to the file.
+    """
+    files, directories = _scan_directory(path, excluded_directories)
+    for name in files:
+        if name.endswith(extension):
+            yield os.path.join(relative_path, name)
+    for name in directories:
+        yield from _walk_files(
+            os.path.join(path, name),
+            os.path.join(relative_path, name),
+            extension,
+            excluded_directories,
+        )
+
+
+# Size of the blocks read by search_files when a file can not be memory mapped
+SEARCH_BLOCK_SIZE = 1024 * 1024
+
+
+def _find_patterns(data, regex, patterns, found):
+    """Adds the patterns occurring in some data to a set of found patterns.
+
+    Patterns are tried longest first at every position a pattern starts, so patterns which
+    overlap or are contained in each other are all found.
+
+    Args:
+        data: bytes like object to search
+        regex: compiled alternation of the patterns, longest first
+        patterns: the patterns as bytes
+        found: set of patterns (as bytes) found so far, updated in place
+    """
+    position = 0
+    match = regex.search(data, position)
+    while match is not None and len(found) < len(patterns):
+        matched = match.group()
+        found.update(pattern for pattern in patterns if pattern in matched)
+        position = match.start() + 1
+        match = regex.search(data, position)
+
+
+def _search_file(path, regex, patterns):
+    """Finds which patterns occur in a file in a single pass.
+
+    The file is memory mapped if possible, otherwise it is read in large overlapping blocks.
+
+    Args:
+        path: the file to search
+        regex: compiled alternation of the patterns, longest first
+        patterns: the patterns as bytes
+
+    Returns:
+        set of the patterns (as bytes) found in the file
+    """
+    found = set()
+    with open(path, mode="rb") as f:
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                _find_patterns(data, regex, patterns, found)
+            return found
+        except (ValueError, OSError):
+            # Empty files and some network or special files can not be mapped
+            pass
+
+        overlap = max(len(pattern) for pattern in patterns) - 1
+        tail = b""
+        block = f.read(SEARCH_BLOCK_SIZE)
+        while block and len(found) < len(patterns):
+            data = tail + block
+            _find_patterns(data, regex, patterns, found)
+            tail = data[len(data) - overlap :] if overlap > 0 else b""
+            block = f.read(SEARCH_BLOCK_SIZE)
+    return found
+
+
+class LazyXmlDocument(object):
+    """The xml of a file, which is only parsed when it is first used.
+
+    It can be used as the xml document; the document itself is the document attribute. The raw contents of the file
+    are available without parsing it, so callers which only look for some text can avoid parsing files which do not
+    contain it.
+    """
+
+    def __init__(self, file_access, path, read_only=False):
+        """Constructor
+
+        Args:
+            file_access: the file access to read the file with
+            path: the path of the file
+            read_only: True if the xml will not be changed, so the xml kept by the file access can be used
+        """
+        self.path = path
+        self.read_only = read_only
+        self._file_access = file_access
+        self._document = None
+
+    @property
+    def document(self):
+        """The xml of the file, parsing it if it has not been parsed yet."""
+        if self._document is None:
+            self._document = self._file_access._get_xml(self.path, self.read_only)
+        return self._document
+
+    @property
+    def parsed(self):
+        """True if the xml of the file has been parsed."""
+        return self._document is not None
+
+    def raw_bytes(self):
+        """The contents of the file as bytes, without parsing it."""
+        return self._file_access.read_bytes(self.path)
+
+    def __getattr__(self, name):
+        if name.startswith("__") or name in ("path", "read_only", "_file_access", "_document"):
+            raise AttributeError(name)
+        return getattr(self.document, name)
+
+
+def _xml_text(xml):
+    """The contents FileAccess.write_xml_file gives a file for some xml."""
+    text = io.StringIO()
+    text.write('<?xml version="1.0" ?>\n')
+    document(xml).firstChild.writexml(text)
+    text.write("\n")
+    return text.getvalue()
+
+
+def document(xml):
+    """The xml document of some xml, parsing it if it is a LazyXmlDocument which has not been parsed.
+
+    Args:
+        xml: an xml document or LazyXmlDocument
+
+    Returns:
+        the xml document
+    """
+    return xml.document if isinstance(xml, LazyXmlDocument) else xml
+
+
+# Line endings recognised when splitting a file into lines, as when it is opened as text
+LINE_ENDINGS = re.compile(rb"\r\n|\r|\n")
+
+
+class LazyLines(Sequence):
+    """The lines of a file, without trailing whitespace, which are only found and decoded when they are used.
+
+    The contents are usually a memory map of the file, so only the part of the file which is used is read. The map
+    is closed by close(), when leaving a with block or when the lines are no longer used.
+    """
+
+    def __init__(self, data, encoding, on_close=None):
+        """Constructor
+
+        Args:
+            data: the contents of the file as bytes or a memory map
+            encoding: the encoding to decode the lines with
+            on_close: called when the lines are closed
+        """
+        self._data = data
+        self._encoding = encoding
+        self._on_close = on_close
+        self._lines = []
+        self._position = 0
+
+    @classmethod
+    def of_file(cls, path, encoding=None):
+        """The lines of a file on disk.
+
+        Args:
+            path: the file
+            encoding: the encoding to decode the lines with; defaults to the encoding files are opened with as text
+
+        Returns:
+            the lines
+        """
+        if encoding is None:
+            encoding = locale.getpreferredencoding(False)
+        with open(path, mode="rb") as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty files and some network or special files can not be mapped
+                return cls(f.read(), encoding)
+        return cls(data, encoding, on_close=data.close)
+
+    def _find_lines(self, count=None):
+        """Find lines in the contents until count lines are known or the end of the file is reached.
+
+        Returns:
+            the number of lines known
+        """
+        while self._position is not None and (count is None or len(self._lines) < count):
+            match = LINE_ENDINGS.search(self._data, self._position)
+            if match is not None:
+                self._lines.append((self._position, match.start()))
+                self._position = match.end()
+            else:
+                if self._position < len(self._data):
+                    self._lines.append((self._position, len(self._data)))
+                self._position = None
+        return len(self._lines)
+
+    def _line(self, index):
+        start, end = self._lines[index]
+        return self._data[start:end].decode(self._encoding).rstrip()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.stop is not None and index.stop >= 0 and (index.start or 0) >= 0:
+                count = self._find_lines(index.stop)
+            else:
+                count = len(self)
+            return [self._line(i) for i in range(*index.indices(count))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= self._find_lines(index + 1):
+            raise IndexError("line index out of range")
+        return self._line(index)
+
+    def __iter__(self):
+        index = 0
+        while index < self._find_lines(index + 1):
+            yield self._line(index)
+            index += 1
+
+    def __len__(self):
+        return self._find_lines()
+
+    def close(self):
+        if self._on_close is not None:
+            self._on_close()
+            self._on_close = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
 
 class FileAccess(object):
     """File access for the configuration"""
 
-    def __init__(self, logger, config_root):
+    def __init__(self, logger, config_root, instrument=None):
         """Constructor
 
         Args:
             logger: the logger to use
             config_root: the root dir for the config (all files a relative to this directory).
                         Should normally be the parent of ICPCONFIGROOT.
+            instrument: the name of the instrument the config is for e.g. NDXLET; defaults to the
+                        host name of this machine
         """
         self.config_base = config_root
         self._logger = logger
+        self._instrument = instrument
+        # Parsed xml files: path to the signature of the file when it was parsed and its xml
+        self._parsed_xml = {}
+        # Model of directories built with scandir: path to the sorted names of its entries and
+        # whether each is a directory
+        self._directory_entries = {}
+        # Guards the caches above, which are shared with copies of this file access used by steps
+        # running at the same time
+        self._cache_lock = threading.RLock()
+
+    @property
+    def instrument(self):
+        """The name of the instrument the config is for e.g. NDXLET."""
+        return self._instrument or socket.gethostname()
+
+    def _cache_key(self, filename):
+        return os.path.normpath(os.path.join(self.config_base, filename))
+
+    def forget_xml_files(self, filenames=None, folder=None):
+        """Forget the parsed xml of files, so that they are parsed again when they are next opened.
+
+        Args:
+            filenames: the files to forget; None to forget all files
+            folder: optionally, a folder to forget all the files in
+        """
+        with self._cache_lock:
+            if filenames is None and folder is None:
+                self._parsed_xml.clear()
+                return
+            for filename in filenames or []:
+                self._parsed_xml.pop(self._cache_key(filename), None)
+            if folder is not None:
+                prefix = os.path.join(self._cache_key(folder), "")
+                for path in [path for path in self._parsed_xml if path.startswith(prefix)]:
+                    self._parsed_xml.pop(path, None)
+
+    def forget_directories(self, *paths):
+        """Forget the model of the directories containing some paths and of the directories inside them, so they are
+        scanned again when they are next used.
+
+        Args:
+            paths: the paths which have changed; none to forget all directories
+        """
+        with self._cache_lock:
+            if not paths:
+                self._directory_entries.clear()
+                return
+            for path in paths:
+                path = self._cache_key(path)
+                for folder in list(self._directory_entries):
+                    if (
+                        folder == path
+                        or path.startswith(os.path.join(folder, ""))
+                        or folder.startswith(os.path.join(path, ""))
+                    ):
+                        self._directory_entries.pop(folder, None)
+
+    def _subdirectories(self, folder):
+        """The directories in a folder. The folder is scanned once using the file type information from scandir, and
+        the result kept until the folder is changed through this file access.
+
+        Args:
+            folder: the folder
+
+        Returns:
+            Paths of the directories in the folder, sorted by name.
+        """
+        key = self._cache_key(folder)
+        with self._cache_lock:
+            entries = self._directory_entries.get(key)
+        if entries is None:
+            with os.scandir(key) as it:
+                entries = sorted((entry.name, entry.is_dir()) for entry in it)
+            with self._cache_lock:
+                self._directory_entries[key] = entries
+        return [os.path.join(folder, name) for name, is_directory in entries if is_directory]
 
     def rename_file(self, filename, new_name):
         """Rename a file
@@ -36,6 +423,8 @@ class FileAccess(object):
             new_name: new filename to rename to
 
         """
+        self.forget_xml_files([filename, new_name], folder=filename)
+        self.forget_directories(filename, new_name)
         os.rename(filename, new_name)
 
     def open_file(self, filename):
@@ -47,11 +436,32 @@ class FileAccess(object):
         Returns:
             contents of file as a list of lines
         """
-        with open(os.path.join(self.config_base, filename)) as f:
-            lines = []
-            for line in f:
-                lines.append(line.rstrip())
-        return lines
+        with self.open_lines(filename) as lines:
+            return list(lines)
+
+    def open_lines(self, filename):
+        """Open a file to read its lines as they are needed, which is quicker than open_file if only some of them are
+        used
+
+        Args:
+            filename: filename to open
+
+        Returns:
+            LazyLines of the contents of the file
+        """
+        return LazyLines.of_file(os.path.join(self.config_base, filename))
+
+    def read_bytes(self, filename):
+        """Read the raw contents of a file without decoding it or splitting it into lines
+
+        Args:
+            filename: filename to read
+
+        Returns:
+            contents of file as bytes
+        """
+        with open(os.path.join(self.config_base, filename), mode="rb") as f:
+            return f.read()
 
     def write_version_number(self, version, filename):
         """Write the version number to the file
@@ -62,6 +472,7 @@ class FileAccess(object):
         Returns:
 
         """
+        self.forget_directories(filename)
         with open(os.path.join(self.config_base, filename), mode="w") as f:
             self._logger.info("Writing new version number {0}".format(version))
             f.write("{}\n".format(version))
@@ -78,6 +489,8 @@ class FileAccess(object):
         Returns:
 
         """
+        self.forget_xml_files([filename])
+        self.forget_directories(filename)
         with open(os.path.join(self.config_base, filename), mode=mode) as f:
             self._logger.info("Writing file {0}".format(filename))
             if not file_full:
@@ -95,6 +508,7 @@ class FileAccess(object):
         Returns:
 
         """
+        self.forget_directories(os.path.dirname(os.path.join(self.config_base, path)))
         os.makedirs(os.path.dirname(os.path.join(self.config_base, path)), exist_ok=True)
 
     def line_exists(self, filename, string):
@@ -107,22 +521,67 @@ class FileAccess(object):
 
     def file_contains(self, filename, string):
         """Check if a string exists in a file"""
-        with open(os.path.join(self.config_base, filename), "r") as f:
-            for line in f:
-                if string in line:
-                    return True
-        return False
+        return string in self.search_files([filename], [string])[filename]
+
+    def search_files(self, filenames, patterns, max_workers=1):
+        """Finds which of a set of strings occur in each of a set of files.
+
+        Each file is scanned once for all of the patterns, stopping early if all of them are found.
+
+        Args:
+            filenames: the files to search
+            patterns: the strings to search for
+            max_workers: the number of threads used to search the files
+
+        Returns:
+            Dictionary of filename to the set of patterns which occur in that file.
+        """
+        filenames = list(filenames)
+        patterns_by_bytes = {pattern.encode(): pattern for pattern in patterns if pattern}
+        if not patterns_by_bytes:
+            return {filename: set() for filename in filenames}
+
+        encoded_patterns = sorted(patterns_by_bytes, key=len, reverse=True)
+        regex = re.compile(b"|".join(re.escape(pattern) for pattern in encoded_patterns))
 
-    def open_xml_file(self, filename):
+        def search(filename):
+            found = _search_file(os.path.join(self.config_base, filename), regex, encoded_patterns)
+            return {patterns_by_bytes[pattern] for pattern in found}
+
+        if max_workers <= 1 or len(filenames) <= 1:
+            return {filename: search(filename) for filename in filenames}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(filenames, executor.map(search, filenames)))
+
+    def open_xml_file(self, filename, read_only=False):
         """Open a file and returns the xml it contains
 
+        Xml opened read only is kept, so opening the file again returns the same xml without parsing it unless the
+        modification time or size of the file has changed or it has been written. Otherwise the caller is given xml of
+        its own to change: the kept xml is handed over and forgotten, or the file is parsed.
+
         Args:
             filename: filename to open
+            read_only: True if the xml will not be changed; the xml is then shared with other callers
 
         Returns:
             contents of file as an xml tree
         """
-        return minidom.parse(os.path.join(self.config_base, filename))
+        path = self._cache_key(filename)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._cache_lock:
+            cached = self._parsed_xml.get(path)
+            if cached is not None and cached[0] == signature:
+                if not read_only:
+                    del self._parsed_xml[path]
+                return cached[1]
+        xml = minidom.parse(path)
+        if read_only:
+            with self._cache_lock:
+                self._parsed_xml[path] = (signature, xml)
+        return xml
 
     def write_xml_file(self, filename, xml):
         """Saves xml to a file
@@ -133,6 +592,9 @@ class FileAccess(object):
 
         Returns:
         """
+        xml = document(xml)
+        self.forget_xml_files([filename])
+        self.forget_directories(filename)
         # this can not use pretty print because that will cause it to gain tabs and newlines
         with open(os.path.join(self.config_base, filename), mode="w") as f:
             self._logger.info("Writing xml file {0}".format(filename))
@@ -158,6 +620,8 @@ class FileAccess(object):
             filename (str): The file to remove, relative to the config directory
         """
         self._logger.info("Removing file {}".format(filename))
+        self.forget_xml_files([filename])
+        self.forget_directories(filename)
         os.remove(os.path.join(self.config_base, filename))
 
     def delete_folder(self, path):
@@ -166,6 +630,8 @@ class FileAccess(object):
         Args:
             path (String): The folder to remove
         """
+        self.forget_xml_files(folder=path)
+        self.forget_directories(path)
         shutil.rmtree(path)
 
     def is_dir(self, path):
@@ -182,38 +648,55 @@ class FileAccess(object):
     def exists(self, path):
         return os.path.exists(os.path.join(self.config_base, path))
 
-    def _get_xml(self, path):
+    def get_file_signature(self, path):
+        """Gets a cheap signature of a file which changes whenever the file is modified.
+
+        Args:
+            path (str): The path relative to the configuration directory.
+
+        Returns:
+            Tuple: The modification time of the file in nanoseconds and its size in bytes.
+        """
+        stat = os.stat(os.path.join(self.config_base, path))
+        return stat.st_mtime_ns, stat.st_size
+
+    def _get_xml(self, path, read_only=False):
         try:
-            return self.open_xml_file(path)
+            return self.open_xml_file(path, read_only)
         except IOError:
             raise IOError("Cannot find {}".format(path))
         except ExpatError as ex:
             raise ExpatError("{} is invalid xml '{}'".format(path, ex))
 
-    def get_config_files(self, file_type):
+    def get_config_files(self, file_type, read_only=False):
         """Generator giving all the config files of a given type.
 
         Args:
             file_type: The type of file that you want to get e.g. iocs.xml
+            read_only: True if the xml will not be changed, so xml which has already been parsed can be used
 
         Yields:
-            Tuple: The path to the ioc file and its xml representation.
+            Tuple: The path to the ioc file and its xml representation, which is only parsed when it is first used.
         """
         for path in [COMPONENT_FOLDER, CONFIG_FOLDER]:
-            for config in [c for c in self.listdir(path) if self.is_dir(c)]:
+            for config in self._subdirectories(path):
                 xml_path = os.path.join(config, file_type)
-                yield xml_path, self._get_xml(xml_path)
+                yield xml_path, LazyXmlDocument(self, xml_path, read_only)
 
-    def get_synoptic_files(self):
+    def get_synoptic_files(self, read_only=False):
         """Generator giving all the synoptic config files
 
+        Args:
+            read_only: True if the xml will not be changed, so xml which has already been parsed can be used
+
         Yields:
-            Tuple: The path to the synoptic file and its xml representation.
+            Tuple: The path to the synoptic file and its xml representation, which is only parsed when it is first
+                used.
         """
         for synoptic_path in [
             filename for filename in self.listdir(SYNOPTIC_FOLDER) if filename.endswith(".xml")
         ]:
-            yield synoptic_path, self._get_xml(synoptic_path)
+            yield synoptic_path, LazyXmlDocument(self, synoptic_path, read_only)
 
     def get_device_screens(self):
         """Returns the device screen file if it exists, else None."""
@@ -223,20 +706,98 @@ class FileAccess(object):
         else:
             return None
 
-    def get_file_paths(self, directory: str, extension: str = ""):
+    def get_file_paths(
+        self,
+        directory: str,
+        extension: str = "",
+        excluded_directories=EXCLUDED_DIRECTORIES,
+        max_workers: int = WALK_WORKERS,
+    ):
         """Generator giving the paths of all files inside a directory, recursively searching all subdirectories.
 
+        The order of the paths is deterministic (sorted by name, files before subdirectories) and does
+        not depend on the number of workers.
+
         Args:
             directory: The directory to search.
             extension: Optional file extension to filter by.
+            excluded_directories: Glob patterns of directory names not to search.
+            max_workers: The number of threads used to walk the top level subdirectories.
 
         Yields:
             str: The path to the file.
         """
-        for root, _, files in os.walk(directory):
-            for file in files:
-                if extension is None or file.endswith(extension):
-                    yield os.path.join(root, file)
+        top = os.path.join(self.config_base, directory)
+        files, directories = _scan_directory(top, excluded_directories)
+        for name in files:
+            if name.endswith(extension):
+                yield os.path.join(directory, name)
+
+        def walk_subdirectory(name):
+            return _walk_files(
+                os.path.join(top, name),
+                os.path.join(directory, name),
+                extension,
+                excluded_directories,
+            )
+
+        if max_workers <= 1 or len(directories) <= 1:
+            for name in directories:
+                yield from walk_subdirectory(name)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for paths in executor.map(lambda name: list(walk_subdirectory(name)), directories):
+                yield from paths
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    def commit_changes(self, files, removed_files=(), removed_folders=(), created_directories=()):
+        """Make a set of changes to files together, so that a failure part way through leaves no file half-written.
+
+        Every file is written and synced to a temporary file before anything is changed, so if one can not be written
+        nothing is changed. Then the folders and files are removed and the temporary files renamed into place. See
+        AtomicBulkWriter.
+
+        Args:
+            files: dictionary of path to the new contents of the file as text, bytes or an xml document
+            removed_files: paths of files to remove
+            removed_folders: paths of folders to remove recursively
+            created_directories: paths of directories to create
+        """
+        files = {os.path.join(self.config_base, path): contents for path, contents in files.items()}
+        removed_folders = [os.path.join(self.config_base, folder) for folder in removed_folders]
+        self.forget_xml_files(list(files) + list(removed_files))
+        for folder in removed_folders:
+            self.forget_xml_files(folder=folder)
+        changed = [*files, *removed_files, *removed_folders, *created_directories]
+        if changed:
+            self.forget_directories(*changed)
+
+        writer = AtomicBulkWriter(self._logger)
+        writer.write(
+            {
+                path: _xml_text(contents)
+                if isinstance(contents, (minidom.Node, LazyXmlDocument))
+                else contents
+                for path, contents in files.items()
+            },
+            removed_folders,
+        )
+
+        for folder in removed_folders:
+            self._logger.info("Removing folder {}".format(folder))
+            shutil.rmtree(folder, ignore_errors=True)
+        for filename in removed_files:
+            self._logger.info("Removing file {}".format(filename))
+            try:
+                os.remove(os.path.join(self.config_base, filename))
+            except FileNotFoundError:
+                pass
+        for directory in created_directories:
+            os.makedirs(os.path.join(self.config_base, directory), exist_ok=True)
+        writer.replace()
 
     def read_dashboard_file(self):
         with open(DASHBOARD_DB_FILENAME) as db_file:
@@ -244,45 +805,421 @@ class FileAccess(object):
             return db_file.readlines()
 
     def write_dashboard_file(self, db_lines: list[str]):
+        self.forget_directories(DASHBOARD_DB_FILENAME)
         with open(DASHBOARD_DB_FILENAME, "w") as db_file:
             self._logger.info(f"Writing {DASHBOARD_DB_FILENAME} file")
             db_file.writelines(db_lines)
 
 
 class CachingFileAccess(object):
-    """Context that uses the given file access object but does not actually write to file until the context is left
+    """Context that uses the given file access object but does not actually change any file until the context is left
     without an error.
+
+    Every change made through the file access object (writes, appends, renames, removals and deletions of folders) is
+    staged, and reads made through it inside the context see the staged changes. When the context is left the changes
+    are committed together: each file is written and synced to a temporary file next to it, then the temporary files
+    are renamed over the files they replace, so a failure part way through leaves no file half-written. If the
+    context is left with an error, or discard is called, nothing is changed. A context inside another one commits
+    its changes into the outer one. If write_on_exit is False the changes stay staged when the context is left without
+    an error, until finish or discard is called.
+
+    At most max_cached_documents written xml documents are kept in memory; when there are more the least recently used
+    are serialised to a temporary staging folder and parsed again if they are opened. While a serialised document is
+    still in use, e.g. the caller holds it and may change it again, the document itself is used instead, so no change
+    made to a written document is lost.
     """
 
-    def __init__(self, file_access):
-        self.cached_writes = dict()
+    # Methods of the file access object which are replaced while in the context
+    STAGED_METHODS = (
+        "open_file",
+        "open_lines",
+        "read_bytes",
+        "write_version_number",
+        "write_file",
+        "create_directories",
+        "line_exists",
+        "search_files",
+        "open_xml_file",
+        "write_xml_file",
+        "listdir",
+        "rename_file",
+        "remove_file",
+        "delete_folder",
+        "is_dir",
+        "exists",
+        "_subdirectories",
+        "read_dashboard_file",
+        "write_dashboard_file",
+    )
+
+    def __init__(self, file_access, max_cached_documents=MAX_CACHED_DOCUMENTS, write_on_exit=True):
+        self.cached_writes = OrderedDict()
+        self._spilled_writes = dict()
+        # Documents which have been serialised to the staging folder, for as long as they are still in use
+        self._spilled_documents = weakref.WeakValueDictionary()
+        self._staged_files = dict()
+        self._deleted_files = set()
+        self._deleted_folders = set()
+        self._created_directories = set()
+        self._staging_dir = None
+        self._staged_count = 0
+        self._max_cached_documents = max(max_cached_documents, 1)
         self._file_access = file_access
+        self._logger = getattr(file_access, "_logger", None)
+        self._old_methods = {}
+        self._parent = None
+        self._discarded = False
+        self._write_on_exit = write_on_exit
 
     def __enter__(self):
-        self.old_write_method = self._file_access.write_xml_file
-        self.old_open_method = self._file_access.open_xml_file
-        self._file_access.write_xml_file = self.write_xml_file
-        self._file_access.open_xml_file = self.open_xml_file
+        self._parent = getattr(self._file_access, "_transaction", None)
+        self._file_access._transaction = self
+        for name in self.STAGED_METHODS:
+            self._old_methods[name] = getattr(self._file_access, name)
+            setattr(self._file_access, name, getattr(self, name))
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._file_access.write_xml_file = self.old_write_method
-        self._file_access.open_xml_file = self.old_open_method
-        if exc_type is None:
-            self.write()
+        for name, method in self._old_methods.items():
+            setattr(self._file_access, name, method)
+        self._file_access._transaction = self._parent
+        if exc_type is None and not self._discarded and not self._write_on_exit:
+            return
+        try:
+            if exc_type is None and not self._discarded:
+                self.write()
+        finally:
+            self._remove_staging_dir()
 
-    def open_xml_file(self, filename):
+    def finish(self):
+        """Make the changes which were left staged when the context was left."""
+        try:
+            if not self._discarded:
+                self.write()
+        finally:
+            self._remove_staging_dir()
+
+    def discard(self):
+        """Forget all of the staged changes, so that nothing is changed when the context is left."""
+        self.cached_writes.clear()
+        self._spilled_writes.clear()
+        self._spilled_documents.clear()
+        self._staged_files.clear()
+        self._deleted_files.clear()
+        self._deleted_folders.clear()
+        self._created_directories.clear()
+        self._discarded = True
+        self._remove_staging_dir()
+
+    def _log(self, message):
+        if self._logger is not None:
+            self._logger.info(message)
+
+    def _path(self, filename):
+        """The absolute path of a file, which is what staged changes are keyed by."""
+        return os.path.normpath(os.path.join(self._file_access.config_base or "", filename))
+
+    @staticmethod
+    def _is_under(path, folder):
+        return path == folder or path.startswith(os.path.join(folder, ""))
+
+    @staticmethod
+    def _decode(data):
+        """Decode the contents of a file as opening it as text would."""
+        return io.TextIOWrapper(io.BytesIO(data)).read()
+
+    @staticmethod
+    def _encode(text):
+        """Encode text as writing it to a file opened as text would."""
+        return text.replace("\n", os.linesep).encode(locale.getpreferredencoding(False))
+
+    def _is_staged(self, path):
+        return (
+            path in self.cached_writes or path in self._spilled_writes or path in self._staged_files
+        )
+
+    def _is_deleted(self, path):
+        return path in self._deleted_files or any(
+            self._is_under(path, folder) for folder in self._deleted_folders
+        )
+
+    def _has_staged_contents(self, path):
+        """Whether a folder contains staged files or folders."""
+        return any(
+            self._is_under(staged, path) and staged != path
+            for staged in itertools.chain(
+                self.cached_writes,
+                self._spilled_writes,
+                self._staged_files,
+                self._created_directories,
+            )
+        )
+
+    def _staged(self, path):
+        """The staged contents of a file, as text or bytes, or None if it has not been written."""
+        if path in self.cached_writes:
+            return _xml_text(self.cached_writes[path])
+        if path in self._spilled_writes:
+            xml = self._spilled_documents.get(path)
+            if xml is not None:
+                return _xml_text(xml)
+            with open(self._spilled_writes[path]) as f:
+                return f.read()
+        return self._staged_files.get(path)
+
+    def _staged_text(self, path):
+        data = self._staged(path)
+        return self._decode(data) if isinstance(data, bytes) else data
+
+    def _staged_bytes(self, path):
+        data = self._staged(path)
+        return self._encode(data) if isinstance(data, str) else data
+
+    def _check_not_deleted(self, path, filename):
+        if self._is_deleted(path):
+            raise FileNotFoundError("Cannot find {}, it has been removed".format(filename))
+
+    def _unstage(self, path):
+        """Forget the staged contents of a file.
+
+        Returns:
+            True if the file had been written; False otherwise.
+        """
+        written = path in self.cached_writes or path in self._staged_files
+        self.cached_writes.pop(path, None)
+        self._staged_files.pop(path, None)
+        self._spilled_documents.pop(path, None)
+        return self._spilled_writes.pop(path, None) is not None or written
+
+    def _stage(self, path, data):
+        """Stage the contents of a file as text or bytes."""
+        self._unstage(path)
+        self._staged_files[path] = data
+
+    def open_file(self, filename):
+        """Open a file and return the object (the staged contents if it has been written)
+
+        Args:
+            filename: filename to open
+
+        Returns:
+            contents of file as a list of lines
+        """
+        path = self._path(filename)
+        if self._is_staged(path):
+            return [line.rstrip() for line in io.StringIO(self._staged_text(path))]
+        self._check_not_deleted(path, filename)
+        return self._old_methods["open_file"](filename)
+
+    def open_lines(self, filename):
+        """Open a file to read its lines as they are needed (the staged contents if it has been written)
+
+        Args:
+            filename: filename to open
+
+        Returns:
+            LazyLines of the contents of the file
+        """
+        path = self._path(filename)
+        if self._is_staged(path):
+            return LazyLines(self._staged_bytes(path), locale.getpreferredencoding(False))
+        self._check_not_deleted(path, filename)
+        return self._old_methods["open_lines"](filename)
+
+    def read_bytes(self, filename):
+        """Read the raw contents of a file (the staged contents if it has been written)
+
+        Args:
+            filename: filename to read
+
+        Returns:
+            contents of file as bytes
+        """
+        path = self._path(filename)
+        if self._is_staged(path):
+            return self._staged_bytes(path)
+        self._check_not_deleted(path, filename)
+        return self._old_methods["read_bytes"](filename)
+
+    def line_exists(self, filename, string):
+        """Check if string exists as a line in file"""
+        path = self._path(filename)
+        if self._is_staged(path):
+            return any(line == string for line in io.StringIO(self._staged_text(path)))
+        self._check_not_deleted(path, filename)
+        return self._old_methods["line_exists"](filename, string)
+
+    def search_files(self, filenames, patterns, max_workers=1):
+        """Finds which of a set of strings occur in each of a set of files, searching the staged contents of files
+        which have been written.
+
+        Args:
+            filenames: the files to search
+            patterns: the strings to search for
+            max_workers: the number of threads used to search the files
+
+        Returns:
+            Dictionary of filename to the set of patterns which occur in that file.
+        """
+        filenames = list(filenames)
+        found = {}
+        unstaged = []
+        for filename in filenames:
+            path = self._path(filename)
+            if self._is_staged(path):
+                text = self._staged_text(path)
+                found[filename] = {pattern for pattern in patterns if pattern and pattern in text}
+            else:
+                self._check_not_deleted(path, filename)
+                unstaged.append(filename)
+        if unstaged:
+            found.update(
+                self._old_methods["search_files"](unstaged, patterns, max_workers=max_workers)
+            )
+        return {filename: found[filename] for filename in filenames}
+
+    def open_xml_file(self, filename, read_only=False):
         """Open a file and returns the xml it contains (returns the cached file if it exists)
 
         Args:
             filename: filename to open
+            read_only: True if the xml will not be changed
 
         Returns:
             contents of file as an xml tree
         """
-        if filename in self.cached_writes.keys():
-            return self.cached_writes[filename]
+        path = self._path(filename)
+        if path in self.cached_writes:
+            self.cached_writes.move_to_end(path)
+            return self.cached_writes[path]
+        elif path in self._spilled_writes:
+            xml = self._spilled_documents.pop(path, None)
+            staged_filename = self._spilled_writes.pop(path)
+            if xml is None:
+                xml = minidom.parse(staged_filename)
+            self._cache(path, xml)
+            return xml
+        elif path in self._staged_files:
+            return minidom.parseString(self._staged_bytes(path))
         else:
-            return self.old_open_method(filename)
+            self._check_not_deleted(path, filename)
+            return self._old_methods["open_xml_file"](filename, read_only)
+
+    def read_dashboard_file(self):
+        if self._is_staged(DASHBOARD_DB_FILENAME):
+            return io.StringIO(self._staged_text(DASHBOARD_DB_FILENAME)).readlines()
+        return self._old_methods["read_dashboard_file"]()
+
+    def exists(self, path):
+        full_path = self._path(path)
+        if (
+            self._is_staged(full_path)
+            or full_path in self._created_directories
+            or self._has_staged_contents(full_path)
+        ):
+            return True
+        if self._is_deleted(full_path):
+            return False
+        return self._old_methods["exists"](path)
+
+    def is_dir(self, path):
+        """Checks whether a path is a directory or file, including staged files and directories.
+
+        Args:
+            path (str): The path relative to the configuration directory.
+
+        Returns:
+            True if is a directory, false otherwise.
+        """
+        full_path = self._path(path)
+        if self._is_staged(full_path):
+            return False
+        if full_path in self._created_directories or self._has_staged_contents(full_path):
+            return True
+        if self._is_deleted(full_path):
+            return False
+        return self._old_methods["is_dir"](path)
+
+    def _subdirectories(self, folder):
+        """The directories in a folder, including staged directories and leaving out removed ones."""
+        return sorted(
+            (path for path in self.listdir(folder) if self.is_dir(path)), key=os.path.basename
+        )
+
+    def listdir(self, dir):
+        """Returns a list of files in a directory, including staged files and leaving out removed ones
+
+        Args:
+            dir (String): The directory to list
+
+        Return:
+            List of file paths (strings)
+        """
+        folder = self._path(dir)
+        try:
+            listed = self._old_methods["listdir"](dir)
+        except FileNotFoundError:
+            if not self._has_staged_contents(folder):
+                raise
+            listed = []
+        if self._is_deleted(folder):
+            listed = []
+
+        names = set()
+        files = []
+        for path in listed:
+            name = os.path.basename(path)
+            full_path = os.path.join(folder, name)
+            if not self._is_deleted(full_path) or self.exists(full_path):
+                names.add(name)
+                files.append(path)
+        for staged in sorted(
+            itertools.chain(
+                self.cached_writes,
+                self._spilled_writes,
+                self._staged_files,
+                self._created_directories,
+            )
+        ):
+            if self._is_under(staged, folder) and staged != folder:
+                name = os.path.relpath(staged, folder).split(os.sep)[0]
+                if name not in names:
+                    names.add(name)
+                    files.append(os.path.join(dir, name))
+        return files
+
+    def write_version_number(self, version, filename):
+        """Stage writing the version number to the file
+        Args:
+            version: version to write
+            filename: filename to write to (relative to config root)
+        """
+        self._log("Writing new version number {0}".format(version))
+        self._stage(self._path(filename), "{}\n".format(version))
+
+    def write_file(self, filename, file_contents, mode="w", file_full=False):
+        """Stage file contents (will overwrite existing files)
+
+        Args:
+            filename: filename to write to
+            file_contents: the file contents to write as a list of strings (no new lines needed)
+            mode: mode the file would be opened with e.g. "w", "a" or "wb"
+            file_full: if true then file_contents should be a list of strings (no new lines needed),
+            if false then it should be a string to be written directly
+        """
+        path = self._path(filename)
+        binary = "b" in mode
+        if file_full:
+            data = file_contents
+        elif binary:
+            data = b"".join(line + b"\n" for line in file_contents)
+        else:
+            data = "".join("{}\n".format(line) for line in file_contents)
+
+        if "a" in mode and self.exists(filename):
+            # Add to the bytes of the file, so the line endings already in it are left as they are
+            data = self.read_bytes(filename) + (data if binary else self._encode(data))
+        self._stage(path, data)
 
     def write_xml_file(self, filename, xml):
         """Caches a write of xml to a file
@@ -291,9 +1228,148 @@ class CachingFileAccess(object):
             filename: filename to save
             xml: xml to save
         """
-        self.cached_writes[filename] = xml
+        path = self._path(filename)
+        self._unstage(path)
+        self._cache(path, document(xml))
+
+    def write_dashboard_file(self, db_lines):
+        self._stage(DASHBOARD_DB_FILENAME, "".join(db_lines))
+
+    def create_directories(self, path):
+        """Stage creating directories starting at config base path
+
+        Args:
+            path: path for directories to be created
+        """
+        self._created_directories.add(os.path.dirname(self._path(path)))
+
+    def remove_file(self, filename):
+        """Stage removing a file.
+
+        Args:
+            filename (str): The file to remove, relative to the config directory
+        """
+        path = self._path(filename)
+        written = self._unstage(path)
+        if self._old_methods["exists"](filename) and not self._is_deleted(path):
+            self._deleted_files.add(path)
+        elif not written:
+            raise FileNotFoundError("Cannot remove {}, it does not exist".format(filename))
+
+    def delete_folder(self, path):
+        """Stage deleting a folder recursively.
+
+        Args:
+            path (String): The folder to remove
+        """
+        folder = self._path(path)
+        if not self.is_dir(path):
+            raise FileNotFoundError("Cannot delete {}, it is not a folder".format(path))
+        for store in (self.cached_writes, self._spilled_writes, self._staged_files):
+            for staged in [staged for staged in store if self._is_under(staged, folder)]:
+                del store[staged]
+        self._created_directories = {
+            d for d in self._created_directories if not self._is_under(d, folder)
+        }
+        self._deleted_files = {f for f in self._deleted_files if not self._is_under(f, folder)}
+        self._deleted_folders.add(folder)
+
+    def rename_file(self, filename, new_name):
+        """Stage renaming a file or folder
+
+        Args:
+            filename: current filename
+            new_name: new filename to rename to
+        """
+        source = self._path(filename)
+        destination = self._path(new_name)
+        if not self.is_dir(filename):
+            self._move(source, destination)
+            return
+
+        files = set()
+        if not self._is_deleted(source):
+            for root, _, names in os.walk(source):
+                files.update(os.path.join(root, name) for name in names)
+        files = {f for f in files if not self._is_deleted(f)}
+        files.update(
+            staged
+            for staged in itertools.chain(
+                self.cached_writes, self._spilled_writes, self._staged_files
+            )
+            if self._is_under(staged, source)
+        )
+        for path in sorted(files):
+            self._move(path, os.path.join(destination, os.path.relpath(path, source)))
+        self.delete_folder(filename)
+
+    def _move(self, source, destination):
+        if source in self.cached_writes or source in self._spilled_writes:
+            self.write_xml_file(destination, self.open_xml_file(source))
+        else:
+            self._stage(destination, self.read_bytes(source))
+        self.remove_file(source)
+
+    def _cache(self, path, xml):
+        """Keep a written document in memory, staging the least recently used documents if there are too many."""
+        self.cached_writes[path] = xml
+        self.cached_writes.move_to_end(path)
+        while len(self.cached_writes) > self._max_cached_documents:
+            self._spill(*self.cached_writes.popitem(last=False))
+
+    def _spill(self, path, xml):
+        """Serialise a written document to the staging folder."""
+        if self._staging_dir is None:
+            self._staging_dir = tempfile.mkdtemp(prefix="upgrade_staging_")
+        self._staged_count += 1
+        staged_filename = os.path.join(self._staging_dir, "{}.xml".format(self._staged_count))
+        with open(staged_filename, mode="w") as f:
+            f.write(_xml_text(xml))
+        self._spilled_writes[path] = staged_filename
+        self._spilled_documents[path] = xml
+
+    def _remove_staging_dir(self):
+        if self._staging_dir is not None:
+            shutil.rmtree(self._staging_dir, ignore_errors=True)
+            self._staging_dir = None
+        self._spilled_writes.clear()
+        self._spilled_documents.clear()
 
     def write(self):
-        """Write all cached writes to the file."""
-        for filename, xml in self.cached_writes.items():
-            self._file_access.write_xml_file(filename, xml)
+        """Make all of the staged changes."""
+        if self._parent is not None:
+            self._write_to_parent()
+        else:
+            self._commit()
+
+    def _write_to_parent(self):
+        """Stage all of the changes in the context this one is inside."""
+        for folder in sorted(self._deleted_folders):
+            self._old_methods["delete_folder"](folder)
+        for path in sorted(self._deleted_files):
+            self._old_methods["remove_file"](path)
+        for directory in sorted(self._created_directories):
+            self._old_methods["create_directories"](os.path.join(directory, ""))
+        for path, data in self._staged_files.items():
+            self._old_methods["write_file"](
+                path, data, "wb" if isinstance(data, bytes) else "w", True
+            )
+        for path, staged_filename in list(self._spilled_writes.items()):
+            xml = self._spilled_documents.get(path)
+            self._old_methods["write_xml_file"](
+                path, xml if xml is not None else minidom.parse(staged_filename)
+            )
+        for path, xml in self.cached_writes.items():
+            self._old_methods["write_xml_file"](path, xml)
+
+    def _commit(self):
+        """Write all of the staged changes to disk together."""
+        files = dict(self._staged_files)
+        files.update((path, self._staged(path)) for path in self._spilled_writes)
+        files.update(self.cached_writes)
+        self._file_access.commit_changes(
+            files,
+            removed_files=sorted(self._deleted_files),
+            removed_folders=sorted(self._deleted_folders),
+            created_directories=sorted(self._created_directories),
+        )
@@ -1,13 +1,107 @@
 # ruff: noqa: ANN205, ANN001
+import os
+import threading
+import time
+from dataclasses import dataclass
+
 import git
 
 
+@dataclass
+class GitTiming:
+    command: str  # The git command which was run e.g. "git log -1"
+    duration: float  # Time the command took in seconds
+
+
+class TimedGit(git.Git):
+    """Runs git commands, recording how long each one takes."""
+
+    def __init__(self, working_dir=None):
+        super(TimedGit, self).__init__(working_dir)
+        self.timings = []
+
+    def execute(self, command, *args, **kwargs):
+        start = time.monotonic()
+        try:
+            return super(TimedGit, self).execute(command, *args, **kwargs)
+        finally:
+            self.timings.append(
+                GitTiming(
+                    command if isinstance(command, str) else " ".join(str(c) for c in command),
+                    time.monotonic() - start,
+                )
+            )
+
+
+class TimedRepo(git.Repo):
+    """A git repository whose git commands are timed."""
+
+    GitCommandWrapperType = TimedGit
+
+
 class RepoFactory:
+    # Repositories which have been opened, by working directory. A repository is opened once so
+    # that the cat-file processes GitPython keeps running for it to read objects are reused.
+    _repos = {}
+    _lock = threading.Lock()
+
     @staticmethod
     def get_repo(working_directory: str):
-        # Check repo
-        try:
-            return git.Repo(working_directory, search_parent_directories=True)
-        except Exception:
-            # Not a valid repository
-            raise Exception(working_directory + " is not under version control")
+        key = os.path.abspath(working_directory)
+        with RepoFactory._lock:
+            repo = RepoFactory._repos.get(key)
+            if repo is not None and os.path.isdir(repo.git_dir):
+                return repo
+
+            # Check repo
+            try:
+                repo = TimedRepo(key, search_parent_directories=True)
+            except Exception:
+                # Not a valid repository
+                raise Exception(working_directory + " is not under version control")
+
+            # Directories in the same repository share it
+            top_level = os.path.abspath(repo.working_tree_dir or repo.git_dir)
+            existing = RepoFactory._repos.get(top_level)
+            if existing is not None and os.path.isdir(existing.git_dir):
+                repo.close()
+                repo = existing
+            RepoFactory._repos[top_level] = repo
+            RepoFactory._repos[key] = repo
+            return repo
+
+    @staticmethod
+    def timings():
+        """The time taken by every git command run by the repositories which have been opened.
+
+        Returns: list of GitTiming in the order the commands were run in each repository
+        """
+        with RepoFactory._lock:
+            repos = list({id(repo): repo for repo in RepoFactory._repos.values()}.values())
+        return [timing for repo in repos for timing in repo.git.timings]
+
+    @staticmethod
+    def timing_summary():
+        """Summarise the time taken by git commands.
+
+        Returns: the number of git commands run and the time they took, with the slowest command
+        """
+        timings = RepoFactory.timings()
+        if not timings:
+            return "No git commands run"
+        slowest = max(timings, key=lambda timing: timing.duration)
+        return "{} git commands took {:.2f}s, slowest {:.2f}s: {}".format(
+            len(timings),
+            sum(timing.duration for timing in timings),
+            slowest.duration,
+            slowest.command,
+        )
+
+    @staticmethod
+    def clear():
+        """Close the repositories which have been opened, stopping their git processes."""
+        with RepoFactory._lock:
+            repos = list({id(repo): repo for repo in RepoFactory._repos.values()}.values())
+            RepoFactory._repos.clear()
+        for repo in repos:
+            repo.close()
@@ -0,0 +1,450 @@
+# ruff: noqa: ANN204, ANN205, E501, ANN001, ANN201, ANN202
+import io
+import os
+import threading
+import time
+from fnmatch import fnmatchcase
+from xml.dom import minidom
+
+from src.common_upgrades.utils.constants import (
+    DASHBOARD_DB_FILENAME,
+    DEVICE_SCREEN_FILE,
+    DEVICE_SCREENS_FOLDER,
+)
+from src.file_access import (
+    EXCLUDED_DIRECTORIES,
+    WALK_WORKERS,
+    FileAccess,
+    LazyLines,
+    LazyXmlDocument,
+    document,
+)
+
+# Encoding of files written as text
+ENCODING = "utf-8"
+
+
+class InMemoryFileAccess(FileAccess):
+    """File access for a configuration held in memory rather than on disk.
+
+    Files and directories behave as they would on disk: files can only be written in directories which exist, listing
+    a directory gives the files and directories in it, and removing a directory removes everything in it. Files are
+    kept as bytes, text is written and read as UTF-8. Paths are relative to the config root, as for FileAccess, or
+    absolute.
+    """
+
+    def __init__(self, logger, config_root, files=None, instrument=None):
+        """Constructor
+
+        Args:
+            logger: the logger to use
+            config_root: the root dir for the config (all files a relative to this directory).
+            files: optional dictionary of path to contents (text or bytes) of files to start with
+            instrument: the name of the instrument the config is for; defaults to the host name
+        """
+        super(InMemoryFileAccess, self).__init__(logger, config_root, instrument)
+        self._lock = threading.RLock()
+        # Path to tuple of the contents of the file as bytes and its modification time in nanoseconds
+        self._files = {}
+        self._directories = set()
+        self._make_directories(self._path(""))
+        for filename, contents in (files or {}).items():
+            self._make_directories(os.path.dirname(self._path(filename)))
+            self._store(filename, contents)
+
+    @classmethod
+    def copy_of(cls, logger, config_root):
+        """Create a file access holding a copy of a configuration on disk, e.g. to benchmark an upgrade.
+
+        Args:
+            logger: the logger to use
+            config_root: the root dir of the config on disk to copy
+
+        Returns:
+            the file access
+        """
+        file_access = cls(logger, config_root)
+        for filename in FileAccess(logger, config_root).get_file_paths(
+            config_root, excluded_directories=(".git",)
+        ):
+            file_access._make_directories(os.path.dirname(file_access._path(filename)))
+            with open(filename, mode="rb") as f:
+                file_access._store(filename, f.read())
+        return file_access
+
+    def _path(self, filename):
+        return os.path.normpath(os.path.join(self.config_base, filename))
+
+    def _make_directories(self, path):
+        with self._lock:
+            while path not in self._directories:
+                if path in self._files:
+                    raise FileExistsError("Cannot create directory {}, it is a file".format(path))
+                self._directories.add(path)
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+
+    def _store(self, filename, contents):
+        """Set the contents of a file, which must be in a directory which exists."""
+        path = self._path(filename)
+        if isinstance(contents, str):
+            contents = contents.encode(ENCODING)
+        with self._lock:
+            if os.path.dirname(path) not in self._directories:
+                raise FileNotFoundError(
+                    "Cannot write {}, its directory does not exist".format(filename)
+                )
+            if path in self._directories:
+                raise IsADirectoryError("Cannot write {}, it is a directory".format(filename))
+            self._files[path] = (bytes(contents), time.time_ns())
+        with self._cache_lock:
+            self._parsed_xml.pop(path, None)
+
+    def _contents(self, filename):
+        with self._lock:
+            try:
+                return self._files[self._path(filename)][0]
+            except KeyError:
+                raise FileNotFoundError("Cannot find {}".format(filename))
+
+    def _text(self, filename):
+        """The contents of a file as text, with universal newlines as if it had been opened as text."""
+        return io.TextIOWrapper(io.BytesIO(self._contents(filename)), encoding=ENCODING).read()
+
+    def _is_under(self, path, folder):
+        return path == folder or path.startswith(os.path.join(folder, ""))
+
+    def rename_file(self, filename, new_name):
+        """Rename a file or directory
+
+        Args:
+            filename: current filename
+            new_name: new filename to rename to
+        """
+        source = self._path(filename)
+        destination = self._path(new_name)
+        self.forget_xml_files([filename, new_name], folder=filename)
+        with self._lock:
+            if source in self._files:
+                # Store the file under its new name first, so it is not lost if that fails
+                self._store(new_name, self._files[source][0])
+                if destination != source:
+                    del self._files[source]
+                return
+            if source not in self._directories:
+                raise FileNotFoundError("Cannot rename {}, it does not exist".format(filename))
+            self._make_directories(destination)
+            for directory in sorted(d for d in self._directories if self._is_under(d, source)):
+                self._directories.discard(directory)
+                self._directories.add(os.path.join(destination, os.path.relpath(directory, source)))
+            for path in [path for path in self._files if self._is_under(path, source)]:
+                self._files[os.path.join(destination, os.path.relpath(path, source))] = (
+                    self._files.pop(path)
+                )
+
+    def open_file(self, filename):
+        """Open a file and return the object
+
+        Args:
+            filename: filename to open
+
+        Returns:
+            contents of file as a list of lines
+        """
+        return [line.rstrip() for line in io.StringIO(self._text(filename))]
+
+    def open_lines(self, filename):
+        """Open a file to read its lines as they are needed
+
+        Args:
+            filename: filename to open
+
+        Returns:
+            LazyLines of the contents of the file
+        """
+        return LazyLines(self._contents(filename), ENCODING)
+
+    def read_bytes(self, filename):
+        """Read the raw contents of a file without decoding it or splitting it into lines
+
+        Args:
+            filename: filename to read
+
+        Returns:
+            contents of file as bytes
+        """
+        return self._contents(filename)
+
+    def write_version_number(self, version, filename):
+        """Write the version number to the file
+        Args:
+            version: version to write
+            filename: filename to write to (relative to config root)
+        """
+        self._logger.info("Writing new version number {0}".format(version))
+        self._store(filename, "{}\n".format(version))
+
+    def write_file(self, filename, file_contents, mode="w", file_full=False):
+        """Write file contents (will overwrite existing files)
+
+        Args:
+            filename: filename to write to
+            file_contents: the file contents to write as a list of strings (no new lines needed)
+            mode: mode the file would be opened with e.g. "w", "a" or "wb"
+            file_full: if true then file_contents should be a list of strings (no new lines needed),
+            if false then it should be a string to be written directly
+        """
+        self._logger.info("Writing file {0}".format(filename))
+        if file_full:
+            contents = file_contents
+        elif "b" in mode:
+            contents = b"".join(line + b"\n" for line in file_contents)
+        else:
+            contents = "".join("{}\n".format(line) for line in file_contents)
+        if isinstance(contents, str):
+            contents = contents.encode(ENCODING)
+
+        with self._lock:
+            if "a" in mode and self.exists(filename):
+                contents = self._contents(filename) + contents
+            self._store(filename, contents)
+
+    def create_directories(self, path):
+        """Create directories starting at config base path
+
+        Args:
+            path: path for directories to be created
+        """
+        self._make_directories(os.path.dirname(self._path(path)))
+
+    def line_exists(self, filename, string):
+        """Check if string exists as a line in file"""
+        return any(line == string for line in io.StringIO(self._text(filename)))
+
+    def search_files(self, filenames, patterns, max_workers=1):
+        """Finds which of a set of strings occur in each of a set of files.
+
+        Args:
+            filenames: the files to search
+            patterns: the strings to search for
+            max_workers: not used, searching memory is not sped up by threads
+
+        Returns:
+            Dictionary of filename to the set of patterns which occur in that file.
+        """
+        encoded_patterns = {pattern: pattern.encode(ENCODING) for pattern in patterns if pattern}
+        found = {}
+        for filename in filenames:
+            contents = self._contents(filename)
+            found[filename] = {
+                pattern for pattern, encoded in encoded_patterns.items() if encoded in contents
+            }
+        return found
+
+    def open_xml_file(self, filename, read_only=False):
+        """Open a file and returns the xml it contains; xml opened read only is kept until the file is written
+
+        Args:
+            filename: filename to open
+            read_only: True if the xml will not be changed; the xml is then shared with other callers
+
+        Returns:
+            contents of file as an xml tree
+        """
+        path = self._path(filename)
+        with self._lock:
+            try:
+                contents, mtime = self._files[path]
+            except KeyError:
+                raise FileNotFoundError("Cannot find {}".format(filename))
+        signature = (mtime, len(contents))
+        with self._cache_lock:
+            cached = self._parsed_xml.get(path)
+            if cached is not None and cached[0] == signature:
+                if not read_only:
+                    del self._parsed_xml[path]
+                return cached[1]
+        xml = minidom.parseString(contents)
+        if read_only:
+            with self._cache_lock:
+                self._parsed_xml[path] = (signature, xml)
+        return xml
+
+    def write_xml_file(self, filename, xml):
+        """Saves xml to a file
+
+        Args:
+            filename: filename to save
+            xml: xml to save
+        """
+        self._logger.info("Writing xml file {0}".format(filename))
+        text = io.StringIO()
+        text.write('<?xml version="1.0" ?>\n')
+        document(xml).firstChild.writexml(text)
+        text.write("\n")
+        self._store(filename, text.getvalue())
+
+    def listdir(self, dir):
+        """Returns a list of files in a directory
+
+        Args:
+            dir (String): The directory to list
+
+        Return:
+            List of file paths (strings), sorted by name
+        """
+        folder = self._path(dir)
+        with self._lock:
+            if folder not in self._directories:
+                raise FileNotFoundError("Cannot list {}, it is not a directory".format(dir))
+            names = {
+                os.path.basename(path)
+                for path in self._directories.union(self._files)
+                if os.path.dirname(path) == folder and path != folder
+            }
+        return [os.path.join(dir, name) for name in sorted(names)]
+
+    def _subdirectories(self, folder):
+        """The directories in a folder.
+
+        Args:
+            folder: the folder
+
+        Returns:
+            Paths of the directories in the folder, sorted by name.
+        """
+        return [path for path in self.listdir(folder) if self.is_dir(path)]
+
+    def remove_file(self, filename):
+        """Removes a file.
+
+        Args:
+            filename (str): The file to remove, relative to the config directory
+        """
+        self._logger.info("Removing file {}".format(filename))
+        self.forget_xml_files([filename])
+        with self._lock:
+            if self._files.pop(self._path(filename), None) is None:
+                raise FileNotFoundError("Cannot remove {}, it does not exist".format(filename))
+
+    def delete_folder(self, path):
+        """Deletes a folder recursively.
+
+        Args:
+            path (String): The folder to remove
+        """
+        folder = self._path(path)
+        self.forget_xml_files(folder=path)
+        with self._lock:
+            if folder not in self._directories:
+                raise FileNotFoundError("Cannot delete {}, it is not a directory".format(path))
+            self._directories = {d for d in self._directories if not self._is_under(d, folder)}
+            for filename in [f for f in self._files if self._is_under(f, folder)]:
+                del self._files[filename]
+
+    def is_dir(self, path):
+        """Checks whether a path is a directory or file.
+
+        Args:
+            path (str): The path relative to the configuration directory.
+
+        Returns:
+            True if is a directory, false otherwise.
+        """
+        return self._path(path) in self._directories
+
+    def exists(self, path):
+        full_path = self._path(path)
+        return full_path in self._files or full_path in self._directories
+
+    def get_file_signature(self, path):
+        """Gets a cheap signature of a file which changes whenever the file is modified.
+
+        Args:
+            path (str): The path relative to the configuration directory.
+
+        Returns:
+            Tuple: The modification time of the file in nanoseconds and its size in bytes.
+        """
+        with self._lock:
+            try:
+                contents, mtime = self._files[self._path(path)]
+            except KeyError:
+                raise FileNotFoundError("Cannot find {}".format(path))
+        return mtime, len(contents)
+
+    def get_device_screens(self):
+        """Returns the device screen file if it exists, else None."""
+        device_screens_path = os.path.join(DEVICE_SCREENS_FOLDER, DEVICE_SCREEN_FILE)
+        if self.exists(device_screens_path):
+            return device_screens_path, self._get_xml(device_screens_path)
+        else:
+            return None
+
+    def get_file_paths(
+        self,
+        directory: str,
+        extension: str = "",
+        excluded_directories=EXCLUDED_DIRECTORIES,
+        max_workers: int = WALK_WORKERS,
+    ):
+        """Generator giving the paths of all files inside a directory, recursively searching all subdirectories, in the
+        same order as FileAccess.get_file_paths (sorted by name, files before subdirectories).
+
+        Args:
+            directory: The directory to search.
+            extension: Optional file extension to filter by.
+            excluded_directories: Glob patterns of directory names not to search.
+            max_workers: Not used.
+
+        Yields:
+            str: The path to the file.
+        """
+        if not self.is_dir(directory):
+            return
+        directories = []
+        for path in self.listdir(directory):
+            name = os.path.basename(path)
+            if not self.is_dir(path):
+                if name.endswith(extension):
+                    yield path
+            elif not any(fnmatchcase(name, pattern) for pattern in excluded_directories):
+                directories.append(path)
+        for path in directories:
+            yield from self.get_file_paths(path, extension, excluded_directories)
+
+    def read_dashboard_file(self):
+        self._logger.info(f"Reading {DASHBOARD_DB_FILENAME} file")
+        return io.StringIO(self._text(DASHBOARD_DB_FILENAME)).readlines()
+
+    def write_dashboard_file(self, db_lines: list[str]):
+        self._logger.info(f"Writing {DASHBOARD_DB_FILENAME} file")
+        self._store(DASHBOARD_DB_FILENAME, "".join(db_lines))
+
+    def commit_changes(self, files, removed_files=(), removed_folders=(), created_directories=()):
+        """Make a set of changes to files together.
+
+        Args:
+            files: dictionary of path to the new contents of the file as text, bytes or an xml document
+            removed_files: paths of files to remove
+            removed_folders: paths of folders to remove recursively
+            created_directories: paths of directories to create
+        """
+        with self._lock:
+            for folder in removed_folders:
+                if self.is_dir(folder):
+                    self.delete_folder(folder)
+            for filename in removed_files:
+                if self.exists(filename):
+                    self.remove_file(filename)
+            for directory in created_directories:
+                self._make_directories(self._path(directory))
+            for filename, contents in files.items():
+                self._make_directories(os.path.dirname(self._path(filename)))
+                if isinstance(contents, (minidom.Node, LazyXmlDocument)):
+                    self.write_xml_file(filename, contents)
+                else:
+                    self._logger.info("Writing file {0}".format(filename))
+                    self._store(filename, contents)
@@ -1,13 +1,131 @@
+import copy
 import os
-from typing import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Sequence
 
 from src.common_upgrades.sql_utilities import SqlConnection
-from src.file_access import FileAccess
+from src.common_upgrades.step_result_cache import StepResultCache
+from src.common_upgrades.utils.resources import RESOURCE_PATHS
+from src.common_upgrades.xml_transforms import XmlTransform, fuse_xml_transforms
+from src.file_access import CachingFileAccess, FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
 
 VERSION_FILENAME = os.path.join("configurations", "config_version.txt")
 
+# Maximum number of independent upgrade steps to run at the same time
+STEP_WORKERS = 4
+
+
+def _resources(upgrade_step: UpgradeStep) -> tuple[frozenset, frozenset] | None:
+    """The resources an upgrade step uses and writes.
+
+    Args:
+        upgrade_step: the step
+
+    Returns: tuple of the resources the step reads or writes and those it writes; None if the step
+        does not declare them
+    """
+    reads = getattr(upgrade_step, "reads", None)
+    writes = getattr(upgrade_step, "writes", None)
+    if not isinstance(reads, (set, frozenset)) or not isinstance(writes, (set, frozenset)):
+        return None
+    return frozenset(reads) | frozenset(writes), frozenset(writes)
+
+
+def upgrade_waves(
+    upgrade_steps: Sequence[tuple[str, UpgradeStep]],
+) -> Iterator[list[tuple[str, UpgradeStep]]]:
+    """Group consecutive upgrade steps into waves which can be run at the same time.
+
+    A step joins the current wave if it does not write anything a step in the wave uses and does not
+    use anything a step in the wave writes. Steps which do not declare their resources are always in
+    a wave on their own.
+
+    Args:
+        upgrade_steps: version and step of each step to perform, in order
+
+    Yields: list of version and step of each step in a wave, in order
+    """
+    wave = []
+    wave_uses, wave_writes = frozenset(), frozenset()
+    for version, upgrade_step in upgrade_steps:
+        resources = _resources(upgrade_step)
+        if wave and (
+            resources is None
+            or wave_uses is None
+            or resources[1] & wave_uses
+            or resources[0] & wave_writes
+        ):
+            yield wave
+            wave = []
+            wave_uses, wave_writes = frozenset(), frozenset()
+        wave.append((version, upgrade_step))
+        if resources is None:
+            wave_uses = None
+        elif wave_uses is not None:
+            wave_uses, wave_writes = wave_uses | resources[0], wave_writes | resources[1]
+    if wave:
+        yield wave
+
+
+def _xml_transforms(
+    upgrade_step: UpgradeStep, file_access: FileAccess, logger: LocalLogger
+) -> list[XmlTransform] | None:
+    """The xml edits an upgrade step makes.
+
+    Returns: list of transforms; None if the step does not give its edits
+    """
+    try:
+        transforms = upgrade_step.xml_transforms(file_access, logger)
+    except Exception:
+        # Leave the step to report the error when it is performed
+        return None
+    return transforms if isinstance(transforms, list) else None
+
+
+def fused_xml_runs(
+    upgrade_steps: Sequence[tuple[str, UpgradeStep]], file_access: FileAccess, logger: LocalLogger
+) -> Iterator[tuple[list[list[XmlTransform]] | None, list[tuple[str, UpgradeStep]]]]:
+    """Find the runs of consecutive upgrade steps whose xml edits can be applied in a single pass.
+
+    A run is a sequence of steps which only edit xml, at least two of which have edits to make.
+
+    Args:
+        upgrade_steps: version and step of each step to perform, in order
+        file_access: file access
+        logger: logger
+
+    Yields: tuple of the transforms of each step in a run, or None for steps which are not part of
+        a run, and the version and step of each step, in order
+    """
+    pending = []
+    run = []
+    run_transforms = []
+
+    def end_run() -> Iterator[tuple[list[list[XmlTransform]] | None, list]]:
+        if sum(1 for transforms in run_transforms if transforms) >= 2:
+            if pending:
+                yield None, list(pending)
+                pending.clear()
+            yield list(run_transforms), list(run)
+        else:
+            pending.extend(run)
+        run.clear()
+        run_transforms.clear()
+
+    for version, upgrade_step in upgrade_steps:
+        transforms = _xml_transforms(upgrade_step, file_access, logger)
+        if transforms is not None:
+            run.append((version, upgrade_step))
+            run_transforms.append(transforms)
+        else:
+            yield from end_run()
+            pending.append((version, upgrade_step))
+    yield from end_run()
+    if pending:
+        yield None, pending
+
 
 class UpgradeError(Exception):
     """There is an error in the upgrade"""
@@ -24,6 +142,7 @@ class Upgrade(object):
         logger: LocalLogger | None,
         upgrade_steps: Sequence[tuple[str, UpgradeStep | None]],
         git_repo,  # noqa
+        step_cache: StepResultCache | None = None,
     ) -> None:
         """Constructor
 
@@ -32,6 +151,8 @@ class Upgrade(object):
             logger (LocalLogger): an object to log data
             upgrade_steps: steps to perform an upgrade from scratch
             git_repo: git repository to perform committing, tagging on version upgrade.
+            step_cache: cache of the results of steps, to replay rather than perform steps whose
+                files are unchanged since they were last performed; None to always perform them
         """
         self._file_access = file_access
         self._logger = logger
@@ -41,6 +162,7 @@ class Upgrade(object):
             raise UpgradeError()
         self._upgrade_steps = upgrade_steps
         self._git_repo = git_repo
+        self._step_cache = step_cache
 
     def get_version_number(self) -> str | None:
         """Find the current version number of the repository. If there is no version number the
@@ -70,23 +192,35 @@ class Upgrade(object):
         self._logger.info("Config at initial version {0}".format(current_version))
         upgrade = False
         final_upgrade_version = ""
-        with SqlConnection():
-            for version, upgrade_step in self._upgrade_steps:
-                if version == current_version:
-                    upgrade = True
-                    if upgrade_step is None:
-                        self._logger.info("Current config is on latest version, no upgrade needed")
-
-                if upgrade:
-                    final_upgrade_version = version
-                    if upgrade_step is not None:
-                        self._logger.info("Upgrading from {0}".format(version))
-                        self._logger.info("-------------------------")
-                        result = upgrade_step.perform(self._file_access, self._logger)
+        steps_to_perform = []
+        for version, upgrade_step in self._upgrade_steps:
+            if version == current_version:
+                upgrade = True
+                if upgrade_step is None:
+                    self._logger.info("Current config is on latest version, no upgrade needed")
+
+            if upgrade:
+                final_upgrade_version = version
+                if upgrade_step is not None:
+                    steps_to_perform.append((version, upgrade_step))
+
+        try:
+            with SqlConnection():
+                for transforms, steps in fused_xml_runs(
+                    steps_to_perform, self._file_access, self._logger
+                ):
+                    if transforms is not None:
+                        result = self._perform_fused(steps, transforms)
+                        if result != 0:
+                            return result
+                        continue
+                    for wave in upgrade_waves(steps):
+                        result = self._perform_wave(wave)
                         if result != 0:
                             return result
-                        self._file_access.write_version_number(version, VERSION_FILENAME)
-                        self._commit_tag_and_push(version)
+        finally:
+            if self._step_cache is not None:
+                self._step_cache.save()
 
         if upgrade:
             self._file_access.write_version_number(final_upgrade_version, VERSION_FILENAME)
@@ -97,8 +231,155 @@ class Upgrade(object):
             self._logger.error("Unknown version number {0}".format(current_version))
             return -1
 
-    def _commit_tag_and_push(self, version: str, final: bool = False) -> None:
-        self._git_repo.git.add(A=True)
+    def _perform_wave(self, wave: list[tuple[str, UpgradeStep]]) -> int | str:
+        """Perform a wave of upgrade steps, at the same time if there is more than one, then write
+        and commit the changes of each version in order.
+
+        When steps are run at the same time the commit for each version only contains the files of
+        the resources its step writes. The changes of a step are only written once every step
+        before it has succeeded; if a step fails the changes of the steps after it are discarded.
+
+        Args:
+            wave: version and step of each step in the wave, in order
+
+        Returns: status code 0 for success; not 0 for failure
+        """
+        assert self._file_access is not None
+        assert self._logger is not None
+        for version, _ in wave:
+            self._logger.info("Upgrading from {0}".format(version))
+            self._logger.info("-------------------------")
+
+        if len(wave) == 1:
+            outcomes = [self._perform_step(*wave[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=STEP_WORKERS) as executor:
+                futures = [
+                    executor.submit(self._perform_step, version, upgrade_step)
+                    for version, upgrade_step in wave
+                ]
+            outcomes = [future.result() for future in futures if future.exception() is None]
+            if len(outcomes) < len(futures):
+                for _, transaction, _ in outcomes:
+                    transaction.discard()
+                raise next(future.exception() for future in futures if future.exception())
+
+        try:
+            for (version, upgrade_step), (result, transaction, key) in zip(wave, outcomes):
+                if result != 0:
+                    return result
+                transaction.finish()
+                if key is not None:
+                    self._step_cache.record(key, upgrade_step, self._file_access)
+                self._file_access.write_version_number(version, VERSION_FILENAME)
+                if len(wave) == 1:
+                    self._commit_tag_and_push(version)
+                else:
+                    paths = [
+                        path
+                        for resource in upgrade_step.writes
+                        for path in RESOURCE_PATHS[resource]
+                    ]
+                    self._commit_tag_and_push(version, paths=[VERSION_FILENAME] + paths)
+        finally:
+            # Changes which have been written are not affected
+            for _, transaction, _ in outcomes:
+                transaction.discard()
+        return 0
+
+    def _perform_step(
+        self, version: str, upgrade_step: UpgradeStep
+    ) -> tuple[int | str, CachingFileAccess, str | None]:
+        """Perform an upgrade step, or replay its result from the step cache if the files it uses
+        are the same as when it was last performed.
+
+        The changes the step makes through its file access are staged in the transaction returned,
+        and only made when it is finished, so that steps run at the same time can be written in
+        order. A step which fails has its changes discarded.
+
+        Args:
+            version: the version the step upgrades from
+            upgrade_step: the step
+
+        Returns: status code 0 for success, not 0 for failure; the transaction holding the changes
+            of the step; and the key to record the result of the step under in the step cache, or
+            None if it is not to be recorded
+        """
+        key = None
+        if self._step_cache is not None:
+            key = self._step_cache.key(version, upgrade_step, self._file_access)
+
+        # Steps in a wave run at the same time, so each stages its changes in its own file access
+        step_file_access = copy.copy(self._file_access)
+        with CachingFileAccess(step_file_access, write_on_exit=False) as transaction:
+            if key is not None and self._step_cache.replay(key, step_file_access):
+                return 0, transaction, None
+            result = upgrade_step.perform(step_file_access, self._logger)
+            if result != 0:
+                transaction.discard()
+        return result, transaction, key
+
+    def _perform_fused(
+        self, steps: list[tuple[str, UpgradeStep]], transforms: list[list[XmlTransform]]
+    ) -> int:
+        """Perform a run of upgrade steps which only edit xml, applying all of their edits in a
+        single pass over the files, then write and commit the files of each version in order.
+
+        Args:
+            steps: version and step of each step in the run, in order
+            transforms: the transforms of each step
+
+        Returns: status code 0 for success; not 0 for failure
+        """
+        assert self._file_access is not None
+        assert self._logger is not None
+        self._logger.info(
+            "Applying the xml changes from {0} to {1} in a single pass".format(
+                steps[0][0], steps[-1][0]
+            )
+        )
+        written, error = fuse_xml_transforms(self._file_access, transforms)
+
+        for (version, _), files in zip(steps, written):
+            self._logger.info("Upgrading from {0}".format(version))
+            self._logger.info("-------------------------")
+            for path, xml in files.items():
+                self._file_access.write_xml_file(path, xml)
+            self._file_access.write_version_number(version, VERSION_FILENAME)
+            self._commit_tag_and_push(version)
+
+        if error is not None:
+            # The xml of the files was changed by the steps which were not written
+            self._file_access.forget_xml_files()
+            self._logger.info("Upgrading from {0}".format(steps[len(written)][0]))
+            self._logger.error("Unable to perform upgrade, caught error: {}".format(error))
+            return 1
+        return 0
+
+    def _stage(self, paths: list[str] | None) -> None:
+        """Stage changes to the repository.
+
+        Args:
+            paths: the paths to stage additions, changes and deletions in; None to stage everything
+        """
+        if paths is None:
+            self._git_repo.git.add(A=True)
+            return
+        # git will not stage a path which is neither on disk nor in the index. Relative paths, such
+        # as VERSION_FILENAME, are relative to the configuration base rather than the current
+        # directory
+        config_base = self._file_access.config_base or ""
+        paths = [
+            p
+            for p in paths
+            if os.path.exists(os.path.join(config_base, p)) or self._git_repo.git.ls_files("--", p)
+        ]
+        self._git_repo.git.add("-A", "--", *paths)
+
+    def _commit_tag_and_push(
+        self, version: str, final: bool = False, paths: list[str] | None = None
+    ) -> None:
+        self._stage(paths)
         commit_message = f"IBEX Upgrade {'from' if not final else 'to'} {version}"
         self._git_repo.index.commit(commit_message)
         tag_name = f"{self._git_repo.active_branch}_{version}{'_upgrade' if not final else ''}"
@@ -6,6 +6,30 @@ class UpgradeStep(object):
 
     __metaclass__ = ABCMeta
 
+    # The resources (see src.common_upgrades.utils.resources) the step reads and writes. None if
+    # they are not known, in which case the step is run on its own.
+    reads = None
+    writes = None
+
+    # Whether the result of the step only depends on the files of the resources it reads and
+    # writes, so it can be replayed from the step cache. Steps which decide what to do from
+    # anything else, e.g. the git history or the database, must leave this False.
+    cacheable = False
+
+    def xml_transforms(self, file_access, logger):  # noqa
+        """The edits the step makes, if all it does is edit the xml files of the configurations,
+        components and synoptics. Consecutive steps which give their edits are applied in a single
+        pass over the files.
+
+        Args:
+            file_access (FileAccess): file access
+            logger (LocalLogger): logger
+
+        Returns: list of XmlTransform; None if the step does anything else
+
+        """
+        return None
+
     @abstractmethod
     def perform(self, file_access, logger):  # noqa
         """Perform the upgrade step this should be implemented
@@ -1,16 +1,72 @@
 import os
-import typing
-import xml.etree.ElementTree as ET
+import re
+from concurrent.futures import ThreadPoolExecutor
+from xml.sax.saxutils import escape
 
 from src.common_upgrades.utils.constants import COMPONENT_FOLDER, CONFIG_FOLDER
+from src.common_upgrades.utils.resources import CONFIG_XML
 from src.file_access import FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
 
+META_FILE = "meta.xml"
+
+# Number of meta.xml files which are changed at the same time
+META_WORKERS = 8
+
+# The closing tag of the root element at the end of a file, and the whitespace before it
+ROOT_CLOSING_TAG = re.compile(rb"(\s*)(</[^>]+>\s*)$")
+
+# A root element with no content at the end of a file
+EMPTY_ROOT = re.compile(rb"<([^\s/>]+)([^>]*?)\s*/>(\s*)$")
+
+# The whitespace after the start tag of the root element
+ROOT_START_TAG = re.compile(rb"<(?![?!])[^>]*>(\s*)")
+
+
+def add_element_to_root(contents: bytes, element: bytes) -> bytes:
+    """Add an element to the end of the root element of some xml, leaving the rest of it as it is.
+    The element is indented like the first child of the root element.
+
+    Args:
+        contents: the xml
+        element: the element to add
+
+    Returns:
+        the xml with the element added
+    """
+    closing_tag = ROOT_CLOSING_TAG.search(contents)
+    if closing_tag is not None:
+        start_tag = ROOT_START_TAG.search(contents)
+        indent = start_tag.group(1) if start_tag is not None else b""
+        return (
+            contents[: closing_tag.start()]
+            + indent
+            + element
+            + closing_tag.group(1)
+            + closing_tag.group(2)
+        )
+
+    empty_root = EMPTY_ROOT.search(contents)
+    if empty_root is not None:
+        name, attributes, end = empty_root.groups()
+        return contents[: empty_root.start()] + b"<%s%s>%s</%s>%s" % (
+            name,
+            attributes,
+            element,
+            name,
+            end,
+        )
+    raise ValueError("Can not find the end of the root element")
+
 
 class UpgradeStepAddMetaXmlElement(UpgradeStep):
     """An upgrade step that adds a passed element to the meta.xml for a configuration."""
 
+    reads = frozenset({CONFIG_XML})
+    writes = frozenset({CONFIG_XML})
+    cacheable = True
+
     def __init__(self, tag: str, tag_value: str) -> None:
         self.tag = tag
         self.tag_value = tag_value
@@ -19,6 +75,10 @@ class UpgradeStepAddMetaXmlElement(UpgradeStep):
     def perform(self, file_access: FileAccess, logger: LocalLogger) -> int:
         """Change meta.xml configuration schema to have self.tag element
 
+        The meta.xml of every configuration and component which does not mention the tag, found by
+        searching the bytes of the files, has the element added to the end of it without changing
+        the rest of the file.
+
         Args:
             file_access (FileAccess): file access
             logger (LocalLogger): logger
@@ -26,28 +86,38 @@ class UpgradeStepAddMetaXmlElement(UpgradeStep):
         Returns: exit code 0 success
 
         """
-        for folder in os.walk(CONFIG_FOLDER):
-            if CONFIG_FOLDER != folder[0]:
-                if self._add_tag_to_meta_in_folders(folder, logger) != 0:
-                    return -1
-        for folder in os.walk(COMPONENT_FOLDER):
-            if COMPONENT_FOLDER != folder[0]:
-                if self._add_tag_to_meta_in_folders(folder, logger) != 0:
-                    return -1
-        return 0
-
-    def _add_tag_to_meta_in_folders(
-        self, folder: tuple[typing.Any, list, list], logger: LocalLogger
-    ) -> int:
         try:
-            meta_file_path = os.path.join(folder[0] + r"\meta.xml")
-            meta_xml = ET.parse(meta_file_path)
-            if len(meta_xml.getroot().findall(self.tag)) == 0:
-                xml_tag = ET.SubElement(meta_xml.getroot(), self.tag)
-                xml_tag.text = self.tag_value
-                meta_xml.write(meta_file_path)
-        except IOError as e:
-            logger.error("IOError: {}".format(e))
+            paths = self._meta_files(file_access)
+            found = file_access.search_files(paths, self._tag_patterns(), max_workers=META_WORKERS)
+            paths = [path for path in paths if not found[path]]
+
+            element = "<{0}>{1}</{0}>".format(self.tag, escape(self.tag_value)).encode("utf-8")
+            with ThreadPoolExecutor(max_workers=META_WORKERS) as executor:
+                contents = list(
+                    executor.map(
+                        lambda path: add_element_to_root(file_access.read_bytes(path), element),
+                        paths,
+                    )
+                )
+            for path, new_contents in zip(paths, contents):
+                file_access.write_file(path, new_contents, mode="wb", file_full=True)
+        except (IOError, ValueError) as e:
+            logger.error("{}: {}".format(type(e).__name__, e))
             return -1
 
         return 0
+
+    @staticmethod
+    def _meta_files(file_access: FileAccess) -> list[str]:
+        """The meta.xml of every component and configuration, skipping a missing folder."""
+        return [
+            os.path.join(config, META_FILE)
+            for folder in (COMPONENT_FOLDER, CONFIG_FOLDER)
+            if file_access.is_dir(folder)
+            for config in sorted(file_access.listdir(folder))
+            if file_access.is_dir(config)
+        ]
+
+    def _tag_patterns(self) -> list[str]:
+        """The ways an element with the tag can start in a file."""
+        return ["<{}{}".format(self.tag, end) for end in (">", "/>", " ", "\t", "\r", "\n")]
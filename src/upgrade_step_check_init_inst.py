@@ -5,6 +5,19 @@ from src.file_access import FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
 
+# Old style pre and post command hook methods
+HOOK_PATTERNS = ["precmd", "postcmd"]
+
+# Number of files searched at once
+SEARCH_WORKERS = 8
+
+HOOKS_FOUND_MESSAGE = (
+    "Pre or post cmd methods found in the files below, these will now no longer be "
+    "hooked into the command. Please ensure they are hooked using the new style"
+    " of inserting these methods, "
+    "see https://github.com/ISISComputingGroup/ibex_user_manual/wiki/Pre-and-Post-Command-Hooks"
+)
+
 
 class UpgradeStepCheckInitInst(UpgradeStep):
     """An upgrade step to check if the instrument uses the old style of loading in pre and post cmd.
@@ -12,6 +25,42 @@ class UpgradeStepCheckInitInst(UpgradeStep):
     localmod in init_<inst>.py in the Instrument/Settings/config/NDX<inst>/Python folder.
     """
 
+    def find_hooks(self, paths: list[str], file_access: FileAccess) -> list[tuple[str, int, str]]:
+        """Find every line using pre and post cmd methods in a set of files.
+
+        The files are searched concurrently in a single pass each, only files containing a method
+        are then read line by line through the file access to find the line numbers.
+
+        Args:
+            paths (List[str]): The paths of the files to search.
+            file_access (FileAccess): file access
+
+        Returns: list of tuples of the path, line number and line for each use of a method.
+        """
+        hits = file_access.search_files(paths, HOOK_PATTERNS, max_workers=SEARCH_WORKERS)
+        found = []
+        for path in paths:
+            if not hits[path]:
+                continue
+            with file_access.open_lines(path) as lines:
+                for line_number, line in enumerate(lines, start=1):
+                    if any(pattern in line for pattern in hits[path]):
+                        found.append((path, line_number, line.strip()))
+        return found
+
+    def _report(self, hooks: list[tuple[str, int, str]]) -> str | int:
+        """Format the uses of pre and post cmd methods as an error message.
+
+        Args:
+            hooks (List[Tuple[str, int, str]]): The path, line number and line of each use.
+
+        Returns: 0 if there are no uses; error message listing every use if there are.
+        """
+        if not hooks:
+            return 0
+        lines = ["{}:{}: {}".format(path, line_number, line) for path, line_number, line in hooks]
+        return "{}\n{}\n".format(HOOKS_FOUND_MESSAGE, "\n".join(lines))
+
     def search_files(self, files: list[str], root: str, file_access: FileAccess) -> str | int:
         """Search files from a root folder for pre and post cmd methods.
 
@@ -22,20 +71,8 @@ class UpgradeStepCheckInitInst(UpgradeStep):
 
         Returns: 0 if pre & post cmd methods in old style aren't present; error message if they are.
         """
-        for file_name in files:
-            if file_name.startswith("init_"):
-                search_file = open(os.path.join(root, file_name))
-                search_file_contents = search_file.read()
-                if "precmd" in search_file_contents or "postcmd" in search_file_contents:
-                    return (
-                        "Pre or post cmd methods found in {} these will now no longer be "
-                        "hooked into the command. Please ensure they are hooked using the new style"
-                        " of inserting these methods, "
-                        "see https://github.com/ISISComputingGroup/ibex_user_manual/wiki/Pre-and-Post-Command-Hooks".format(
-                            search_file.name
-                        )
-                    )
-        return 0
+        init_files = [os.path.join(root, f) for f in files if f.startswith("init_")]
+        return self._report(self.find_hooks(init_files, file_access))
 
     def search_folder(self, folder: str, file_access: FileAccess) -> str | int:
         """Search folders for the search string.
@@ -44,15 +81,13 @@ class UpgradeStepCheckInitInst(UpgradeStep):
             folder (str): The folder to search through.
             file_access (FileAccess): file access
 
-        Returns: 0 if pre & post cmd methods in old style aren't present; error message if they are.
+        Returns: 0 if pre & post cmd methods in old style aren't present; error message listing
+            every use if they are.
         """
-        file_returns = ""
+        init_files = []
         for root, _, files in os.walk(folder):
-            # Search files for pre and post cmd methods
-            file_search_return = self.search_files(files, root, file_access)
-            if file_search_return != 0:
-                file_returns += "{}\n".format(file_search_return)
-        return 0 if file_returns == "" else file_returns
+            init_files.extend(os.path.join(root, f) for f in sorted(files) if f.startswith("init_"))
+        return self._report(self.find_hooks(init_files, file_access))
 
     def perform(self, file_access: FileAccess, logger: LocalLogger) -> str | int:
         """Check if file exists and if the file includes pre and post cmd methods.
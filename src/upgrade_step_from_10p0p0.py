@@ -1,6 +1,7 @@
 import os
 from xml.dom.minidom import Text
 
+from src.common_upgrades.utils.resources import DEVICE_SCREENS
 from src.file_access import FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
@@ -9,6 +10,10 @@ from src.upgrade_step import UpgradeStep
 class RemoveReflDeviceScreen(UpgradeStep):
     """Remove reflectometry device screen from all configs and components"""
 
+    reads = frozenset({DEVICE_SCREENS})
+    writes = frozenset({DEVICE_SCREENS})
+    cacheable = True
+
     path = os.path.join("configurations", "devices", "screens.xml")
 
     def perform(self, file_access: FileAccess, logger: LocalLogger) -> int:
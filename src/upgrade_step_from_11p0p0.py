@@ -1,9 +1,10 @@
 # ruff: noqa: E501
-import socket
 
 from src.common_upgrades.change_macros_in_xml import ChangeMacrosInXML
 from src.common_upgrades.change_pvs_in_xml import ChangePVsInXML
 from src.common_upgrades.utils.macro import Macro
+from src.common_upgrades.utils.resources import CONFIG_XML, SYNOPTICS
+from src.common_upgrades.xml_transforms import XmlTransform, apply_xml_transforms
 from src.file_access import FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
@@ -16,6 +17,10 @@ class RenameMercurySoftwarePressureControlMacros(UpgradeStep):
     Rename the old macros to the new ones.
     """
 
+    reads = frozenset({CONFIG_XML, SYNOPTICS})
+    writes = frozenset({CONFIG_XML, SYNOPTICS})
+    cacheable = True
+
     rename_macros = [
         (Macro("FULL_AUTO_PRESSURE_1"), Macro("FLOW_SPC_PRESSURE_1")),
         (Macro("FULL_AUTO_PRESSURE_2"), Macro("FLOW_SPC_PRESSURE_2")),
@@ -128,17 +133,26 @@ class RenameMercurySoftwarePressureControlMacros(UpgradeStep):
         ),
     ]
 
+    def xml_transforms(self, file_access: FileAccess, logger: LocalLogger) -> list[XmlTransform]:
+        hostname = file_access.instrument
+        ioc_name = "MERCURY_01"
+        if hostname != "NDXPOLREF":
+            return []
+        change_macros_in_xml = ChangeMacrosInXML(file_access, logger)
+        transforms = [change_macros_in_xml.change_macros_transform(ioc_name, self.rename_macros)]
+        for macro in self.new_macros:
+            transforms.append(
+                change_macros_in_xml.add_macro_transform(
+                    ioc_name, macro[0], macro[1], macro[2], macro[3]
+                )
+            )
+        change_pvs_in_xml = ChangePVsInXML(file_access, logger)
+        transforms.extend(change_pvs_in_xml.change_pv_name_transforms("FULL_AUTO", "SPC"))
+        return transforms
+
     def perform(self, file_access: FileAccess, logger: LocalLogger) -> int:
         try:
-            hostname = socket.gethostname()
-            ioc_name = "MERCURY_01"
-            if hostname == "NDXPOLREF":
-                change_macros_in_xml = ChangeMacrosInXML(file_access, logger)
-                change_macros_in_xml.change_macros(ioc_name, self.rename_macros)
-                for macro in self.new_macros:
-                    change_macros_in_xml.add_macro(ioc_name, macro[0], macro[1], macro[2], macro[3])
-                change_pvs_in_xml = ChangePVsInXML(file_access, logger)
-                change_pvs_in_xml.change_pv_name("FULL_AUTO", "SPC")
+            apply_xml_transforms(file_access, self.xml_transforms(file_access, logger))
             return 0
         except Exception as e:
             logger.error("Unable to perform upgrade, caught error: {}".format(e))
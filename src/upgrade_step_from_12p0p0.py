@@ -1,6 +1,7 @@
 import os
 import re
 
+from src.common_upgrades.template_usage_index import TemplateUsageIndex
 from src.common_upgrades.utils.constants import SUPPORT_ROOT
 from src.file_access import FileAccess
 from src.local_logger import LocalLogger
@@ -15,17 +16,36 @@ class UpgradeJawsForPositionAutosave(UpgradeStep):
         result = 0
 
         # Get database files using 'slits.template'.
-        database_files = []
-        for path in file_access.get_file_paths(SUPPORT_ROOT, ".substitutions"):
-            if file_access.file_contains(path, "slits.template"):
-                database_files.append(os.path.basename(path).split(".")[0] + ".db")
+        template_index = TemplateUsageIndex(file_access, logger)
+        template_index.refresh(SUPPORT_ROOT)
+        template_index.save()
+        database_files = [
+            os.path.basename(path).split(".")[0] + ".db"
+            for path in template_index.files_using_template("slits.template", SUPPORT_ROOT)
+        ]
 
         logger.info(f"Database files using slits.template: {' '.join(database_files)}")
+        if len(database_files) == 0:
+            return result
+
+        # A single pattern matching a load of any of the database files, compiled once for both
+        # the whole file prefilter and the per line check.
+        database_alternation = "|".join(re.escape(name) for name in sorted(set(database_files)))
+        database_pattern = rf"[\\|/\"](?:{database_alternation})"
+        database_regex = re.compile(database_pattern)
+        database_bytes_regex = re.compile(database_pattern.encode())
 
         # Check if batch files load any of the database files.
         for path in file_access.get_file_paths(file_access.config_base, ".cmd"):
             logger.info(f"Checking '{path}'")
 
+            # Skip files that never load any of the database files before splitting into lines.
+            raw_contents = file_access.read_bytes(path)
+            if b"dbLoadRecords" not in raw_contents or not database_bytes_regex.search(
+                raw_contents
+            ):
+                continue
+
             # Read file.
             contents = file_access.open_file(path)
 
@@ -35,13 +55,10 @@ class UpgradeJawsForPositionAutosave(UpgradeStep):
                 new_line = line
 
                 if (
-                    any(
-                        re.search(rf"[\\|\/|\"]{database_file}", line)
-                        for database_file in database_files
-                    )
-                    and "dbLoadRecords" in line
+                    "dbLoadRecords" in line
                     and "IFINIT_FROM_AS" not in line
                     and "IFNOTINIT_FROM_AS" not in line
+                    and database_regex.search(line)
                 ):
                     logger.info(f"Adding macros to {line}")
                     new_line = re.sub(
@@ -1,7 +1,7 @@
 # ruff: noqa: E501
 import os
-import socket
 
+from src.common_upgrades.utils.resources import CONTROLLER_SETTINGS
 from src.file_access import FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
@@ -10,6 +10,10 @@ from src.upgrade_step import UpgradeStep
 class AddOscCollimMovingIndicator(UpgradeStep):
     """Update oscillatingCollimator.cmd on LET and MERLIN to load stability check DB"""
 
+    reads = frozenset({CONTROLLER_SETTINGS})
+    writes = frozenset({CONTROLLER_SETTINGS})
+    cacheable = True
+
     path = os.path.join("configurations", "galil", "oscillatingCollimator.cmd")
     new_lines = [
         "\n# load stability check DB",
@@ -18,7 +22,7 @@ class AddOscCollimMovingIndicator(UpgradeStep):
 
     def perform(self, file_access: FileAccess, logger: LocalLogger) -> int:
         try:
-            hostname = socket.gethostname()
+            hostname = file_access.instrument
             if hostname == "NDXLET" or hostname == "NDXMERLIN":
                 file_access.write_file(self.path, self.new_lines, mode="a")
             return 0
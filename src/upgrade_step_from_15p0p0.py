@@ -3,20 +3,12 @@ import os
 
 import git
 
-from src.common_upgrades.utils.constants import CONFIG_ROOT, EPICS_ROOT
+from src.common_upgrades.utils.constants import CONFIG_ROOT, CONTROLLERS, EPICS_ROOT
+from src.common_upgrades.utils.resources import CONTROLLER_SETTINGS
 from src.file_access import FileAccess
 from src.git_utils import RepoFactory
 from src.upgrade_step import UpgradeStep
 
-CONTROLLERS = [
-    "galil",
-    "galilmul",
-    "mclennan",
-    "linmot",
-    "smc100_01",
-    "twincat",
-]
-
 # Unix timestamp of 2024/09/01 at midnight.
 # This is the date when motor settings were copied. Commits more recent than this will not have
 # been included in the copy, and therefore will have to be sorted out manually.
@@ -28,20 +20,29 @@ class UpgradeFrom15p0p0(UpgradeStep):
     Remove motor settings, since they have now been copied into motorExtensions instead.
     """
 
+    reads = frozenset({CONTROLLER_SETTINGS})
+    writes = frozenset({CONTROLLER_SETTINGS})
+
     def perform(self, file_access: FileAccess, logger: logging.Logger) -> int:
         try:
             controller_dirs: list[str] = [os.path.join(CONFIG_ROOT, c) for c in CONTROLLERS]
             existent_controller_dirs: list[str] = [c for c in controller_dirs if os.path.exists(c)]
 
-            for directory in existent_controller_dirs:
-                logger.info(f"Checking for recent commits in {directory}")
-
-                repo: git.Repo = RepoFactory.get_repo(directory)
-                commit_timestamps: str = repo.git.log("--format=%ct", directory)
+            if existent_controller_dirs:
+                logger.info(f"Checking for recent commits in {', '.join(existent_controller_dirs)}")
 
-                integer_commit_timestamps: list[int] = [int(ts) for ts in commit_timestamps.split()]
+                repo: git.Repo = RepoFactory.get_repo(CONFIG_ROOT)
+                # git stops walking the history at the first commit older than --since, and -1
+                # stops at the first newer commit, so this does not depend on the history length
+                recent_commit: str = repo.git.log(
+                    f"--since=@{CUTOFF_TIMESTAMP + 1}",
+                    "-1",
+                    "--format=%ct",
+                    "--",
+                    *existent_controller_dirs,
+                )
 
-                if any(ts > CUTOFF_TIMESTAMP for ts in integer_commit_timestamps):
+                if recent_commit.strip():
                     motorext_path = os.path.join(
                         EPICS_ROOT,
                         "support",
@@ -3,6 +3,7 @@ import logging
 import git
 
 from src.common_upgrades.utils.constants import CALIB_FOLDER
+from src.common_upgrades.utils.resources import CALIBRATIONS_REPO
 from src.file_access import FileAccess
 from src.git_utils import RepoFactory
 from src.upgrade_step import UpgradeStep
@@ -13,6 +14,9 @@ class UpgradeFrom25p2p1(UpgradeStep):
     Update calibrations repo to use new (gitlab) remote.
     """
 
+    reads = frozenset({CALIBRATIONS_REPO})
+    writes = frozenset({CALIBRATIONS_REPO})
+
     def perform(self, file_access: FileAccess, logger: logging.Logger) -> int:
         repo: git.Repo = RepoFactory.get_repo(CALIB_FOLDER)
         repo.remote("origin").set_url("https://gitlab.stfc.ac.uk/isisexperimentcontrols/common.git")
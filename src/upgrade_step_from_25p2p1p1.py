@@ -1,4 +1,5 @@
 from src.common_upgrades import change_pv_in_dashboard as dashboard
+from src.common_upgrades.utils.resources import DASHBOARD_DB
 from src.file_access import FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
@@ -17,6 +18,10 @@ class UpgradeFrom25p2p1p1(UpgradeStep):
     Add calculation to dashboard to display when in test clock, also add FWDR to base IOCs.
     """
 
+    reads = frozenset({DASHBOARD_DB})
+    writes = frozenset({DASHBOARD_DB})
+    cacheable = True
+
     def perform(self, file_access: FileAccess, logger: LocalLogger) -> int:
         reader = dashboard.ChangePvInDashboard(file_access, logger)
         pass_fail = 0
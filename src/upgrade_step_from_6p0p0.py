@@ -1,7 +1,7 @@
-import socket
-
 from src.common_upgrades.change_macros_in_xml import ChangeMacrosInXML
 from src.common_upgrades.utils.macro import Macro
+from src.common_upgrades.utils.resources import CONFIG_XML
+from src.common_upgrades.xml_transforms import XmlTransform, apply_xml_transforms
 from src.file_access import FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
@@ -12,23 +12,33 @@ class SetDanfysikDisableAutoonoffMacros(UpgradeStep):
     is true, settings will be displayed on the Danfysik OPI allowing automatic power turn on/off.
     """
 
+    reads = frozenset({CONFIG_XML})
+    writes = frozenset({CONFIG_XML})
+    cacheable = True
+
+    def xml_transforms(self, file_access: FileAccess, logger: LocalLogger) -> list[XmlTransform]:
+        hostname = file_access.instrument
+        ioc_name = "DFKPS"
+        if hostname != "NDXEMU":
+            return []
+        change_macros_in_xml = ChangeMacrosInXML(file_access, logger)
+        return [
+            change_macros_in_xml.add_macro_transform(
+                ioc_name,
+                Macro("DISABLE_AUTOONOFF", "0"),
+                "^(0|1)$",
+                "Disable automatic PSU on/off feature",
+                "1",
+            ),
+            change_macros_in_xml.change_macros_transform(
+                ioc_name,
+                [(Macro("DISABLE_AUTOONOFF"), Macro("DISABLE_AUTOONOFF", "0"))],
+            ),
+        ]
+
     def perform(self, file_access: FileAccess, logger: LocalLogger) -> int:
         try:
-            hostname = socket.gethostname()
-            ioc_name = "DFKPS"
-            if hostname == "NDXEMU":
-                change_macros_in_xml = ChangeMacrosInXML(file_access, logger)
-                change_macros_in_xml.add_macro(
-                    ioc_name,
-                    Macro("DISABLE_AUTOONOFF", "0"),
-                    "^(0|1)$",
-                    "Disable automatic PSU on/off feature",
-                    "1",
-                )
-                change_macros_in_xml.change_macros(
-                    ioc_name,
-                    [(Macro("DISABLE_AUTOONOFF"), Macro("DISABLE_AUTOONOFF", "0"))],
-                )
+            apply_xml_transforms(file_access, self.xml_transforms(file_access, logger))
             return 0
         except Exception as e:
             logger.error("Unable to perform upgrade, caught error: {}".format(e))
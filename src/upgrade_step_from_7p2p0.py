@@ -3,6 +3,8 @@ from future.builtins import input
 from src.common_upgrades.change_pvs_in_xml import ChangePVsInXML
 from src.common_upgrades.synoptics_and_device_screens import SynopticsAndDeviceScreens
 from src.common_upgrades.utils.constants import MOTION_SET_POINTS_FOLDER
+from src.common_upgrades.utils.resources import DEVICE_SCREENS, GITIGNORE, SYNOPTICS
+from src.common_upgrades.xml_transforms import apply_xml_transforms
 from src.file_access import CachingFileAccess, FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
@@ -10,10 +12,26 @@ from src.upgrade_step import UpgradeStep
 ERROR_CODE = -1
 SUCCESS_CODE = 0
 
+# Old and new names of the motion set point PVs, in the order they are changed
+MOTION_SET_POINT_PV_CHANGES = [
+    ("COORD1", "COORD0"),
+    ("COORD2", "COORD1"),
+    ("COORD0:NO_OFFSET", "COORD0:NO_OFF"),
+    ("COORD1:NO_OFFSET", "COORD1:NO_OFF"),
+    ("COORD0:RBV:OFFSET", "COORD0:RBV:OFF"),
+    ("COORD1:RBV:OFFSET", "COORD1:RBV:OFF"),
+    ("COORD0:LOOKUP:SET:RBV", "COORD0:SET:RBV"),
+    ("COORD1:LOOKUP:SET:RBV", "COORD1:SET:RBV"),
+]
+
 
 class IgnoreRcpttSynoptics(UpgradeStep):
     """Adds "rcptt_*" files to .gitignore, so that test synoptics are no longer committed."""
 
+    reads = frozenset({GITIGNORE})
+    writes = frozenset({GITIGNORE})
+    cacheable = True
+
     file_name = ".gitignore"
     text_content = [
         "*.py[co]",
@@ -71,17 +89,15 @@ class UpgradeMotionSetPoints(UpgradeStep):
             with CachingFileAccess(file_access):
                 changer = ChangePVsInXML(file_access, logger)
 
-                changer.change_pv_name("COORD1", "COORD0")
-                changer.change_pv_name("COORD2", "COORD1")
-
-                changer.change_pv_name("COORD0:NO_OFFSET", "COORD0:NO_OFF")
-                changer.change_pv_name("COORD1:NO_OFFSET", "COORD1:NO_OFF")
-
-                changer.change_pv_name("COORD0:RBV:OFFSET", "COORD0:RBV:OFF")
-                changer.change_pv_name("COORD1:RBV:OFFSET", "COORD1:RBV:OFF")
-
-                changer.change_pv_name("COORD0:LOOKUP:SET:RBV", "COORD0:SET:RBV")
-                changer.change_pv_name("COORD1:LOOKUP:SET:RBV", "COORD1:SET:RBV")
+                # All the renames are made in one pass over the blocks and synoptics
+                apply_xml_transforms(
+                    file_access,
+                    [
+                        transform
+                        for old_pv_name, new_pv_name in MOTION_SET_POINT_PV_CHANGES
+                        for transform in changer.change_pv_name_transforms(old_pv_name, new_pv_name)
+                    ],
+                )
 
                 if file_access.exists(MOTION_SET_POINTS_FOLDER):
                     print("")
@@ -117,6 +133,10 @@ class UpgradeMotionSetPoints(UpgradeStep):
 
 
 class ChangeReflOPITarget(UpgradeStep):
+    reads = frozenset({SYNOPTICS, DEVICE_SCREENS})
+    writes = frozenset({SYNOPTICS, DEVICE_SCREENS})
+    cacheable = True
+
     REFL_OPI_TARGET_OLD = "Reflectometry Front Panel"
     REFL_OPI_TARGET_NEW = "Reflectometry OPI"
 
@@ -1,6 +1,6 @@
 # ruff: noqa: E501
-import socket
 
+from src.common_upgrades.utils.resources import CONTROLLER_SETTINGS
 from src.file_access import FileAccess
 from src.local_logger import LocalLogger
 from src.upgrade_step import UpgradeStep
@@ -9,9 +9,13 @@ from src.upgrade_step import UpgradeStep
 class ChangeLETCollimatorCmd(UpgradeStep):
     """Change the LET/MERLIN collimator code to load in the new LET/MERLIN-specific db file."""
 
+    reads = frozenset({CONTROLLER_SETTINGS})
+    writes = frozenset({CONTROLLER_SETTINGS})
+    cacheable = True
+
     def perform(self, file_access: FileAccess, logger: LocalLogger) -> int:
         try:
-            hostname = socket.gethostname()
+            hostname = file_access.instrument
             if hostname == "NDXLET" or hostname == "NDXMERLIN":
                 file_access.write_file(
                     "configurations\\galil\\oscillatingCollimator.cmd",
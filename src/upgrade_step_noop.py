@@ -5,6 +5,21 @@ from src.upgrade_step import UpgradeStep
 class UpgradeStepNoOp(UpgradeStep):
     """An upgrade step that does nothing. This can be used to add a upgrade to the latest production version."""
 
+    reads = frozenset()
+    writes = frozenset()
+
+    def xml_transforms(self, file_access, logger):
+        """No edits to make
+
+        Args:
+            file_access (FileAccess): file access
+            logger (LocalLogger): logger
+
+        Returns: empty list of transforms
+
+        """
+        return []
+
     def perform(self, file_access, logger):
         """No nothing return sucess
 
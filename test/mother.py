@@ -5,7 +5,7 @@ from typing import Generator, LiteralString
 from xml.dom import minidom
 from xml.dom.minidom import Document, Node
 
-from src.file_access import FileAccess
+from src.file_access import FileAccess, LazyLines
 from src.local_logger import LocalLogger
 
 
@@ -30,7 +30,7 @@ class FileAccessStub(FileAccess):
     SYNOPTIC_FILENAME = "synoptic_file"
 
     def __init__(self) -> None:
-        self.config_base = None
+        super(FileAccessStub, self).__init__(LoggingStub(), None)
         self.wrote_version = None
         self.write_filename = None
         self.write_file_contents = None
@@ -50,12 +50,28 @@ class FileAccessStub(FileAccess):
     def open_file(self, filename: str) -> list[LiteralString]:
         return EXAMPLE_GLOBALS_FILE.splitlines()
 
+    def open_lines(self, filename: str) -> LazyLines:
+        return LazyLines("\n".join(self.open_file(filename)).encode("utf-8"), "utf-8")
+
     def write_xml_file(self, filename: str, xml: Node) -> None:
         self.write_filename = filename
         self.write_file_contents = xml.toxml()
         self.write_file_dict[self.write_filename] = self.write_file_contents
 
-    def open_xml_file(self, filename: str) -> Document:
+    def commit_changes(
+        self,
+        files: dict[str, str | bytes | Node],
+        removed_files: typing.Iterable[str] = (),
+        removed_folders: typing.Iterable[str] = (),
+        created_directories: typing.Iterable[str] = (),
+    ) -> None:
+        for filename, contents in files.items():
+            if isinstance(contents, Node):
+                self.write_xml_file(filename, contents)
+            else:
+                self.write_file(filename, [contents], file_full=True)
+
+    def open_xml_file(self, filename: str, read_only: bool = False) -> Document:
         return minidom.parseString("".join(self.open_file(filename)))
 
     def listdir(self, dir: str) -> list[str]:
@@ -72,10 +88,14 @@ class FileAccessStub(FileAccess):
             return False
         return self.existing_files[path]
 
-    def get_config_files(self, file_type: str) -> Generator[tuple[str, Document], typing.Any, None]:
+    def get_config_files(
+        self, file_type: str, read_only: bool = False
+    ) -> Generator[tuple[str, Document], typing.Any, None]:
         yield file_type, self.open_xml_file(file_type)
 
-    def get_synoptic_files(self) -> Generator[tuple[str, Document], typing.Any, None]:
+    def get_synoptic_files(
+        self, read_only: bool = False
+    ) -> Generator[tuple[str, Document], typing.Any, None]:
         yield "synoptic_file", self.open_xml_file("synoptic_file")
 
     def get_file_paths(
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+from hamcrest import assert_that, contains_exactly, empty, has_item, is_, starts_with
+from mock import patch
+from mother import LoggingStub
+
+from src.atomic_bulk_writer import AtomicBulkWriter
+
+
+class TestAtomicBulkWriter(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        self.logger = LoggingStub()
+        self.writer = AtomicBulkWriter(self.logger)
+        self.files = {
+            os.path.join(self.root, folder, "{}.xml".format(i)): "<blocks/>"
+            for folder in ("config1", "config2")
+            for i in range(3)
+        }
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_GIVEN_files_written_WHEN_not_replaced_THEN_no_file_changed(self):
+        self.writer.write(self.files)
+
+        for path in self.files:
+            assert_that(os.path.exists(path), is_(False))
+
+    def test_GIVEN_files_written_WHEN_replaced_THEN_files_in_place_and_directories_synced_once(
+        self,
+    ):
+        with patch("src.atomic_bulk_writer._sync_directory") as sync_directory:
+            self.writer.write(self.files)
+            self.writer.replace()
+
+        for path, contents in self.files.items():
+            assert_that(self._read(path), is_(contents))
+        assert_that(
+            [call.args[0] for call in sync_directory.call_args_list],
+            contains_exactly(
+                os.path.join(self.root, "config1"), os.path.join(self.root, "config2")
+            ),
+        )
+        assert_that(
+            sorted(os.listdir(os.path.join(self.root, "config1"))), is_(["0.xml", "1.xml", "2.xml"])
+        )
+        assert_that(self.logger.log, has_item(starts_with("Wrote 6 files")))
+
+    def test_GIVEN_file_can_not_be_written_WHEN_write_THEN_temporary_files_removed(self):
+        self.files[os.path.join(self.root, "config1", "bad.xml")] = None
+
+        with self.assertRaises(TypeError):
+            self.writer.write(self.files)
+
+        for folder in ("config1", "config2"):
+            assert_that(os.listdir(os.path.join(self.root, folder)), is_(empty()))
+
+    def test_GIVEN_files_WHEN_write_THEN_every_file_synced(self):
+        with patch("src.atomic_bulk_writer.os.fsync") as fsync:
+            self.writer.write(self.files)
+
+        assert_that(fsync.call_count, is_(len(self.files)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,551 @@
+import copy
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from xml.dom import minidom
+
+from hamcrest import (
+    assert_that,
+    contains_exactly,
+    contains_string,
+    empty,
+    has_item,
+    has_key,
+    has_length,
+    is_,
+    is_not,
+    same_instance,
+)
+from mock import patch
+from mother import LoggingStub
+
+from src.file_access import CachingFileAccess, FileAccess
+
+
+class TestFileAccessFilePaths(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        self.file_access = FileAccess(LoggingStub(), self.root)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _create_files(self, *paths):
+        for path in paths:
+            full_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as f:
+                f.write(path)
+
+    def test_GIVEN_files_in_tree_WHEN_get_file_paths_without_extension_THEN_all_files_in_order(
+        self,
+    ):
+        self._create_files(
+            os.path.join("b", "2.cmd"), os.path.join("a", "c", "3.txt"), os.path.join("a", "1.cmd")
+        )
+
+        result = list(self.file_access.get_file_paths(self.root))
+
+        assert_that(
+            result,
+            contains_exactly(
+                os.path.join(self.root, "a", "1.cmd"),
+                os.path.join(self.root, "a", "c", "3.txt"),
+                os.path.join(self.root, "b", "2.cmd"),
+            ),
+        )
+
+    def test_GIVEN_files_in_tree_WHEN_get_file_paths_with_extension_THEN_only_matching_files(
+        self,
+    ):
+        self._create_files(os.path.join("a", "1.cmd"), os.path.join("a", "2.txt"), "3.cmd")
+
+        result = list(self.file_access.get_file_paths(self.root, ".cmd"))
+
+        assert_that(
+            result,
+            contains_exactly(
+                os.path.join(self.root, "3.cmd"), os.path.join(self.root, "a", "1.cmd")
+            ),
+        )
+
+    def test_GIVEN_build_and_git_directories_WHEN_get_file_paths_THEN_directories_pruned(self):
+        self._create_files(
+            os.path.join(".git", "x.cmd"),
+            os.path.join("mod", "O.windows-x64", "x.cmd"),
+            os.path.join("mod", "bin", "x.cmd"),
+            os.path.join("mod", "db", "x.cmd"),
+            os.path.join("mod", "Db", "x.cmd"),
+        )
+
+        result = list(self.file_access.get_file_paths(self.root, ".cmd"))
+
+        assert_that(result, contains_exactly(os.path.join(self.root, "mod", "Db", "x.cmd")))
+
+    def test_GIVEN_many_top_level_directories_WHEN_walked_in_parallel_THEN_same_result_as_serial(
+        self,
+    ):
+        self._create_files(
+            *[os.path.join(str(i), str(j), "file.cmd") for i in range(10) for j in range(5)]
+        )
+
+        serial = list(self.file_access.get_file_paths(self.root, ".cmd", max_workers=1))
+        parallel = list(self.file_access.get_file_paths(self.root, ".cmd", max_workers=4))
+
+        assert_that(parallel, is_(serial))
+        assert_that(len(parallel), is_(50))
+
+
+class TestFileAccessSearchFiles(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        self.file_access = FileAccess(LoggingStub(), self.root)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _create_file(self, name, contents):
+        with open(os.path.join(self.root, name), "w") as f:
+            f.write(contents)
+        return name
+
+    def test_GIVEN_files_WHEN_search_files_THEN_patterns_found_in_each_file_returned(self):
+        first = self._create_file("first.py", "def precmd():\n    pass\n")
+        second = self._create_file("second.py", "def postcmd():\n    precmd()\n")
+        third = self._create_file("third.py", "nothing here")
+
+        result = self.file_access.search_files([first, second, third], ["precmd", "postcmd"])
+
+        assert_that(
+            result,
+            is_({first: {"precmd"}, second: {"precmd", "postcmd"}, third: set()}),
+        )
+
+    def test_GIVEN_overlapping_patterns_WHEN_search_files_THEN_all_patterns_found(self):
+        name = self._create_file("file.txt", "abcde")
+
+        result = self.file_access.search_files([name], ["abc", "b", "cde", "abcd"])
+
+        assert_that(result[name], is_({"abc", "b", "cde", "abcd"}))
+
+    def test_GIVEN_empty_file_WHEN_search_files_THEN_nothing_found(self):
+        name = self._create_file("empty.txt", "")
+
+        result = self.file_access.search_files([name], ["precmd"])
+
+        assert_that(result[name], is_(empty()))
+
+    def test_GIVEN_file_which_can_not_be_mapped_WHEN_pattern_spans_blocks_THEN_pattern_found(
+        self,
+    ):
+        name = self._create_file("file.txt", "xxxxprecmdxxxx")
+
+        with (
+            patch("src.file_access.mmap.mmap", side_effect=ValueError()),
+            patch("src.file_access.SEARCH_BLOCK_SIZE", 6),
+        ):
+            result = self.file_access.search_files([name], ["precmd", "missing"])
+
+        assert_that(result[name], is_({"precmd"}))
+
+    def test_GIVEN_many_files_WHEN_searched_in_parallel_THEN_same_result_as_serial(self):
+        names = [self._create_file(f"{i}.txt", "precmd" if i % 3 == 0 else "") for i in range(12)]
+
+        serial = self.file_access.search_files(names, ["precmd"])
+        parallel = self.file_access.search_files(names, ["precmd"], max_workers=4)
+
+        assert_that(parallel, is_(serial))
+
+    def test_GIVEN_file_WHEN_file_contains_THEN_result_from_search(self):
+        name = self._create_file("file.txt", "line one\nline two\n")
+
+        assert_that(self.file_access.file_contains(name, "two"), is_(True))
+        assert_that(self.file_access.file_contains(name, "three"), is_(False))
+
+
+class TestFileAccessLines(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        self.file_access = FileAccess(LoggingStub(), self.root)
+        with open(os.path.join(self.root, "lines.txt"), "wb") as f:
+            f.write(b"first  \r\nsecond\rthird\n\nlast")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_GIVEN_file_WHEN_open_lines_THEN_lines_stripped_as_open_file(self):
+        with self.file_access.open_lines("lines.txt") as lines:
+            result = list(lines)
+
+        assert_that(result, contains_exactly("first", "second", "third", "", "last"))
+        assert_that(self.file_access.open_file("lines.txt"), contains_exactly(*result))
+
+    def test_GIVEN_file_WHEN_first_line_used_THEN_rest_of_file_not_split(self):
+        with self.file_access.open_lines("lines.txt") as lines:
+            result = lines[0]
+            found = len(lines._lines)
+
+        assert_that(result, is_("first"))
+        assert_that(found, is_(1))
+
+    def test_GIVEN_file_WHEN_lines_sliced_THEN_lines_of_slice_returned(self):
+        with self.file_access.open_lines("lines.txt") as lines:
+            assert_that(lines[1:3], contains_exactly("second", "third"))
+            assert_that(lines[-2:], contains_exactly("", "last"))
+            assert_that(lines[-1], is_("last"))
+            assert_that(len(lines), is_(5))
+
+    def test_GIVEN_empty_file_WHEN_open_lines_THEN_no_lines(self):
+        with open(os.path.join(self.root, "empty.txt"), "w"):
+            pass
+
+        with self.file_access.open_lines("empty.txt") as lines:
+            assert_that(list(lines), is_(empty()))
+
+    def test_GIVEN_file_written_in_transaction_WHEN_open_lines_THEN_staged_lines_returned(self):
+        with CachingFileAccess(self.file_access):
+            self.file_access.write_file("lines.txt", ["changed"])
+
+            assert_that(list(self.file_access.open_lines("lines.txt")), contains_exactly("changed"))
+
+
+class TestFileAccessXmlCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        self.file_access = FileAccess(LoggingStub(), self.root)
+        self._write("blocks.xml", "<blocks/>")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, name, contents):
+        with open(os.path.join(self.root, name), "w") as f:
+            f.write(contents)
+
+    def test_GIVEN_file_opened_read_only_WHEN_opened_read_only_again_THEN_same_xml_returned(self):
+        xml = self.file_access.open_xml_file("blocks.xml", read_only=True)
+
+        assert_that(
+            self.file_access.open_xml_file("blocks.xml", read_only=True), is_(same_instance(xml))
+        )
+
+    def test_GIVEN_file_opened_read_only_WHEN_opened_to_change_THEN_kept_xml_handed_over_once(
+        self,
+    ):
+        xml = self.file_access.open_xml_file("blocks.xml", read_only=True)
+
+        assert_that(self.file_access.open_xml_file("blocks.xml"), is_(same_instance(xml)))
+        assert_that(self.file_access.open_xml_file("blocks.xml"), is_not(same_instance(xml)))
+
+    def test_GIVEN_xml_opened_to_change_WHEN_changed_without_writing_THEN_later_reads_unchanged(
+        self,
+    ):
+        xml = self.file_access.open_xml_file("blocks.xml")
+        xml.documentElement.setAttribute("name", "changed")
+
+        for read_only in (True, False):
+            result = self.file_access.open_xml_file("blocks.xml", read_only=read_only)
+
+            assert_that(result.documentElement.getAttribute("name"), is_(""))
+
+    def test_GIVEN_file_opened_WHEN_changed_on_disk_THEN_parsed_again(self):
+        xml = self.file_access.open_xml_file("blocks.xml", read_only=True)
+        self._write("blocks.xml", "<blocks><block/></blocks>")
+
+        result = self.file_access.open_xml_file("blocks.xml")
+
+        assert_that(result, is_not(same_instance(xml)))
+        assert_that(result.getElementsByTagName("block"), has_length(1))
+
+    def test_GIVEN_file_opened_WHEN_written_THEN_parsed_again(self):
+        xml = self.file_access.open_xml_file("blocks.xml")
+        self.file_access.write_xml_file("blocks.xml", xml)
+
+        assert_that(self.file_access.open_xml_file("blocks.xml"), is_not(same_instance(xml)))
+
+    def test_GIVEN_copies_used_by_threads_WHEN_files_opened_and_forgotten_THEN_no_error(self):
+        names = ["{}.xml".format(i) for i in range(50)]
+        for name in names:
+            self._write(name, "<blocks/>")
+
+        def open_and_forget(file_access):
+            for _ in range(20):
+                for name in names:
+                    file_access.open_xml_file(name, read_only=True)
+                file_access.forget_xml_files(folder=self.root)
+                file_access.forget_directories(self.root)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [
+                executor.submit(open_and_forget, copy.copy(self.file_access)) for _ in range(4)
+            ]
+            for future in futures:
+                future.result()
+
+    def test_GIVEN_xml_changed_in_discarded_transaction_WHEN_opened_again_THEN_parsed_again(self):
+        with CachingFileAccess(self.file_access) as transaction:
+            xml = self.file_access.open_xml_file("blocks.xml")
+            xml.documentElement.setAttribute("name", "changed")
+            transaction.discard()
+
+        result = self.file_access.open_xml_file("blocks.xml")
+
+        assert_that(result.documentElement.getAttribute("name"), is_(""))
+
+
+class TestFileAccessDirectoryModel(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_access = FileAccess(LoggingStub(), self.temp_dir.name)
+        self.component_folder = os.path.join(self.temp_dir.name, "components")
+        self.config_folder = os.path.join(self.temp_dir.name, "configurations")
+        for folder in (self.component_folder, self.config_folder):
+            os.makedirs(os.path.join(folder, "config1"))
+            with open(os.path.join(folder, "config1", "blocks.xml"), "w") as f:
+                f.write("<blocks/>")
+            with open(os.path.join(folder, "README.txt"), "w") as f:
+                f.write("not a configuration")
+        for name, folder in (
+            ("COMPONENT_FOLDER", self.component_folder),
+            ("CONFIG_FOLDER", self.config_folder),
+        ):
+            patcher = patch("src.file_access.{}".format(name), folder)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _config_paths(self):
+        return [path for path, _ in self.file_access.get_config_files("blocks.xml")]
+
+    def test_GIVEN_configurations_WHEN_get_config_files_twice_THEN_folders_scanned_once(self):
+        with patch("src.file_access.os.scandir", wraps=os.scandir) as scandir:
+            self._config_paths()
+            result = self._config_paths()
+
+        assert_that(scandir.call_count, is_(2))
+        assert_that(
+            result,
+            contains_exactly(
+                os.path.join(self.component_folder, "config1", "blocks.xml"),
+                os.path.join(self.config_folder, "config1", "blocks.xml"),
+            ),
+        )
+
+    def test_GIVEN_configurations_scanned_WHEN_configuration_added_THEN_it_is_found(self):
+        self._config_paths()
+        new_blocks = os.path.join(self.config_folder, "config2", "blocks.xml")
+        self.file_access.create_directories(new_blocks)
+        self.file_access.write_file(new_blocks, ["<blocks/>"])
+
+        assert_that(self._config_paths(), has_item(new_blocks))
+
+    def test_GIVEN_configurations_WHEN_get_config_files_THEN_files_not_parsed_until_used(self):
+        with patch("src.file_access.minidom.parse", wraps=minidom.parse) as parse:
+            files = list(self.file_access.get_config_files("blocks.xml"))
+            assert_that(parse.call_count, is_(0))
+
+            result = files[0][1].documentElement.tagName
+
+        assert_that(result, is_("blocks"))
+        assert_that(parse.call_count, is_(1))
+
+    def test_GIVEN_configuration_WHEN_raw_bytes_of_file_THEN_contents_returned_without_parsing(
+        self,
+    ):
+        _, xml = next(iter(self.file_access.get_config_files("blocks.xml")))
+
+        assert_that(xml.raw_bytes(), is_(b"<blocks/>"))
+        assert_that(xml.parsed, is_(False))
+
+    def test_GIVEN_configuration_used_WHEN_written_THEN_xml_written(self):
+        path, xml = next(iter(self.file_access.get_config_files("blocks.xml")))
+        xml.documentElement.setAttribute("name", "changed")
+
+        self.file_access.write_xml_file(path, xml)
+
+        with open(path) as f:
+            assert_that(f.read(), is_('<?xml version="1.0" ?>\n<blocks name="changed"/>\n'))
+
+
+class TestCachingFileAccess(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        self.file_access = FileAccess(LoggingStub(), self.root)
+        self.names = ["{}.xml".format(i) for i in range(5)]
+        for name in self.names:
+            with open(os.path.join(self.root, name), "w") as f:
+                f.write("<blocks/>")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _read(self, name):
+        with open(os.path.join(self.root, name)) as f:
+            return f.read()
+
+    def _edit_all(self):
+        for name in self.names:
+            xml = self.file_access.open_xml_file(name)
+            xml.documentElement.setAttribute("name", name)
+            self.file_access.write_xml_file(name, xml)
+
+    def test_GIVEN_more_writes_than_cache_size_WHEN_context_left_THEN_all_written(self):
+        caching_file_access = CachingFileAccess(self.file_access, max_cached_documents=2)
+        with caching_file_access:
+            self._edit_all()
+            assert_that(len(caching_file_access.cached_writes), is_(2))
+            assert_that(self._read("0.xml"), is_("<blocks/>"))
+
+        for name in self.names:
+            assert_that(
+                self._read(name), is_('<?xml version="1.0" ?>\n<blocks name="{}"/>\n'.format(name))
+            )
+
+    def test_GIVEN_written_document_changed_after_spilled_WHEN_context_left_THEN_change_written(
+        self,
+    ):
+        caching_file_access = CachingFileAccess(self.file_access, max_cached_documents=1)
+        with caching_file_access:
+            xml = self.file_access.open_xml_file("0.xml")
+            self.file_access.write_xml_file("0.xml", xml)
+            self._edit_all()
+            assert_that(
+                caching_file_access._spilled_writes, has_key(os.path.join(self.root, "0.xml"))
+            )
+            xml.documentElement.setAttribute("changed", "yes")
+
+            assert_that(
+                self.file_access.open_xml_file("0.xml").documentElement.getAttribute("changed"),
+                is_("yes"),
+            )
+
+        assert_that(self._read("0.xml"), contains_string('changed="yes"'))
+
+    def test_GIVEN_staged_write_WHEN_opened_again_THEN_staged_xml_returned(self):
+        with CachingFileAccess(self.file_access, max_cached_documents=1):
+            self._edit_all()
+            xml = self.file_access.open_xml_file("0.xml")
+
+            assert_that(xml.documentElement.getAttribute("name"), is_("0.xml"))
+
+    def test_GIVEN_staged_writes_WHEN_error_in_context_THEN_nothing_written_and_staging_removed(
+        self,
+    ):
+        caching_file_access = CachingFileAccess(self.file_access, max_cached_documents=1)
+        with self.assertRaises(ValueError), caching_file_access:
+            self._edit_all()
+            staging_dir = caching_file_access._staging_dir
+            raise ValueError()
+
+        for name in self.names:
+            assert_that(self._read(name), is_("<blocks/>"))
+        assert_that(os.path.exists(staging_dir), is_(False))
+
+    def test_GIVEN_text_changes_WHEN_in_context_THEN_reads_see_them_and_disk_unchanged_until_left(
+        self,
+    ):
+        with CachingFileAccess(self.file_access):
+            self.file_access.write_file("0.xml", ["<iocs/>"])
+            self.file_access.write_file("globals.txt", ["A=1"])
+            self.file_access.write_file("globals.txt", ["B=2"], mode="a")
+            self.file_access.rename_file("1.xml", "renamed.xml")
+            self.file_access.remove_file("2.xml")
+
+            assert_that(self.file_access.open_file("globals.txt"), contains_exactly("A=1", "B=2"))
+            assert_that(self.file_access.line_exists("globals.txt", "B=2\n"), is_(True))
+            assert_that(
+                self.file_access.open_xml_file("0.xml").documentElement.tagName, is_("iocs")
+            )
+            assert_that(self.file_access.read_bytes("renamed.xml"), is_(b"<blocks/>"))
+            assert_that(self.file_access.exists("1.xml"), is_(False))
+            assert_that(
+                sorted(os.path.basename(f) for f in self.file_access.listdir("")),
+                contains_exactly("0.xml", "3.xml", "4.xml", "globals.txt", "renamed.xml"),
+            )
+            assert_that(os.path.exists(os.path.join(self.root, "globals.txt")), is_(False))
+            assert_that(os.path.exists(os.path.join(self.root, "2.xml")), is_(True))
+
+        assert_that(self._read("0.xml"), is_("<iocs/>\n"))
+        assert_that(self._read("globals.txt"), is_("A=1\nB=2\n"))
+        assert_that(self._read("renamed.xml"), is_("<blocks/>"))
+        assert_that(
+            sorted(os.listdir(self.root)),
+            contains_exactly("0.xml", "3.xml", "4.xml", "globals.txt", "renamed.xml"),
+        )
+
+    def test_GIVEN_file_with_windows_line_endings_WHEN_appended_to_THEN_existing_line_endings_kept(
+        self,
+    ):
+        with open(os.path.join(self.root, "globals.txt"), "wb") as f:
+            f.write(b"A=1\r\nB=2\r\n")
+
+        with CachingFileAccess(self.file_access):
+            self.file_access.write_file("globals.txt", ["C=3"], mode="a")
+
+        with open(os.path.join(self.root, "globals.txt"), "rb") as f:
+            assert_that(
+                f.read(), is_(b"A=1\r\nB=2\r\n" + "C=3\n".replace("\n", os.linesep).encode())
+            )
+
+    def test_GIVEN_folder_deleted_and_changes_discarded_WHEN_context_left_THEN_nothing_changed(
+        self,
+    ):
+        os.makedirs(os.path.join(self.root, "galil"))
+        with CachingFileAccess(self.file_access) as transaction:
+            self.file_access.delete_folder(os.path.join(self.root, "galil"))
+            self.file_access.write_file("0.xml", ["<iocs/>"])
+            assert_that(self.file_access.is_dir("galil"), is_(False))
+            transaction.discard()
+
+        assert_that(os.path.isdir(os.path.join(self.root, "galil")), is_(True))
+        assert_that(self._read("0.xml"), is_("<blocks/>"))
+
+    def test_GIVEN_not_written_on_exit_WHEN_context_left_THEN_written_when_finished(self):
+        caching_file_access = CachingFileAccess(
+            self.file_access, max_cached_documents=1, write_on_exit=False
+        )
+        with caching_file_access:
+            self._edit_all()
+
+        assert_that(self._read("0.xml"), is_("<blocks/>"))
+        caching_file_access.finish()
+        for name in self.names:
+            assert_that(self._read(name), contains_string('name="{}"'.format(name)))
+
+    def test_GIVEN_file_can_not_be_written_WHEN_committed_THEN_no_file_changed(self):
+        with (
+            self.assertRaises(OSError),
+            patch("src.file_access.os.fsync", side_effect=[None, OSError()]),
+        ):
+            with CachingFileAccess(self.file_access):
+                self.file_access.write_file("0.xml", ["<iocs/>"])
+                self.file_access.write_file("1.xml", ["<iocs/>"])
+                self.file_access.remove_file("2.xml")
+
+        assert_that(sorted(os.listdir(self.root)), contains_exactly(*self.names))
+        assert_that(self._read("0.xml"), is_("<blocks/>"))
+
+    def test_GIVEN_nested_contexts_WHEN_inner_left_THEN_changes_only_written_when_outer_left(self):
+        with CachingFileAccess(self.file_access):
+            with CachingFileAccess(self.file_access):
+                self.file_access.write_file("0.xml", ["<iocs/>"])
+                self.file_access.remove_file("1.xml")
+
+            assert_that(self.file_access.open_file("0.xml"), contains_exactly("<iocs/>"))
+            assert_that(self.file_access.exists("1.xml"), is_(False))
+            assert_that(self._read("0.xml"), is_("<blocks/>"))
+
+        assert_that(self._read("0.xml"), is_("<iocs/>\n"))
+        assert_that(os.path.exists(os.path.join(self.root, "1.xml")), is_(False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import os
+import tempfile
+import unittest
+
+from hamcrest import assert_that, contains_exactly, contains_string, instance_of, is_, none
+from mock import MagicMock as Mock
+from mock import patch
+
+from fleet import (
+    InstrumentResult,
+    instrument_steps,
+    summarise,
+    upgrade_fleet,
+    upgrade_instrument,
+    upgrade_shared_steps,
+)
+from src.common_upgrades.utils.resources import CONFIG_XML, DATABASE
+from src.upgrade_step_noop import UpgradeStepNoOp
+
+
+class TestFleet(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.log_root = os.path.join(self.temp_dir.name, "logs")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _upgrade_instrument(self, config_root):
+        with patch.dict(os.environ):
+            return upgrade_instrument(config_root, self.log_root)
+
+    def _step(self, writes):
+        step = Mock()
+        step.writes = writes
+        step.perform.return_value = 0
+        return step
+
+    def test_GIVEN_settings_area_WHEN_upgrade_instrument_THEN_upgraded_as_that_instrument(self):
+        config_root = os.path.join(self.temp_dir.name, "NDXLET")
+        seen = {}
+
+        def perform_upgrade():
+            seen["config_root"] = os.environ["ICPCONFIGROOT"]
+            return 0
+
+        upgrade = Mock()
+        upgrade.return_value.upgrade.side_effect = perform_upgrade
+        with (
+            patch("src.upgrade.Upgrade", upgrade),
+            patch("src.git_utils.RepoFactory.get_repo") as get_repo,
+        ):
+            result = self._upgrade_instrument(config_root)
+
+        assert_that(result.instrument, is_("NDXLET"))
+        assert_that(result.status, is_(0))
+        assert_that(result.error, none())
+        assert_that(upgrade.call_args.kwargs["file_access"].instrument, is_("NDXLET"))
+        assert_that(seen["config_root"], is_(os.path.join(config_root, "configurations")))
+        get_repo.assert_called_once_with(config_root)
+        assert_that(os.path.isdir(os.path.join(self.log_root, "NDXLET")), is_(True))
+
+    def test_GIVEN_upgrade_raises_WHEN_upgrade_instrument_THEN_failed_with_error(self):
+        config_root = os.path.join(self.temp_dir.name, "NDXMERLIN")
+
+        with patch("src.git_utils.RepoFactory.get_repo", side_effect=Exception("not a repo")):
+            result = self._upgrade_instrument(config_root)
+
+        assert_that(result.succeeded, is_(False))
+        assert_that(result.error, is_("Exception: not a repo"))
+
+    def test_GIVEN_settings_areas_not_in_git_WHEN_upgrade_fleet_THEN_all_fail_in_order(self):
+        config_roots = [os.path.join(self.temp_dir.name, name) for name in ("NDXB", "NDXA")]
+        for config_root in config_roots:
+            os.makedirs(config_root)
+
+        results = upgrade_fleet(config_roots, self.log_root, max_workers=2, shared_steps=False)
+
+        assert_that([result.instrument for result in results], contains_exactly("NDXB", "NDXA"))
+        for result in results:
+            assert_that(result.succeeded, is_(False))
+            assert_that(result.error, contains_string("is not under version control"))
+
+    def test_GIVEN_steps_which_write_shared_resources_WHEN_instrument_steps_THEN_they_do_nothing(
+        self,
+    ):
+        config_step = self._step(frozenset({CONFIG_XML}))
+        unknown_step = self._step(None)
+
+        result = instrument_steps(
+            [
+                ("1.0.0", config_step),
+                ("1.0.1", self._step(frozenset({DATABASE}))),
+                ("1.0.2", unknown_step),
+                ("1.0.3", None),
+            ]
+        )
+
+        assert_that(
+            [version for version, _ in result], contains_exactly("1.0.0", "1.0.1", "1.0.2", "1.0.3")
+        )
+        assert_that(result[0][1], is_(config_step))
+        assert_that(result[1][1], instance_of(UpgradeStepNoOp))
+        assert_that(result[2][1], is_(unknown_step))
+        assert_that(result[3][1], none())
+
+    def test_GIVEN_steps_WHEN_upgrade_shared_steps_THEN_only_shared_steps_performed_until_one_fails(
+        self,
+    ):
+        config_root = os.path.join(self.temp_dir.name, "NDXLET")
+        config_step = self._step(frozenset({CONFIG_XML}))
+        failing_step = self._step(frozenset({DATABASE}))
+        failing_step.perform.return_value = 1
+        later_step = self._step(frozenset({DATABASE}))
+        steps = [
+            ("1.0.0", config_step),
+            ("1.0.1", failing_step),
+            ("1.0.2", later_step),
+            ("1.0.3", None),
+        ]
+
+        with patch.dict(os.environ), patch("upgrade.UPGRADE_STEPS", steps):
+            result = upgrade_shared_steps(config_root, self.log_root)
+
+        assert_that(result.status, is_(1))
+        config_step.perform.assert_not_called()
+        failing_step.perform.assert_called_once()
+        later_step.perform.assert_not_called()
+
+    def test_GIVEN_results_WHEN_summarise_THEN_line_per_instrument_and_totals(self):
+        results = [
+            InstrumentResult("NDXLET", "LET", 0, 1.25),
+            InstrumentResult("NDXMERLIN", "MERLIN", 1, 2.0),
+            InstrumentResult("NDXIMAT", "IMAT", -1, 0.5, "Exception: not a repo"),
+        ]
+
+        result = summarise(results).splitlines()
+
+        assert_that(
+            result,
+            contains_exactly(
+                "Instrument  Result      Time  Details",
+                "NDXLET      OK          1.2s",
+                "NDXMERLIN   FAILED      2.0s  status 1",
+                "NDXIMAT     FAILED      0.5s  Exception: not a repo",
+                "1 of 3 instruments upgraded, 2 failed",
+            ),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
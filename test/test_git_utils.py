@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+import git
+from hamcrest import assert_that, contains_string, has_length, is_, same_instance
+
+from src.git_utils import RepoFactory
+
+
+class TestRepoFactory(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        git.Repo.init(self.root)
+        os.makedirs(os.path.join(self.root, "galil"))
+
+    def tearDown(self):
+        RepoFactory.clear()
+        self.temp_dir.cleanup()
+
+    def test_GIVEN_repo_opened_WHEN_opened_again_from_same_or_sub_directory_THEN_same_repo(self):
+        repo = RepoFactory.get_repo(self.root)
+
+        assert_that(RepoFactory.get_repo(self.root), is_(same_instance(repo)))
+        assert_that(
+            RepoFactory.get_repo(os.path.join(self.root, "galil")), is_(same_instance(repo))
+        )
+
+    def test_GIVEN_repo_WHEN_git_command_run_THEN_time_recorded(self):
+        repo = RepoFactory.get_repo(self.root)
+
+        repo.git.status()
+
+        assert_that(RepoFactory.timings(), has_length(1))
+        assert_that(RepoFactory.timings()[0].command, contains_string("status"))
+        assert_that(RepoFactory.timing_summary(), contains_string("1 git commands took"))
+
+    def test_GIVEN_directory_not_in_repo_WHEN_get_repo_THEN_error(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(Exception) as context:
+                RepoFactory.get_repo(directory)
+
+        assert_that(str(context.exception), contains_string("is not under version control"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import os
+import socket
+import tempfile
+import unittest
+
+from hamcrest import assert_that, contains_exactly, is_
+from mock import MagicMock as Mock
+from mock import patch
+from mother import LoggingStub
+
+from src.common_upgrades.utils.constants import COMPONENT_FOLDER, CONFIG_FOLDER, IOC_FILE
+from src.in_memory_file_access import InMemoryFileAccess
+from src.upgrade import VERSION_FILENAME, Upgrade
+from src.upgrade_step_from_7p4p0 import SetISOBUSForILM200
+
+CONFIG_ROOT = os.path.abspath(os.path.join(CONFIG_FOLDER, os.pardir, os.pardir))
+
+IOCS_XML = """<?xml version="1.0" ?>
+<iocs xmlns="http://epics.isis.rl.ac.uk/schema/iocs/1.0">
+<ioc name="ILM200_01"><macros/></ioc>
+</iocs>
+"""
+
+
+class TestInMemoryFileAccess(unittest.TestCase):
+    def setUp(self):
+        self.logger = LoggingStub()
+        self.file_access = InMemoryFileAccess(
+            self.logger,
+            CONFIG_ROOT,
+            {
+                os.path.join(CONFIG_FOLDER, "config1", IOC_FILE): IOCS_XML,
+                os.path.join(CONFIG_FOLDER, "config1", "blocks.xml"): "<blocks/>",
+                os.path.join(COMPONENT_FOLDER, "comp1", IOC_FILE): IOCS_XML,
+                os.path.join(COMPONENT_FOLDER, "README.txt"): "not a component",
+                VERSION_FILENAME: "7.4.0\n",
+            },
+        )
+
+    def test_GIVEN_tree_WHEN_listdir_and_is_dir_THEN_directory_contents_given(self):
+        assert_that(
+            self.file_access.listdir(COMPONENT_FOLDER),
+            contains_exactly(
+                os.path.join(COMPONENT_FOLDER, "README.txt"),
+                os.path.join(COMPONENT_FOLDER, "comp1"),
+            ),
+        )
+        assert_that(self.file_access.is_dir(os.path.join(COMPONENT_FOLDER, "comp1")), is_(True))
+        assert_that(
+            self.file_access.is_dir(os.path.join(COMPONENT_FOLDER, "README.txt")), is_(False)
+        )
+
+    def test_GIVEN_tree_WHEN_get_config_files_THEN_file_of_each_configuration_and_component(self):
+        result = [path for path, _ in self.file_access.get_config_files(IOC_FILE)]
+
+        assert_that(
+            result,
+            contains_exactly(
+                os.path.join(COMPONENT_FOLDER, "comp1", IOC_FILE),
+                os.path.join(CONFIG_FOLDER, "config1", IOC_FILE),
+            ),
+        )
+
+    def test_GIVEN_tree_WHEN_get_file_paths_THEN_files_before_subdirectories(self):
+        result = list(self.file_access.get_file_paths(os.path.dirname(CONFIG_FOLDER), ".xml"))
+
+        assert_that(
+            result,
+            contains_exactly(
+                os.path.join(COMPONENT_FOLDER, "comp1", IOC_FILE),
+                os.path.join(CONFIG_FOLDER, "config1", "blocks.xml"),
+                os.path.join(CONFIG_FOLDER, "config1", IOC_FILE),
+            ),
+        )
+
+    def test_GIVEN_file_in_missing_directory_WHEN_written_THEN_error_until_directory_created(self):
+        filename = os.path.join("new", "file.txt")
+
+        with self.assertRaises(FileNotFoundError):
+            self.file_access.write_file(filename, ["line"])
+        self.file_access.create_directories(filename)
+        self.file_access.write_file(filename, ["line"])
+        self.file_access.write_file(filename, ["appended"], mode="a")
+
+        assert_that(self.file_access.open_file(filename), contains_exactly("line", "appended"))
+
+    def test_GIVEN_folder_WHEN_renamed_and_deleted_THEN_files_moved_then_removed(self):
+        self.file_access.rename_file(
+            os.path.join(CONFIG_FOLDER, "config1"), os.path.join(CONFIG_FOLDER, "config2")
+        )
+
+        assert_that(
+            self.file_access.read_bytes(os.path.join(CONFIG_FOLDER, "config2", "blocks.xml")),
+            is_(b"<blocks/>"),
+        )
+        assert_that(self.file_access.exists(os.path.join(CONFIG_FOLDER, "config1")), is_(False))
+
+        self.file_access.delete_folder(CONFIG_FOLDER)
+
+        assert_that(
+            self.file_access.exists(os.path.join(CONFIG_FOLDER, "config2", "blocks.xml")),
+            is_(False),
+        )
+
+    def test_GIVEN_file_WHEN_renamed_into_missing_directory_THEN_error_and_file_kept(self):
+        blocks = os.path.join(CONFIG_FOLDER, "config1", "blocks.xml")
+
+        with self.assertRaises(FileNotFoundError):
+            self.file_access.rename_file(blocks, os.path.join("missing", "blocks.xml"))
+
+        assert_that(self.file_access.read_bytes(blocks), is_(b"<blocks/>"))
+
+    def test_GIVEN_settings_on_disk_WHEN_copied_THEN_files_in_memory_and_disk_unchanged(self):
+        with tempfile.TemporaryDirectory() as root:
+            os.makedirs(os.path.join(root, "configurations"))
+            with open(os.path.join(root, "configurations", "config_version.txt"), "w") as f:
+                f.write("1.0.0\n")
+
+            file_access = InMemoryFileAccess.copy_of(self.logger, root)
+            file_access.write_version_number("2.0.0", VERSION_FILENAME)
+
+            assert_that(file_access.open_file(VERSION_FILENAME), contains_exactly("2.0.0"))
+            with open(os.path.join(root, "configurations", "config_version.txt")) as f:
+                assert_that(f.read(), is_("1.0.0\n"))
+
+    def test_GIVEN_upgrade_steps_WHEN_upgrade_in_memory_THEN_files_changed_and_version_updated(
+        self,
+    ):
+        upgrade_steps = [
+            ("7.4.0", SetISOBUSForILM200()),
+            ("7.4.1", None),
+        ]
+
+        with patch.object(socket, "gethostname", return_value="NDXIMAT"):
+            result = Upgrade(self.file_access, self.logger, upgrade_steps, Mock()).upgrade()
+
+        assert_that(result, is_(0))
+        assert_that(self.file_access.open_file(VERSION_FILENAME), contains_exactly("7.4.1"))
+        for folder in (
+            os.path.join(CONFIG_FOLDER, "config1"),
+            os.path.join(COMPONENT_FOLDER, "comp1"),
+        ):
+            iocs = self.file_access.read_bytes(os.path.join(folder, IOC_FILE))
+            assert_that(b'<macro name="USE_ISOBUS" value="No"/>' in iocs, is_(True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,15 +1,40 @@
+import io
+import os
+import tempfile
 import unittest
 import unittest.mock as mocked
 
 import mysql.connector
-from mock import MagicMock, patch
+from hamcrest import assert_that, contains_exactly, contains_string, is_
+from mock import MagicMock, create_autospec, patch
+from mysql.connector.cursor import MySQLCursor
 
-from src.common_upgrades.sql_utilities import SqlConnection, run_sql
+from src.common_upgrades.sql_utilities import (
+    SqlConnection,
+    run_sql,
+    run_sql_file,
+    run_sql_list,
+    split_sql_statements,
+)
+
+
+def _cursor():
+    """A mock of a mysql.connector cursor whose statements return no rows.
+
+    Returns:
+        MagicMock: the cursor
+    """
+    cursor = create_autospec(MySQLCursor, instance=True)
+    cursor.with_rows = False
+    cursor.nextset.return_value = None
+    return cursor
 
 
 class TestSQLUtils(unittest.TestCase):
     def setUp(self):
         SqlConnection._connection = None
+        SqlConnection._password = None
+        SqlConnection._scopes = 0
 
     @patch("src.common_upgrades.sql_utilities.getpass")
     @patch("src.common_upgrades.sql_utilities.mysql.connector", autospec=mysql.connector)
@@ -67,3 +92,295 @@ class TestSQLUtils(unittest.TestCase):
                 SqlConnection.get_session(MagicMock()).cursor().execute
             )
             execute.assert_called_with(sql_string)
+
+    @patch("src.common_upgrades.sql_utilities.getpass")
+    @patch("src.common_upgrades.sql_utilities.mysql.connector", autospec=mysql.connector)
+    def test_GIVEN_nested_connection_scopes_WHEN_inner_scope_left_THEN_connection_kept_open(
+        self, mysql, getpass
+    ):
+        with SqlConnection():
+            run_sql(MagicMock(), MagicMock())
+            with SqlConnection():
+                run_sql(MagicMock(), MagicMock())
+            connection = SqlConnection._connection
+
+            connection.close.assert_not_called()
+            run_sql(MagicMock(), MagicMock())
+
+        getpass.assert_called_once()
+        mysql.connect.assert_called_once()
+        connection.close.assert_called_once()
+        assert_that(SqlConnection._connection, is_(None))
+
+    @patch("src.common_upgrades.sql_utilities.SQL_LIVENESS_CHECK_INTERVAL", -1)
+    @patch("src.common_upgrades.sql_utilities.getpass")
+    @patch("src.common_upgrades.sql_utilities.mysql.connector", autospec=mysql.connector)
+    def test_GIVEN_dropped_connection_WHEN_reconnect_fails_THEN_new_connection_made_without_prompt(
+        self, mysql, getpass
+    ):
+        dropped_connection = MagicMock()
+        dropped_connection.is_connected.return_value = False
+        dropped_connection.reconnect.side_effect = Exception("gone away")
+        new_connection = MagicMock()
+        mysql.connect.side_effect = [dropped_connection, new_connection]
+
+        with SqlConnection():
+            run_sql(MagicMock(), MagicMock())
+            assert_that(SqlConnection._connection, is_(new_connection))
+
+        getpass.assert_called_once()
+        assert_that(mysql.connect.call_count, is_(2))
+
+
+class TestSplitSqlStatements(unittest.TestCase):
+    def _split(self, script):
+        return list(split_sql_statements(io.StringIO(script)))
+
+    def test_GIVEN_statements_on_several_lines_WHEN_split_THEN_one_statement_each(self):
+        script = "CREATE TABLE a (\n  x INT\n);\nDROP TABLE b;\n"
+
+        assert_that(
+            self._split(script), contains_exactly("CREATE TABLE a (\n  x INT\n)", "DROP TABLE b")
+        )
+
+    def test_GIVEN_delimiters_inside_quotes_WHEN_split_THEN_statements_not_broken(self):
+        script = (
+            "INSERT INTO t VALUES ('a;b', \"c;d\", 'it''s;', 'e\\';f');\nSELECT `x;y` FROM t;\n"
+        )
+
+        assert_that(
+            self._split(script),
+            contains_exactly(
+                "INSERT INTO t VALUES ('a;b', \"c;d\", 'it''s;', 'e\\';f')", "SELECT `x;y` FROM t"
+            ),
+        )
+
+    def test_GIVEN_comments_WHEN_split_THEN_comments_dropped(self):
+        script = (
+            "-- leading; comment\n"
+            "# hash; comment\n"
+            "SELECT 1; -- trailing; comment\n"
+            "/* block;\n comment */ SELECT 2;\n"
+            "/*!40101 SET NAMES utf8 */;\n"
+        )
+
+        assert_that(
+            self._split(script),
+            contains_exactly("SELECT 1", "SELECT 2", "/*!40101 SET NAMES utf8 */"),
+        )
+
+    def test_GIVEN_delimiter_block_WHEN_split_THEN_body_kept_as_one_statement(self):
+        script = (
+            "DELIMITER $$\n"
+            "CREATE PROCEDURE p()\nBEGIN\n  SELECT 1;\n  SELECT 2;\nEND$$\n"
+            "DELIMITER ;\n"
+            "SELECT 3;\n"
+        )
+
+        assert_that(
+            self._split(script),
+            contains_exactly(
+                "CREATE PROCEDURE p()\nBEGIN\n  SELECT 1;\n  SELECT 2;\nEND", "SELECT 3"
+            ),
+        )
+
+    def test_GIVEN_last_statement_without_delimiter_WHEN_split_THEN_statement_returned(self):
+        assert_that(self._split("SELECT 1;\nSELECT 2\n"), contains_exactly("SELECT 1", "SELECT 2"))
+
+    @patch("src.common_upgrades.sql_utilities.getpass")
+    @patch("src.common_upgrades.sql_utilities.mysql.connector", autospec=mysql.connector)
+    def test_GIVEN_sql_file_WHEN_run_sql_file_THEN_each_statement_executed(self, mysql, getpass):
+        mysql.connect.return_value.cursor.return_value = _cursor()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file = os.path.join(temp_dir, "schema.sql")
+            with open(file, "w") as f:
+                f.write("-- schema\nCREATE TABLE a (x VARCHAR(3) DEFAULT ';');\nDROP TABLE b;\n")
+
+            with SqlConnection():
+                result = run_sql_file(MagicMock(), file)
+                cursor = SqlConnection.get_session(MagicMock()).cursor()
+
+        assert_that(result, is_(0))
+        assert_that(
+            cursor.execute.call_args_list,
+            contains_exactly(
+                mocked.call("CREATE TABLE a (x VARCHAR(3) DEFAULT ';')", map_results=True),
+                mocked.call("DROP TABLE b", map_results=True),
+            ),
+        )
+
+    @patch("src.common_upgrades.sql_utilities.getpass")
+    @patch("src.common_upgrades.sql_utilities.mysql.connector", autospec=mysql.connector)
+    def test_GIVEN_sql_file_of_plain_statements_WHEN_run_sql_file_THEN_statements_batched(
+        self, mysql, getpass
+    ):
+        mysql.connect.return_value.cursor.return_value = _cursor()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file = os.path.join(temp_dir, "schema.sql")
+            with open(file, "w") as f:
+                f.write("-- schema\nCREATE TABLE a (x VARCHAR(3) DEFAULT 'y');\nDROP TABLE b;\n")
+
+            with SqlConnection():
+                result = run_sql_file(MagicMock(), file)
+                cursor = SqlConnection.get_session(MagicMock()).cursor()
+
+        assert_that(result, is_(0))
+        cursor.execute.assert_called_once_with(
+            "CREATE TABLE a (x VARCHAR(3) DEFAULT 'y');\nDROP TABLE b", map_results=True
+        )
+
+
+class TestRunSqlList(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.cursor = self.session.cursor.return_value = _cursor()
+        SqlConnection._connection = self.session
+
+    def tearDown(self):
+        SqlConnection._connection = None
+
+    def test_GIVEN_plain_statements_WHEN_run_THEN_sent_in_multi_statement_packets(self):
+        run_sql_list(MagicMock(), ["SELECT 1", "SELECT 2", "SELECT 3"], batch_statements=2)
+
+        assert_that(
+            self.cursor.execute.call_args_list,
+            contains_exactly(
+                mocked.call("SELECT 1;\nSELECT 2", map_results=True),
+                mocked.call("SELECT 3", map_results=True),
+            ),
+        )
+        self.session.commit.assert_called_once()
+        self.cursor.close.assert_called_once()
+
+    def test_GIVEN_statement_containing_semicolon_WHEN_run_THEN_sent_alone(self):
+        procedure = "CREATE PROCEDURE p() BEGIN SELECT 1; END"
+
+        run_sql_list(MagicMock(), ["SELECT 1", procedure, "SELECT 2"])
+
+        assert_that(
+            self.cursor.execute.call_args_list,
+            contains_exactly(
+                mocked.call("SELECT 1", map_results=True),
+                mocked.call(procedure, map_results=True),
+                mocked.call("SELECT 2", map_results=True),
+            ),
+        )
+
+    def test_GIVEN_parameterised_statements_WHEN_run_THEN_grouped_for_executemany(self):
+        insert = "INSERT INTO t VALUES (%s)"
+
+        run_sql_list(MagicMock(), [(insert, (1,)), (insert, (2,)), "SELECT 1", (insert, (3,))])
+
+        self.cursor.executemany.assert_has_calls(
+            [mocked.call(insert, [(1,), (2,)]), mocked.call(insert, [(3,)])]
+        )
+        self.cursor.execute.assert_called_once_with("SELECT 1", map_results=True)
+
+    def test_GIVEN_results_with_rows_WHEN_run_THEN_results_drained(self):
+        self.cursor.with_rows = True
+        self.cursor.nextset.side_effect = [True, None]
+
+        run_sql_list(MagicMock(), ["SELECT 1;\nSELECT 2"])
+
+        assert_that(self.cursor.fetchall.call_count, is_(2))
+
+    def test_GIVEN_error_in_statement_WHEN_run_THEN_error_raised_and_cursor_closed(self):
+        self.cursor.execute.side_effect = mysql.connector.Error("bad sql")
+
+        with self.assertRaises(mysql.connector.Error):
+            run_sql_list(MagicMock(), ["SELECT 1"])
+
+        self.session.commit.assert_not_called()
+        self.cursor.close.assert_called_once()
+
+    def test_GIVEN_commit_every_WHEN_run_THEN_committed_at_batch_boundaries(self):
+        run_sql_list(
+            MagicMock(),
+            ["SELECT {}".format(i) for i in range(5)],
+            commit_every=2,
+            batch_statements=2,
+        )
+
+        # After the first two batches and once at the end
+        assert_that(self.session.commit.call_count, is_(3))
+
+    def test_WHEN_run_THEN_rate_reported(self):
+        logger = MagicMock()
+
+        run_sql_list(logger, ["SELECT 1", "SELECT 2"])
+
+        assert_that(logger.info.call_args[0][0], contains_string("statements/s"))
+
+
+class TestRunSqlFileSkippingExisting(unittest.TestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.cursor = self.session.cursor.return_value = _cursor()
+        self.cursor.fetchall.side_effect = [
+            [("exp_data",)],
+            [("exp_data", "runs"), ("exp_data", "blocks")],
+            [("exp_data", "runs", "id"), ("exp_data", "runs", "name")],
+            [("exp_data", "runs", "PRIMARY"), ("exp_data", "runs", "name_index")],
+        ]
+        SqlConnection._connection = self.session
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        SqlConnection._connection = None
+        self.temp_dir.cleanup()
+
+    def _run(self, script):
+        file = os.path.join(self.temp_dir.name, "schema.sql")
+        with open(file, "w") as f:
+            f.write(script)
+        run_sql_file(MagicMock(), file, skip_existing=True)
+        return [
+            c.args[0] for c in self.cursor.execute.call_args_list if c.kwargs.get("map_results")
+        ]
+
+    def test_GIVEN_objects_already_exist_WHEN_run_sql_file_skipping_existing_THEN_not_sent(self):
+        sent = self._run(
+            "CREATE DATABASE IF NOT EXISTS exp_data;\n"
+            "USE `exp_data`;\n"
+            "CREATE TABLE IF NOT EXISTS `runs` (id INT, name VARCHAR(10));\n"
+            "ALTER TABLE runs ADD COLUMN name VARCHAR(10), ADD INDEX name_index (name);\n"
+            "CREATE INDEX name_index ON exp_data.runs (name);\n"
+        )
+
+        assert_that(sent, contains_exactly("USE `exp_data`"))
+
+    def test_GIVEN_objects_missing_WHEN_run_sql_file_skipping_existing_THEN_sent(self):
+        sent = self._run(
+            "USE exp_data;\n"
+            "CREATE TABLE runs (id INT);\n"
+            "CREATE TABLE moxas (id INT);\n"
+            "ALTER TABLE runs ADD COLUMN name VARCHAR(10), ADD COLUMN title VARCHAR(10);\n"
+            "ALTER TABLE blocks ADD INDEX block_index (name);\n"
+        )
+
+        assert_that(
+            sent,
+            contains_exactly(
+                "USE exp_data;\n"
+                "CREATE TABLE moxas (id INT);\n"
+                "ALTER TABLE runs ADD COLUMN name VARCHAR(10), ADD COLUMN title VARCHAR(10);\n"
+                "ALTER TABLE blocks ADD INDEX block_index (name)"
+            ),
+        )
+
+    def test_GIVEN_table_dropped_in_script_WHEN_run_sql_file_skipping_existing_THEN_recreated(
+        self,
+    ):
+        sent = self._run("USE exp_data;\nDROP TABLE IF EXISTS runs;\nCREATE TABLE runs (id INT);\n")
+
+        assert_that(
+            sent,
+            contains_exactly(
+                "USE exp_data;\nDROP TABLE IF EXISTS runs;\nCREATE TABLE runs (id INT)"
+            ),
+        )
+
+    def test_GIVEN_table_not_qualified_and_no_schema_in_use_WHEN_run_sql_file_THEN_sent(self):
+        sent = self._run("CREATE TABLE runs (id INT);\n")
+
+        assert_that(sent, contains_exactly("CREATE TABLE runs (id INT)"))
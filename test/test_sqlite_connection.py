@@ -0,0 +1,140 @@
+import os
+import tempfile
+import unittest
+
+from hamcrest import assert_that, contains_exactly, contains_inanyorder, has_item, is_, starts_with
+from mother import LoggingStub
+
+from src.common_upgrades.sql_utilities import SqlConnection, mysql_connection_factory, run_sql_file
+from src.common_upgrades.sqlite_connection import SqliteDatabase
+
+SCHEMA = """
+/*!40101 SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT */;
+CREATE DATABASE IF NOT EXISTS `archive`;
+USE `archive`;
+
+-- the sample table
+CREATE TABLE IF NOT EXISTS `sample` (
+  `sample_id` int(10) unsigned NOT NULL AUTO_INCREMENT COMMENT 'id; of the sample',
+  `channel_id` int(10) unsigned NOT NULL,
+  `smpl_time` datetime(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+  `severity` enum('OK','MINOR','MAJOR') CHARACTER SET utf8 DEFAULT 'OK',
+  `str_val` varchar(120) COLLATE utf8_bin DEFAULT NULL,
+  PRIMARY KEY (`sample_id`),
+  KEY `channel` (`channel_id`),
+  UNIQUE KEY `time` (`channel_id`, `smpl_time`),
+  CONSTRAINT `fk_channel` FOREIGN KEY (`channel_id`) REFERENCES `channel` (`channel_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE INDEX `value` ON `sample` (`str_val`(20));
+ALTER TABLE `sample` ADD COLUMN `num_val` int(11) DEFAULT NULL, ADD INDEX `num` (`num_val`);
+INSERT IGNORE INTO `sample` (`channel_id`, `str_val`) VALUES (1, 'a');
+GRANT ALL ON `archive`.* TO 'report'@'localhost';
+"""
+
+
+class TestSqliteDatabase(unittest.TestCase):
+    def setUp(self):
+        self.logger = LoggingStub()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.schema_file = os.path.join(self.temp_dir.name, "schema.sql")
+        with open(self.schema_file, "w") as f:
+            f.write(SCHEMA)
+        self.database = SqliteDatabase()
+        SqlConnection.connection_factory = self.database.connect
+        SqlConnection._connection = None
+        SqlConnection._scopes = 0
+
+    def tearDown(self):
+        SqlConnection.connection_factory = mysql_connection_factory
+        self.database.close()
+        self.temp_dir.cleanup()
+
+    def _query(self, sql):
+        cursor = self.database.connect().cursor()
+        cursor.execute(sql)
+        return cursor.fetchall()
+
+    def test_GIVEN_mysql_schema_file_WHEN_run_THEN_tables_indexes_and_rows_created(self):
+        with SqlConnection():
+            result = run_sql_file(self.logger, self.schema_file)
+
+        assert_that(result, is_(0))
+        assert_that(
+            self._query(
+                "SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = 'archive' ORDER BY ORDINAL_POSITION"
+            ),
+            contains_exactly(
+                ("sample_id",), ("channel_id",), ("smpl_time",), ("severity",), ("str_val",),
+                ("num_val",),
+            ),
+        )  # fmt: skip
+        assert_that(
+            self._query("SELECT INDEX_NAME FROM information_schema.STATISTICS"),
+            contains_inanyorder(("PRIMARY",), ("channel",), ("time",), ("value",), ("num",)),
+        )
+        assert_that(
+            self._query("SELECT CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS"),
+            contains_exactly(("fk_channel",)),
+        )
+        assert_that(
+            self._query("SELECT channel_id, str_val, severity FROM archive.sample"),
+            contains_exactly((1, "a", "OK")),
+        )
+
+    def test_GIVEN_schema_already_applied_WHEN_run_skipping_existing_THEN_only_data_sent_again(
+        self,
+    ):
+        with SqlConnection():
+            run_sql_file(self.logger, self.schema_file)
+        sent = len(self.database.statements)
+
+        with SqlConnection():
+            result = run_sql_file(self.logger, self.schema_file, skip_existing=True)
+
+        assert_that(result, is_(0))
+        resent = [s.split()[0].upper() for s in self.database.statements[sent:]]
+        assert_that("CREATE" in resent or "ALTER" in resent, is_(False))
+        assert_that(resent, has_item("INSERT"))
+
+    def test_GIVEN_user_and_grant_statements_WHEN_run_THEN_ignored(self):
+        with SqlConnection():
+            run_sql_file(self.logger, self.schema_file)
+
+        assert_that(self.database.ignored, has_item(starts_with("GRANT")))
+
+    def test_GIVEN_uncommitted_insert_WHEN_connection_closed_THEN_insert_lost(self):
+        with SqlConnection():
+            run_sql_file(self.logger, self.schema_file)
+        connection = self.database.connect()
+        cursor = connection.cursor()
+        cursor.execute("INSERT INTO archive.sample (channel_id, str_val) VALUES (2, 'b')")
+
+        connection.close()
+
+        assert_that(self._query("SELECT channel_id FROM archive.sample"), contains_exactly((1,)))
+
+    def test_GIVEN_database_file_WHEN_reopened_THEN_schemas_and_index_names_kept(self):
+        database_file = os.path.join(self.temp_dir.name, "upgrade.sqlite")
+        database = SqliteDatabase(database_file)
+        SqlConnection.connection_factory = database.connect
+        with SqlConnection():
+            run_sql_file(self.logger, self.schema_file)
+        database.close()
+
+        database = SqliteDatabase(database_file)
+        cursor = database.connect().cursor()
+        cursor.execute(
+            "SELECT INDEX_NAME FROM information_schema.STATISTICS WHERE INDEX_NAME = 'value'"
+        )
+        rows = cursor.fetchall()
+        schemas = database.schemas()
+        database.close()
+
+        assert_that(schemas, contains_exactly("archive"))
+        assert_that(rows, contains_exactly(("value",)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+import os
+import tempfile
+import time
+import unittest
+
+from hamcrest import assert_that, has_length, is_, is_not, none
+from mock import MagicMock as Mock
+from mock import patch
+from mother import LoggingStub
+
+from src.common_upgrades.step_result_cache import BLOBS_FOLDER, StepResultCache
+from src.common_upgrades.utils.resources import CONFIG_XML, DATABASE, GLOBALS
+from src.file_access import FileAccess
+from src.upgrade_step import UpgradeStep
+
+
+class AppendToIocs(UpgradeStep):
+    reads = frozenset({GLOBALS})
+    writes = frozenset({CONFIG_XML})
+    cacheable = True
+
+    def perform(self, file_access, logger):
+        iocs = os.path.join("configurations", "config1", "iocs.xml")
+        file_access.write_file(iocs, file_access.read_bytes(iocs) + b"<ioc/>", "wb", True)
+        return 0
+
+
+class RemoveConfig2(UpgradeStep):
+    reads = frozenset({CONFIG_XML})
+    writes = frozenset({CONFIG_XML})
+    cacheable = True
+
+    def perform(self, file_access, logger):
+        file_access.delete_folder(
+            os.path.join(file_access.config_base, "configurations", "config2")
+        )
+        return 0
+
+
+class AppendToIocsUsingGit(AppendToIocs):
+    cacheable = False
+
+
+class TestStepResultCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config_root = os.path.join(self.temp_dir.name, "config")
+        self.cache_folder = os.path.join(self.temp_dir.name, "cache")
+        self.logger = LoggingStub()
+        self.file_access = FileAccess(self.logger, self.config_root)
+        self.iocs = os.path.join("configurations", "config1", "iocs.xml")
+        self._write(self.iocs, "<iocs/>")
+        self._write("globals.txt", "GALIL_01__MTRCTRL=1")
+        resource_paths = {
+            CONFIG_XML: [os.path.join(self.config_root, "configurations")],
+            GLOBALS: [os.path.join(self.config_root, "globals.txt")],
+            DATABASE: [],
+        }
+        patcher = patch.dict(
+            "src.common_upgrades.step_result_cache.RESOURCE_PATHS", resource_paths, clear=True
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write(self, path, contents):
+        path = os.path.join(self.config_root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(contents)
+
+    def _read(self, path):
+        with open(os.path.join(self.config_root, path)) as f:
+            return f.read()
+
+    def _cache(self, max_entries=10):
+        return StepResultCache(self.logger, self.cache_folder, max_entries)
+
+    def _blobs(self):
+        return [
+            name
+            for _, _, files in os.walk(os.path.join(self.cache_folder, BLOBS_FOLDER))
+            for name in files
+        ]
+
+    def _perform_and_record(self, cache, upgrade_step):
+        key = cache.key("1.0.0", upgrade_step, self.file_access)
+        upgrade_step.perform(self.file_access, self.logger)
+        cache.record(key, upgrade_step, self.file_access)
+        return key
+
+    def test_GIVEN_step_performed_WHEN_inputs_restored_THEN_same_key_and_outputs_replayed(self):
+        cache = self._cache()
+        key = self._perform_and_record(cache, AppendToIocs())
+        self._write(self.iocs, "<iocs/>")
+
+        replay_key = cache.key("1.0.0", AppendToIocs(), self.file_access)
+        replayed = cache.replay(replay_key, self.file_access)
+
+        assert_that(replay_key, is_(key))
+        assert_that(replayed, is_(True))
+        assert_that(self._read(self.iocs), is_("<iocs/><ioc/>"))
+
+    def test_GIVEN_step_performed_WHEN_file_it_reads_changed_THEN_new_key_not_replayed(self):
+        cache = self._cache()
+        key = self._perform_and_record(cache, AppendToIocs())
+        self._write(self.iocs, "<iocs/>")
+        self._write("globals.txt", "GALIL_01__MTRCTRL=2")
+
+        new_key = cache.key("1.0.0", AppendToIocs(), self.file_access)
+
+        assert_that(new_key, is_not(key))
+        assert_that(cache.replay(new_key, self.file_access), is_(False))
+
+    def test_GIVEN_cache_saved_WHEN_loaded_again_THEN_result_replayed(self):
+        cache = self._cache()
+        key = self._perform_and_record(cache, AppendToIocs())
+        cache.save()
+        self._write(self.iocs, "<iocs/>")
+
+        replayed = self._cache().replay(key, self.file_access)
+
+        assert_that(replayed, is_(True))
+        assert_that(self._read(self.iocs), is_("<iocs/><ioc/>"))
+
+    def test_GIVEN_step_using_resource_outside_repository_or_undeclared_WHEN_key_THEN_not_cached(
+        self,
+    ):
+        database_step = Mock(UpgradeStep)
+        database_step.reads = frozenset({DATABASE})
+        database_step.writes = frozenset({DATABASE})
+
+        assert_that(self._cache().key("1.0.0", database_step, self.file_access), none())
+        assert_that(self._cache().key("1.0.0", Mock(UpgradeStep), self.file_access), none())
+
+    def test_GIVEN_step_which_has_not_opted_in_WHEN_key_THEN_not_cached(self):
+        assert_that(self._cache().key("1.0.0", AppendToIocsUsingGit(), self.file_access), none())
+
+    def test_GIVEN_too_many_results_WHEN_saved_THEN_least_recently_used_and_files_dropped(self):
+        cache = self._cache(max_entries=2)
+        first_key = self._perform_and_record(cache, AppendToIocs())
+        self._write(self.iocs, "<iocs/>")
+        cache.replay(first_key, self.file_access)
+        second_key = self._perform_and_record(cache, AppendToIocs())
+        third_key = self._perform_and_record(cache, AppendToIocs())
+        cache.replay(first_key, self.file_access)
+        cache._loaded_at = time.time() + 1
+
+        cache.save()
+
+        cache = self._cache()
+        assert_that(cache.replay(second_key, self.file_access), is_(False))
+        assert_that(cache.replay(first_key, self.file_access), is_(True))
+        assert_that(cache.replay(third_key, self.file_access), is_(True))
+        assert_that(self._blobs(), has_length(2))
+
+    def test_GIVEN_step_removed_folder_WHEN_replayed_THEN_folders_left_empty_removed(self):
+        config2_iocs = os.path.join("configurations", "config2", "iocs.xml")
+        self._write(config2_iocs, "<iocs/>")
+        cache = self._cache()
+        key = self._perform_and_record(cache, RemoveConfig2())
+        self._write(config2_iocs, "<iocs/>")
+
+        replayed = cache.replay(key, self.file_access)
+
+        assert_that(replayed, is_(True))
+        assert_that(
+            os.path.exists(os.path.join(self.config_root, "configurations", "config2")), is_(False)
+        )
+        assert_that(os.path.exists(os.path.join(self.config_root, self.iocs)), is_(True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+
+from hamcrest import assert_that, contains_exactly, empty, is_
+from mock import MagicMock as Mock
+from mother import LoggingStub
+
+from src.common_upgrades.template_usage_index import TemplateUsageIndex
+from src.file_access import FileAccess
+
+JAWS_SUBSTITUTIONS = """file "$(JAWS)/db/slits.template" {
+    pattern { P, JAWS }
+            { "$(P)", "JAWS1" }
+}
+"""
+
+OTHER_SUBSTITUTIONS = """file other.template {
+    { P="$(P)" }
+}
+"""
+
+
+class TestTemplateUsageIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.support = os.path.join(self.temp_dir.name, "support")
+        self.index_filename = os.path.join(self.temp_dir.name, "cache", "index.json")
+        self.logger = LoggingStub()
+        self.file_access = FileAccess(self.logger, self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write_substitutions(self, name, contents):
+        path = os.path.join(self.support, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(contents)
+        return path
+
+    def _index(self):
+        return TemplateUsageIndex(self.file_access, self.logger, self.index_filename)
+
+    def test_GIVEN_substitutions_files_WHEN_refresh_THEN_files_using_template_found(self):
+        jaws = self._write_substitutions(
+            os.path.join("jaws", "jaws.substitutions"), JAWS_SUBSTITUTIONS
+        )
+        self._write_substitutions(os.path.join("other", "other.substitutions"), OTHER_SUBSTITUTIONS)
+
+        index = self._index()
+        index.refresh(self.support)
+
+        assert_that(index.files_using_template("slits.template"), contains_exactly(jaws))
+
+    def test_GIVEN_substitutions_file_in_db_folder_WHEN_refresh_THEN_file_found(self):
+        jaws = self._write_substitutions(
+            os.path.join("jaws", "db", "jaws.substitutions"), JAWS_SUBSTITUTIONS
+        )
+
+        index = self._index()
+        index.refresh(self.support)
+
+        assert_that(index.files_using_template("slits.template"), contains_exactly(jaws))
+
+    def test_GIVEN_saved_index_WHEN_refresh_with_unchanged_files_THEN_files_not_read(self):
+        jaws = self._write_substitutions("jaws.substitutions", JAWS_SUBSTITUTIONS)
+        index = self._index()
+        index.refresh(self.support)
+        index.save()
+
+        self.file_access.open_file = Mock()
+        index = self._index()
+        index.refresh(self.support)
+
+        self.file_access.open_file.assert_not_called()
+        assert_that(index.files_using_template("slits.template"), contains_exactly(jaws))
+
+    def test_GIVEN_index_changed_WHEN_save_THEN_only_index_file_left(self):
+        self._write_substitutions("jaws.substitutions", JAWS_SUBSTITUTIONS)
+        index = self._index()
+        index.refresh(self.support)
+
+        index.save()
+
+        assert_that(
+            os.listdir(os.path.dirname(self.index_filename)), contains_exactly("index.json")
+        )
+
+    def test_GIVEN_saved_index_WHEN_file_changed_THEN_file_rescanned(self):
+        path = self._write_substitutions("jaws.substitutions", JAWS_SUBSTITUTIONS)
+        index = self._index()
+        index.refresh(self.support)
+        index.save()
+
+        self._write_substitutions("jaws.substitutions", OTHER_SUBSTITUTIONS + "\n")
+        index = self._index()
+        index.refresh(self.support)
+
+        assert_that(index.files_using_template("slits.template"), is_(empty()))
+        assert_that(index.files_using_template("other.template"), contains_exactly(path))
+
+    def test_GIVEN_saved_index_WHEN_file_removed_THEN_file_dropped_from_index(self):
+        path = self._write_substitutions("jaws.substitutions", JAWS_SUBSTITUTIONS)
+        index = self._index()
+        index.refresh(self.support)
+        index.save()
+
+        os.remove(path)
+        index = self._index()
+        index.refresh(self.support)
+
+        assert_that(index.files_using_template("slits.template"), is_(empty()))
+
+    def test_GIVEN_corrupt_index_file_WHEN_loaded_THEN_index_rebuilt(self):
+        jaws = self._write_substitutions("jaws.substitutions", JAWS_SUBSTITUTIONS)
+        os.makedirs(os.path.dirname(self.index_filename))
+        with open(self.index_filename, "w") as f:
+            f.write("not json")
+
+        index = self._index()
+        index.refresh(self.support)
+
+        assert_that(index.files_using_template("slits.template"), contains_exactly(jaws))
+
+
+if __name__ == "__main__":
+    unittest.main()
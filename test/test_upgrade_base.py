@@ -1,14 +1,42 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import call, patch
+from xml.dom import minidom
 
 from hamcrest import assert_that, contains_exactly, has_item, is_, is_not, none
 from mock import MagicMock as Mock
 from mother import FileAccessStub, LoggingStub
 
-from src.upgrade import Upgrade, UpgradeError
+from src.common_upgrades.utils.resources import (
+    CONFIG_XML,
+    DASHBOARD_DB,
+    DATABASE,
+    RESOURCE_PATHS,
+)
+from src.common_upgrades.xml_transforms import XmlTransform
+from src.file_access import FileAccess
+from src.upgrade import VERSION_FILENAME, Upgrade, UpgradeError, upgrade_waves
 from src.upgrade_step import UpgradeStep
 
 
+def declared_step(reads, writes, result=0):
+    upgrade_step = Mock(UpgradeStep)
+    upgrade_step.reads = frozenset(reads)
+    upgrade_step.writes = frozenset(writes)
+    upgrade_step.perform = Mock(return_value=result)
+    return upgrade_step
+
+
+def xml_step(value, result=0):
+    def edit(path, xml):
+        xml.documentElement.setAttribute("value", value)
+
+    upgrade_step = declared_step({CONFIG_XML}, {CONFIG_XML}, result)
+    upgrade_step.xml_transforms = Mock(return_value=[XmlTransform("blocks.xml", edit)])
+    return upgrade_step
+
+
 class TestUpgradeBase(unittest.TestCase):
     @patch("git.Repo", autospec=True)
     def setUp(self, repo):
@@ -179,6 +207,265 @@ class TestUpgradeBase(unittest.TestCase):
         assert_that(result_not_match, is_(1), "Did not fail with incorrect version numbers")
         assert_that(result_match, is_(0), "Did not pass with correct version numbers")
 
+    def test_GIVEN_steps_with_disjoint_resources_WHEN_grouped_THEN_in_one_wave(self):
+        xml_step = declared_step({CONFIG_XML}, {CONFIG_XML})
+        database_step = declared_step({DATABASE}, {DATABASE})
+        dashboard_step = declared_step({DASHBOARD_DB}, {DASHBOARD_DB})
+        steps = [("1", xml_step), ("2", database_step), ("3", dashboard_step)]
+
+        result = list(upgrade_waves(steps))
+
+        assert_that(result, contains_exactly(steps))
+
+    def test_GIVEN_step_using_resource_written_by_earlier_step_WHEN_grouped_THEN_new_wave(self):
+        writes_xml = declared_step({CONFIG_XML}, {CONFIG_XML})
+        database_step = declared_step({DATABASE}, {DATABASE})
+        reads_xml = declared_step({CONFIG_XML}, set())
+        steps = [("1", writes_xml), ("2", database_step), ("3", reads_xml)]
+
+        result = list(upgrade_waves(steps))
+
+        assert_that(result, contains_exactly(steps[:2], steps[2:]))
+
+    def test_GIVEN_steps_which_only_read_a_resource_WHEN_grouped_THEN_in_one_wave(self):
+        steps = [
+            ("1", declared_step({CONFIG_XML}, set())),
+            ("2", declared_step({CONFIG_XML}, set())),
+        ]
+
+        result = list(upgrade_waves(steps))
+
+        assert_that(result, contains_exactly(steps))
+
+    def test_GIVEN_step_without_declared_resources_WHEN_grouped_THEN_in_wave_on_its_own(self):
+        undeclared = Mock(UpgradeStep)
+        steps = [
+            ("1", declared_step(set(), set())),
+            ("2", undeclared),
+            ("3", declared_step(set(), set())),
+        ]
+
+        result = list(upgrade_waves(steps))
+
+        assert_that(result, contains_exactly(steps[:1], steps[1:2], steps[2:]))
+
+    def test_GIVEN_independent_steps_WHEN_upgrade_THEN_versions_committed_in_order_with_files(self):
+        self.file_access.open_file = Mock(return_value=["1.0.0"])
+        xml_step = declared_step({CONFIG_XML}, {CONFIG_XML})
+        database_step = declared_step({DATABASE}, {DATABASE})
+        upgrade_steps = [("1.0.0", xml_step), ("1.0.1", database_step), ("1.0.2", None)]
+
+        with patch("src.upgrade.os.path.exists", return_value=True):
+            result = self.upgrade(upgrade_steps).upgrade()
+
+        assert_that(result, is_(0), "Success exit")
+        xml_step.perform.assert_called_once()
+        database_step.perform.assert_called_once()
+        assert_that(
+            self.git_repo.index.commit.call_args_list,
+            contains_exactly(
+                call("IBEX Upgrade from 1.0.0"),
+                call("IBEX Upgrade from 1.0.1"),
+                call("IBEX Upgrade to 1.0.2"),
+            ),
+        )
+        assert_that(
+            self.git_repo.git.add.call_args_list,
+            contains_exactly(
+                call("-A", "--", VERSION_FILENAME, *RESOURCE_PATHS[CONFIG_XML]),
+                call("-A", "--", VERSION_FILENAME),
+                call(A=True),
+            ),
+        )
+
+    def test_GIVEN_new_version_file_WHEN_independent_steps_committed_THEN_version_file_staged(
+        self,
+    ):
+        self.file_access.open_file = Mock(return_value=["1.0.0"])
+        self.git_repo.git.ls_files.return_value = ""
+        upgrade_steps = [
+            ("1.0.0", declared_step({DATABASE}, {DATABASE})),
+            ("1.0.1", declared_step({DASHBOARD_DB}, {DASHBOARD_DB})),
+            ("1.0.2", None),
+        ]
+
+        with tempfile.TemporaryDirectory() as config_base:
+            version_file = os.path.join(config_base, VERSION_FILENAME)
+            os.makedirs(os.path.dirname(version_file))
+            open(version_file, "w").close()
+            self.file_access.config_base = config_base
+            result = self.upgrade(upgrade_steps).upgrade()
+
+        assert_that(result, is_(0), "Success exit")
+        assert_that(
+            self.git_repo.git.add.call_args_list[0], is_(call("-A", "--", VERSION_FILENAME))
+        )
+
+    def test_GIVEN_independent_steps_WHEN_second_fails_THEN_first_committed_and_fail(self):
+        self.file_access.open_file = Mock(return_value=["1.0.0"])
+        upgrade_steps = [
+            ("1.0.0", declared_step({CONFIG_XML}, {CONFIG_XML})),
+            ("1.0.1", declared_step({DATABASE}, {DATABASE}, result=1)),
+            ("1.0.2", None),
+        ]
+
+        with patch("src.upgrade.os.path.exists", return_value=True):
+            result = self.upgrade(upgrade_steps).upgrade()
+
+        assert_that(result, is_(1), "Fail exit")
+        assert_that(
+            self.git_repo.index.commit.call_args_list,
+            contains_exactly(call("IBEX Upgrade from 1.0.0")),
+        )
+
+    def test_GIVEN_independent_steps_WHEN_first_fails_THEN_file_of_later_step_not_changed(self):
+        def perform(file_access, logger):
+            file_access.write_file("globals.txt", ["A=2"])
+            return 0
+
+        later_step = declared_step({DATABASE}, {DATABASE})
+        later_step.perform = Mock(side_effect=perform)
+        upgrade_steps = [
+            ("1.0.0", declared_step({CONFIG_XML}, {CONFIG_XML}, result=1)),
+            ("1.0.1", later_step),
+            ("1.0.2", None),
+        ]
+
+        with tempfile.TemporaryDirectory() as config_root:
+            self.file_access = FileAccess(self.logger, config_root)
+            os.makedirs(
+                os.path.dirname(os.path.join(self.file_access.config_base, VERSION_FILENAME))
+            )
+            self.file_access.write_version_number("1.0.0", VERSION_FILENAME)
+            self.file_access.write_file("globals.txt", ["A=1"])
+            result = self.upgrade(upgrade_steps).upgrade()
+
+            with open(os.path.join(self.file_access.config_base, "globals.txt")) as f:
+                contents = f.read()
+
+        assert_that(result, is_(1), "Fail exit")
+        later_step.perform.assert_called_once()
+        assert_that(contents, is_("A=1\n"))
+        self.git_repo.index.commit.assert_not_called()
+
+    def test_GIVEN_consecutive_xml_steps_WHEN_upgrade_THEN_files_read_once_and_versions_committed(
+        self,
+    ):
+        self.file_access.open_file = Mock(return_value=["1.0.0"])
+        self.file_access.get_config_files = Mock(
+            side_effect=lambda file_type: iter([("blocks.xml", minidom.parseString("<blocks/>"))])
+        )
+        written = []
+        self.file_access.write_xml_file = Mock(
+            side_effect=lambda path, xml: written.append((path, xml.toxml()))
+        )
+        upgrade_steps = [("1.0.0", xml_step("a")), ("1.0.1", xml_step("b")), ("1.0.2", None)]
+
+        result = self.upgrade(upgrade_steps).upgrade()
+
+        assert_that(result, is_(0), "Success exit")
+        self.file_access.get_config_files.assert_called_once_with("blocks.xml")
+        for _, upgrade_step in upgrade_steps[:2]:
+            upgrade_step.perform.assert_not_called()
+        assert_that(
+            written,
+            contains_exactly(
+                ("blocks.xml", '<?xml version="1.0" ?><blocks value="a"/>'),
+                ("blocks.xml", '<?xml version="1.0" ?><blocks value="b"/>'),
+            ),
+        )
+        assert_that(
+            self.git_repo.index.commit.call_args_list,
+            contains_exactly(
+                call("IBEX Upgrade from 1.0.0"),
+                call("IBEX Upgrade from 1.0.1"),
+                call("IBEX Upgrade to 1.0.2"),
+            ),
+        )
+
+    def test_GIVEN_xml_step_between_other_steps_WHEN_upgrade_THEN_performed_on_its_own(self):
+        self.file_access.open_file = Mock(return_value=["1.0.0"])
+        only_xml_step = xml_step("a")
+        upgrade_steps = [
+            ("1.0.0", declared_step({DATABASE}, {DATABASE})),
+            ("1.0.1", only_xml_step),
+            ("1.0.2", None),
+        ]
+
+        with patch("src.upgrade.os.path.exists", return_value=True):
+            result = self.upgrade(upgrade_steps).upgrade()
+
+        assert_that(result, is_(0), "Success exit")
+        only_xml_step.perform.assert_called_once()
+
+    def test_GIVEN_step_result_in_cache_WHEN_upgrade_THEN_replayed_instead_of_performed(self):
+        self.file_access.open_file = Mock(return_value=["1.0.0"])
+        upgrade_step = declared_step({CONFIG_XML}, {CONFIG_XML})
+        step_cache = Mock()
+        step_cache.replay.return_value = True
+        upgrade = Upgrade(
+            self.file_access,
+            self.logger,
+            [("1.0.0", upgrade_step), ("1.0.1", None)],
+            self.git_repo,
+            step_cache=step_cache,
+        )
+
+        result = upgrade.upgrade()
+
+        assert_that(result, is_(0), "Success exit")
+        upgrade_step.perform.assert_not_called()
+        step_cache.record.assert_not_called()
+        step_cache.save.assert_called_once_with()
+
+    def test_GIVEN_step_result_not_in_cache_WHEN_upgrade_THEN_performed_and_recorded(self):
+        self.file_access.open_file = Mock(return_value=["1.0.0"])
+        upgrade_step = declared_step({CONFIG_XML}, {CONFIG_XML})
+        step_cache = Mock()
+        step_cache.key.return_value = "key"
+        step_cache.replay.return_value = False
+        upgrade = Upgrade(
+            self.file_access,
+            self.logger,
+            [("1.0.0", upgrade_step), ("1.0.1", None)],
+            self.git_repo,
+            step_cache=step_cache,
+        )
+
+        upgrade.upgrade()
+
+        upgrade_step.perform.assert_called_once()
+        step_cache.record.assert_called_once_with("key", upgrade_step, self.file_access)
+
+    def test_GIVEN_step_writes_file_and_fails_WHEN_upgrade_THEN_file_not_written(self):
+        self.file_access.open_file = Mock(return_value=["1.0.0"])
+
+        def perform(file_access, logger):
+            file_access.write_file("globals.txt", ["A=1"])
+            return 1
+
+        upgrade_step = Mock(UpgradeStep)
+        upgrade_step.perform = Mock(side_effect=perform)
+
+        result = self.upgrade([("1.0.0", upgrade_step), ("1.0.1", None)]).upgrade()
+
+        assert_that(result, is_(1), "Fail exit")
+        assert_that(self.file_access.write_file_dict, is_({}))
+
+    def test_GIVEN_step_writes_file_WHEN_upgrade_THEN_file_written_when_step_succeeds(self):
+        self.file_access.open_file = Mock(return_value=["1.0.0"])
+
+        def perform(file_access, logger):
+            file_access.write_file("globals.txt", ["A=1"])
+            return 0
+
+        upgrade_step = Mock(UpgradeStep)
+        upgrade_step.perform = Mock(side_effect=perform)
+
+        self.upgrade([("1.0.0", upgrade_step), ("1.0.1", None)]).upgrade()
+
+        assert_that(self.file_access.write_file_dict, is_({"globals.txt": "A=1\n"}))
+
 
 if __name__ == "__main__":
     unittest.main()
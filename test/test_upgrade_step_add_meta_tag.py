@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+
+from hamcrest import assert_that, contains_string, is_
+from mock import patch
+from mother import LoggingStub
+
+from src.file_access import FileAccess
+from src.upgrade_step_add_meta_tag import UpgradeStepAddMetaXmlElement, add_element_to_root
+
+META_XML = """<?xml version="1.0" ?>
+<meta>
+  <description>A configuration</description>
+  <isProtected>false</isProtected>
+</meta>
+"""
+
+
+class TestUpgradeStepAddMetaXmlElement(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.logger = LoggingStub()
+        self.file_access = FileAccess(self.logger, self.temp_dir.name)
+        self.config_folder = os.path.join(self.temp_dir.name, "configurations")
+        self.component_folder = os.path.join(self.temp_dir.name, "components")
+        for name, folder in (
+            ("COMPONENT_FOLDER", self.component_folder),
+            ("CONFIG_FOLDER", self.config_folder),
+        ):
+            os.makedirs(folder)
+            for module in ("src.file_access", "src.upgrade_step_add_meta_tag"):
+                patcher = patch("{}.{}".format(module, name), folder)
+                patcher.start()
+                self.addCleanup(patcher.stop)
+        self.upgrade_step = UpgradeStepAddMetaXmlElement("configuresBlockGWAndArchiver", "false")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _write_meta(self, folder, contents):
+        os.makedirs(folder)
+        with open(os.path.join(folder, "meta.xml"), "w") as f:
+            f.write(contents)
+
+    def _read_meta(self, folder):
+        with open(os.path.join(folder, "meta.xml")) as f:
+            return f.read()
+
+    def test_GIVEN_meta_without_tag_WHEN_perform_THEN_tag_added_and_rest_of_file_unchanged(self):
+        config = os.path.join(self.config_folder, "config1")
+        self._write_meta(config, META_XML)
+
+        result = self.upgrade_step.perform(self.file_access, self.logger)
+
+        assert_that(result, is_(0))
+        assert_that(
+            self._read_meta(config),
+            is_(
+                META_XML.replace(
+                    "</meta>",
+                    "  <configuresBlockGWAndArchiver>false</configuresBlockGWAndArchiver>\n</meta>",
+                )
+            ),
+        )
+
+    def test_GIVEN_meta_with_tag_WHEN_perform_THEN_file_not_written(self):
+        component = os.path.join(self.component_folder, "comp1")
+        contents = META_XML.replace(
+            "</meta>", "<configuresBlockGWAndArchiver>true</configuresBlockGWAndArchiver></meta>"
+        )
+        self._write_meta(component, contents)
+
+        with patch.object(self.file_access, "write_file") as write_file:
+            result = self.upgrade_step.perform(self.file_access, self.logger)
+
+        assert_that(result, is_(0))
+        write_file.assert_not_called()
+
+    def test_GIVEN_configuration_without_meta_WHEN_perform_THEN_error(self):
+        os.makedirs(os.path.join(self.config_folder, "config1"))
+
+        result = self.upgrade_step.perform(self.file_access, self.logger)
+
+        assert_that(result, is_(-1))
+
+    def test_GIVEN_no_components_folder_WHEN_perform_THEN_configurations_changed(self):
+        os.rmdir(self.component_folder)
+        config = os.path.join(self.config_folder, "config1")
+        self._write_meta(config, META_XML)
+
+        result = self.upgrade_step.perform(self.file_access, self.logger)
+
+        assert_that(result, is_(0))
+        assert_that(self._read_meta(config), contains_string("<configuresBlockGWAndArchiver>"))
+
+    def test_GIVEN_empty_root_WHEN_add_element_to_root_THEN_element_added_inside_root(self):
+        result = add_element_to_root(b'<?xml version="1.0" ?>\n<meta />\n', b"<a>1</a>")
+
+        assert_that(result, is_(b'<?xml version="1.0" ?>\n<meta><a>1</a></meta>\n'))
+
+    def test_GIVEN_xml_on_one_line_WHEN_add_element_to_root_THEN_element_added_on_same_line(self):
+        result = add_element_to_root(b"<meta><b>2</b></meta>", b"<a>1</a>")
+
+        assert_that(result, is_(b"<meta><b>2</b><a>1</a></meta>"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,12 @@
+import os
 import sys
+import tempfile
 import unittest
 
-from hamcrest import assert_that, equal_to, is_not
-from mock import mock_open, patch
+from hamcrest import all_of, assert_that, contains_string, equal_to, is_not
 from mother import FileAccessStub, LoggingStub
 
+from src.file_access import CachingFileAccess, FileAccess
 from src.upgrade_step_check_init_inst import UpgradeStepCheckInitInst
 
 module_ = "builtins"
@@ -21,12 +23,19 @@ class TestUpgradeStepCheckInitInst(unittest.TestCase):
         self.file_access = FileAccessStub()
         self.upgrade_step = UpgradeStepCheckInitInst()
         self.logger = LoggingStub()
-        self.directory_structure = [
-            ("root", ["dir1", "dir2"], ["init_file1"]),
-            ("root\\dir1", ["dir3"], ["init_file2", "init_file3"]),
-            ("root\\dir2", [], ["init_file4"]),
-            ("root\\dir3", [], []),
-        ]
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.disk_file_access = FileAccess(self.logger, self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _create_files(self, file_names, file_to_fill, contents):
+        root = os.path.join(self.temp_dir.name, "myfolder")
+        os.makedirs(root, exist_ok=True)
+        for file_name in file_names:
+            with open(os.path.join(root, file_name), "w") as f:
+                f.write(contents if file_name == file_to_fill else "")
+        return root
 
     def test_GIVEN_no_file_called_init_inst_WHEN_search_files_THEN_zero_returned(self):
         # Arrange
@@ -39,149 +48,160 @@ class TestUpgradeStepCheckInitInst(unittest.TestCase):
             "File starting with init_inst is not in filenames, so no pre or post cmd would be found by genie",
         )
 
-    @patch("builtins.open", mock_open(read_data=""), create=True)
     def test_GIVEN_file_with_name_none_containing_pre_post_cmd_WHEN_search_files_THEN_zero_returned(
         self,
     ):
         # Arrange
         file_names = ["init", "init_larmor", "another_file"]
-        root = "myfolder"
+        root = self._create_files(file_names, "init_larmor", "")
         # Act and Assert
         assert_that(
-            self.upgrade_step.search_files(file_names, root, self.file_access),
+            self.upgrade_step.search_files(file_names, root, self.disk_file_access),
             equal_to(0),
             "pre or post cmd not in init_larmor file, therefore this is ok",
         )
 
-    @patch("builtins.open", mock_open(read_data="precmd"), create=True)
     def test_GIVEN_file_with_name_containing_precmd_WHEN_search_files_THEN_error_returned(
         self,
     ):
         # Arrange
         file_names = ["init", "init_zoom", "another_file"]
-        root = "myfolder"
+        root = self._create_files(file_names, "init_zoom", "precmd")
         # Act and Assert
         assert_that(
-            self.upgrade_step.search_files(file_names, root, self.file_access),
+            self.upgrade_step.search_files(file_names, root, self.disk_file_access),
             is_not(equal_to(0)),
             "pre cmd in init_zoom file, therefore error message should be returned",
         )
 
-    @patch("builtins.open", mock_open(read_data="postcmd"))
     def test_GIVEN_file_with_name_containing_postcmd_WHEN_search_files_THEN_error_returned(
         self,
     ):
         # Arrange
         file_names = ["init", "init_inst", "another_file"]
-        root = "myfolder"
+        root = self._create_files(file_names, "init_inst", "postcmd")
         # Act and Assert
         assert_that(
-            self.upgrade_step.search_files(file_names, root, self.file_access),
+            self.upgrade_step.search_files(file_names, root, self.disk_file_access),
             is_not(equal_to(0)),
             "postcmd in init_inst file, therefore error message should be returned",
         )
 
-    @patch("builtins.open", mock_open(read_data="postcmd precmd"))
     def test_GIVEN_file_with_name_containing_pre_and_post_cmd_WHEN_search_files_THEN_error_returned(
         self,
     ):
         # Arrange
         file_names = ["init", "init_iris", "another_file"]
-        root = "myfolder"
+        root = self._create_files(file_names, "init_iris", "postcmd precmd")
         # Act and Assert
         assert_that(
-            self.upgrade_step.search_files(file_names, root, self.file_access),
+            self.upgrade_step.search_files(file_names, root, self.disk_file_access),
             is_not(equal_to(0)),
             "pre and post cmd in init_iris file, therefore error message should be returned",
         )
 
+    def test_GIVEN_staged_precmd_WHEN_search_files_THEN_staged_line_returned(self):
+        # Arrange
+        file_names = ["init_zoom"]
+        root = self._create_files(file_names, "init_zoom", "pass\n")
+        # Act
+        with CachingFileAccess(self.disk_file_access):
+            self.disk_file_access.write_file(os.path.join(root, "init_zoom"), ["pass", "precmd"])
+            result = self.upgrade_step.search_files(file_names, root, self.disk_file_access)
+        # Assert
+        assert_that(result, contains_string("init_zoom:2: precmd"))
+
+    def _create_tree(self, contents):
+        for path in ["init_file1", "dir1/init_file2", "dir1/init_file3", "dir2/init_file4"]:
+            full_path = os.path.join(self.temp_dir.name, "root", *path.split("/"))
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as f:
+                f.write(contents.get(path, "pass\n"))
+        os.makedirs(os.path.join(self.temp_dir.name, "root", "dir1", "dir3"))
+        return os.path.join(self.temp_dir.name, "root")
+
     def test_GIVEN_directory_structure_and_no_cmd_WHEN_search_folders_THEN_files_and_folders_walked_and_zero_returned(
         self,
     ):
         # Arrange
-        file_search_returns = [0, 0, 0, 0]  # One return for each of file1, 2, 3 and 4
-        with patch("os.walk", return_value=self.directory_structure), patch(
-            "src.upgrade_step_check_init_inst.UpgradeStepCheckInitInst.search_files",
-            side_effect=file_search_returns,
-        ) as mocked_search_files:
-            # Act
-            search_return = self.upgrade_step.search_folder("any", self.file_access)
-            # Assert
-            assert_that(
-                mocked_search_files.call_count,
-                equal_to(4),
-                "Four files to search, each should be called",
-            )
-            assert_that(search_return, equal_to(0), "Should pass successfully")
+        root = self._create_tree({})
+        # Act
+        search_return = self.upgrade_step.search_folder(root, self.disk_file_access)
+        # Assert
+        assert_that(search_return, equal_to(0), "Should pass successfully")
 
     def test_GIVEN_directory_structure_and_file_at_top_level_contains_precmd_WHEN_search_folders_THEN_error_returned(
         self,
     ):
         # Arrange
-        file_search_returns = [
-            "Error precmd",
-            0,
-            0,
-            0,
-        ]  # One return for each of file1, 2, 3 and 4
-        with patch("os.walk", return_value=self.directory_structure), patch(
-            "src.upgrade_step_check_init_inst.UpgradeStepCheckInitInst.search_files",
-            side_effect=file_search_returns,
-        ) as mocked_search_files:
-            # Act
-            search_return = self.upgrade_step.search_folder("any", self.file_access)
-            # Assert
-            assert_that(mocked_search_files.call_count, equal_to(4), "Should search all files")
-            assert_that(
-                search_return,
-                equal_to(file_search_returns[0] + "\n"),
-                "Return error from searched file",
-            )
+        root = self._create_tree({"init_file1": "def precmd():\n    pass\n"})
+        # Act
+        search_return = self.upgrade_step.search_folder(root, self.disk_file_access)
+        # Assert
+        assert_that(
+            search_return,
+            contains_string("{}:1: def precmd():".format(os.path.join(root, "init_file1"))),
+            "Return error from searched file",
+        )
+        assert_that(search_return, is_not(contains_string("init_file2")))
 
     def test_GIVEN_directory_structure_and_file_at_second_level_contains_postcmd_WHEN_search_folders_THEN_error_returned(
         self,
     ):
         # Arrange
-        file_search_returns = [
-            0,
-            0,
-            "Error postcmd",
-            0,
-        ]  # One return for each of file1, 2, 3 and 4
-        with patch("os.walk", return_value=self.directory_structure), patch(
-            "src.upgrade_step_check_init_inst.UpgradeStepCheckInitInst.search_files",
-            side_effect=file_search_returns,
-        ) as mocked_search_files:
-            # Act
-            search_return = self.upgrade_step.search_folder("any", self.file_access)
-            # Assert
-            assert_that(mocked_search_files.call_count, equal_to(4), "Should search all files")
-            assert_that(
-                search_return,
-                equal_to(file_search_returns[2] + "\n"),
-                "Return error from searched file",
-            )
+        root = self._create_tree({"dir1/init_file3": "import os\ndef postcmd():\n    pass\n"})
+        # Act
+        search_return = self.upgrade_step.search_folder(root, self.disk_file_access)
+        # Assert
+        assert_that(
+            search_return,
+            contains_string(
+                "{}:2: def postcmd():".format(os.path.join(root, "dir1", "init_file3"))
+            ),
+            "Return error from searched file",
+        )
 
     def test_GIVEN_directory_structure_and_two_files_contain_cmd_WHEN_search_folders_THEN_error_returned(
         self,
     ):
         # Arrange
-        file_search_returns = [
-            "Error precmd",
-            0,
-            "Error postcmd",
-            0,
-        ]  # One return for each of file1, 2, 3 and 4
-        with patch("os.walk", return_value=self.directory_structure), patch(
-            "src.upgrade_step_check_init_inst.UpgradeStepCheckInitInst.search_files",
-            side_effect=file_search_returns,
-        ) as mocked_search_files:
-            # Act
-            search_return = self.upgrade_step.search_folder("any", self.file_access)
-            # Assert
-            assert_that(mocked_search_files.call_count, equal_to(4), "Should search all files")
-            assert_that(
-                search_return,
-                equal_to(file_search_returns[0] + "\n" + file_search_returns[2] + "\n"),
-                "Return error from searched file",
-            )
+        root = self._create_tree(
+            {
+                "init_file1": "def precmd():\n    pass\n",
+                "dir2/init_file4": "def postcmd():\n    pass\n",
+            }
+        )
+        # Act
+        search_return = self.upgrade_step.search_folder(root, self.disk_file_access)
+        # Assert
+        assert_that(
+            search_return,
+            all_of(
+                contains_string("{}:1: def precmd():".format(os.path.join(root, "init_file1"))),
+                contains_string(
+                    "{}:1: def postcmd():".format(os.path.join(root, "dir2", "init_file4"))
+                ),
+            ),
+            "Return errors from all searched files",
+        )
+
+    def test_GIVEN_file_using_cmd_on_several_lines_WHEN_search_folders_THEN_every_line_returned(
+        self,
+    ):
+        # Arrange
+        root = self._create_tree(
+            {"dir1/init_file2": "def precmd():\n    pass\n\ndef postcmd():\n    precmd()\n"}
+        )
+        path = os.path.join(root, "dir1", "init_file2")
+        # Act
+        search_return = self.upgrade_step.search_folder(root, self.disk_file_access)
+        # Assert
+        assert_that(
+            search_return,
+            all_of(
+                contains_string("{}:1: def precmd():".format(path)),
+                contains_string("{}:4: def postcmd():".format(path)),
+                contains_string("{}:5: precmd()".format(path)),
+            ),
+            "Return every use in the file",
+        )
@@ -20,12 +20,19 @@ class TestUpgradeJawsForPositionAutosave(unittest.TestCase):
         matches: list[bool],
         batch_files_contents: list[list[str]],
     ):
-        self.file_access.get_file_paths = mock.Mock(side_effect=[substitution_files, batch_files])
+        self.file_access.get_file_paths = mock.Mock(return_value=batch_files)
 
-        self.file_access.file_contains = mock.Mock(side_effect=matches)
-        self.file_access.open_file = mock.Mock(side_effect=batch_files_contents)
+        contents_by_path = dict(zip(batch_files, batch_files_contents))
+        self.file_access.read_bytes = mock.Mock(
+            side_effect=lambda path: "\n".join(contents_by_path[path]).encode()
+        )
+        self.file_access.open_file = mock.Mock(side_effect=lambda path: contents_by_path[path])
         self.file_access.write_file = mock.Mock()
-        return self.upgrade_step.perform(self.file_access, self.logger)
+        with mock.patch("src.upgrade_step_from_12p0p0.TemplateUsageIndex") as template_index:
+            template_index.return_value.files_using_template.return_value = [
+                path for path, match in zip(substitution_files, matches) if match
+            ]
+            return self.upgrade_step.perform(self.file_access, self.logger)
 
     def test_GIVEN_files_with_correct_db_and_no_macros_WHEN_upgrade_THEN_macros_added_correctly(
         self,
@@ -120,3 +127,44 @@ class TestUpgradeJawsForPositionAutosave(unittest.TestCase):
         )
         self.file_access.write_file = Mock()
         self.file_access.write_file.assert_not_called()
+
+    def test_GIVEN_file_not_loading_any_db_WHEN_upgrade_THEN_file_not_split_into_lines(self):
+        substitution_files = ("jaws.substitutions",)
+        batch_files = ("jaws.cmd", "other.cmd")
+        matches = [True]
+        batch_files_contents = [
+            ["""dbLoadRecords("/jaws.db","P=$(MYPVPREFIX)MOT:")"""],
+            ["""dbLoadRecords("/other.db","P=$(MYPVPREFIX)MOT:")""", "# jaws.db"],
+        ]
+
+        self.assertEqual(
+            self._perform(substitution_files, batch_files, matches, batch_files_contents),
+            0,
+        )
+
+        self.file_access.open_file.assert_called_once_with("jaws.cmd")
+        self.file_access.write_file.assert_called_once()
+
+    def test_GIVEN_db_mentioned_without_load_WHEN_upgrade_THEN_line_not_changed(self):
+        substitution_files = ("jaws.substitutions",)
+        batch_files = ("jaws.cmd",)
+        matches = [True]
+        batch_files_contents = [
+            [
+                """# Loads "/jaws.db" below""",
+                """dbLoadRecords("/jaws.db","P=$(MYPVPREFIX)MOT:")""",
+            ]
+        ]
+
+        self.assertEqual(
+            self._perform(substitution_files, batch_files, matches, batch_files_contents),
+            0,
+        )
+
+        self.file_access.write_file.assert_called_once_with(
+            "jaws.cmd",
+            [
+                """# Loads "/jaws.db" below""",
+                """dbLoadRecords("/jaws.db","P=$(MYPVPREFIX)MOT:,IFINIT_FROM_AS=$(IFINIT_JAWS_FROM_AS=#),IFNOTINIT_FROM_AS=$(IFNOTINIT_JAWS_FROM_AS=)")""",
+            ],
+        )
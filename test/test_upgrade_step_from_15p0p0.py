@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+import git
+from hamcrest import assert_that, contains_string, has_item, is_
+from mock import patch
+from mother import FileAccessStub, LoggingStub
+
+from src.git_utils import RepoFactory
+from src.upgrade_step_from_15p0p0 import CUTOFF_TIMESTAMP, UpgradeFrom15p0p0
+
+
+class TestUpgradeFrom15p0p0(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config_root = self.temp_dir.name
+        self.repo = git.Repo.init(self.config_root)
+        with self.repo.config_writer() as config:
+            config.set_value("user", "name", "test")
+            config.set_value("user", "email", "test@example.com")
+        self.logger = LoggingStub()
+        self.file_access = FileAccessStub()
+        self.file_access.delete_folder = lambda folder: self.deleted.append(folder)
+        self.deleted = []
+        patcher = patch("src.upgrade_step_from_15p0p0.CONFIG_ROOT", self.config_root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        RepoFactory.clear()
+        self.temp_dir.cleanup()
+
+    def _commit(self, folder, timestamp):
+        os.makedirs(os.path.join(self.config_root, folder), exist_ok=True)
+        path = os.path.join(self.config_root, folder, "settings.txt")
+        with open(path, "a") as f:
+            f.write("{}\n".format(timestamp))
+        self.repo.index.add([path])
+        date = "{} +0000".format(timestamp)
+        self.repo.index.commit("change", author_date=date, commit_date=date)
+
+    def test_GIVEN_controller_settings_older_than_cutoff_WHEN_perform_THEN_settings_deleted(self):
+        self._commit("galil", CUTOFF_TIMESTAMP - 100)
+        self._commit("other", CUTOFF_TIMESTAMP + 100)
+
+        result = UpgradeFrom15p0p0().perform(self.file_access, self.logger)
+
+        assert_that(result, is_(0))
+        assert_that(self.deleted, is_([os.path.join(self.config_root, "galil")]))
+
+    def test_GIVEN_settings_changed_after_cutoff_WHEN_perform_THEN_error_and_nothing_deleted(self):
+        self._commit("galil", CUTOFF_TIMESTAMP - 100)
+        self._commit("twincat", CUTOFF_TIMESTAMP + 100)
+        self._commit("other", CUTOFF_TIMESTAMP + 200)
+
+        result = UpgradeFrom15p0p0().perform(self.file_access, self.logger)
+
+        assert_that(result, is_(1))
+        assert_that(self.logger.log_err, has_item(contains_string("Motor settings have changed")))
+        assert_that(self.deleted, is_([]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,13 @@
+import os
 import unittest
 import unittest.mock as mocked
+from xml.dom import minidom
 
 from hamcrest import assert_that, is_
 
 from src.common_upgrades.change_pvs_in_xml import ChangePVsInXML
+from src.common_upgrades.utils.constants import COMPONENT_FOLDER, CONFIG_FOLDER, SYNOPTIC_FOLDER
+from src.in_memory_file_access import InMemoryFileAccess
 from test.mother import FileAccessStub, LoggingStub
 from test.test_utils import (
     create_xml_with_starting_blocks,
@@ -97,6 +101,32 @@ class TestChangePVs(unittest.TestCase):
         write_file = mocked.create_autospec(self.file_access.write_file)
         write_file.assert_not_called()
 
+    def test_GIVEN_files_without_pv_WHEN_pv_counted_THEN_only_files_containing_it_parsed(self):
+        file_access = InMemoryFileAccess(
+            self.logger,
+            os.path.dirname(os.path.dirname(CONFIG_FOLDER)),
+            {
+                os.path.join(CONFIG_FOLDER, "config1", "blocks.xml"): (
+                    "<blocks><block><read_pv>IN:COORD0:MTR</read_pv></block></blocks>"
+                ),
+                os.path.join(CONFIG_FOLDER, "config2", "blocks.xml"): (
+                    "<blocks><block><read_pv>IN:OTHER</read_pv></block></blocks>"
+                ),
+                os.path.join(COMPONENT_FOLDER, "README.txt"): "no components",
+                os.path.join(SYNOPTIC_FOLDER, "synoptic.xml"): "<instrument/>",
+            },
+        )
+
+        with mocked.patch(
+            "src.in_memory_file_access.minidom.parseString", wraps=minidom.parseString
+        ) as parse:
+            number_of_pvs = ChangePVsInXML(file_access, self.logger).get_number_of_instances_of_pv(
+                ["COORD0:MTR", "COORD1:MTR"]
+            )
+
+        assert_that(number_of_pvs, is_(1))
+        assert_that(parse.call_count, is_(1))
+
 
 if __name__ == "__main__":
     unittest.main()
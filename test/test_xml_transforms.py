@@ -0,0 +1,95 @@
+import unittest
+from xml.dom import minidom
+
+from hamcrest import assert_that, contains_exactly, has_length, is_, none
+from mock import MagicMock as Mock
+from mother import FileAccessStub
+
+from src.common_upgrades.xml_transforms import (
+    SYNOPTIC_FILES,
+    XmlTransform,
+    apply_xml_transforms,
+    fuse_xml_transforms,
+)
+
+
+def set_value(value):
+    def edit(path, xml):
+        xml.documentElement.setAttribute("value", value)
+
+    return edit
+
+
+def fail(path, xml):
+    raise ValueError("bad xml")
+
+
+class TestXmlTransforms(unittest.TestCase):
+    def setUp(self):
+        self.file_access = FileAccessStub()
+        self.file_access.get_config_files = Mock(
+            side_effect=lambda file_type: iter([(file_type, minidom.parseString("<config/>"))])
+        )
+        self.file_access.get_synoptic_files = Mock(
+            side_effect=lambda: iter([("synoptic", minidom.parseString("<synoptic/>"))])
+        )
+
+    def test_GIVEN_transforms_of_one_file_type_WHEN_applied_THEN_file_read_and_written_once(self):
+        transforms = [
+            XmlTransform("blocks.xml", set_value("a")),
+            XmlTransform(SYNOPTIC_FILES, set_value("s")),
+            XmlTransform("blocks.xml", set_value("b")),
+        ]
+
+        apply_xml_transforms(self.file_access, transforms)
+
+        self.file_access.get_config_files.assert_called_once_with("blocks.xml")
+        self.file_access.get_synoptic_files.assert_called_once_with()
+        assert_that(
+            self.file_access.write_file_dict,
+            is_(
+                {
+                    "blocks.xml": '<?xml version="1.0" ?><config value="b"/>',
+                    "synoptic": '<?xml version="1.0" ?><synoptic value="s"/>',
+                }
+            ),
+        )
+
+    def test_GIVEN_transforms_of_steps_WHEN_fused_THEN_xml_after_each_step_kept(self):
+        transforms_of_steps = [
+            [XmlTransform("blocks.xml", set_value("a"))],
+            [],
+            [XmlTransform("blocks.xml", set_value("b"))],
+        ]
+
+        written, error = fuse_xml_transforms(self.file_access, transforms_of_steps)
+
+        assert_that(error, none())
+        self.file_access.get_config_files.assert_called_once_with("blocks.xml")
+        assert_that(
+            [{path: xml.toxml() for path, xml in files.items()} for files in written],
+            contains_exactly(
+                {"blocks.xml": '<?xml version="1.0" ?><config value="a"/>'},
+                {},
+                {"blocks.xml": '<?xml version="1.0" ?><config value="b"/>'},
+            ),
+        )
+
+    def test_GIVEN_step_fails_WHEN_fused_THEN_only_earlier_steps_kept_and_error_returned(self):
+        transforms_of_steps = [
+            [XmlTransform("blocks.xml", set_value("a"))],
+            [XmlTransform(SYNOPTIC_FILES, fail)],
+            [XmlTransform("blocks.xml", set_value("b"))],
+        ]
+
+        written, error = fuse_xml_transforms(self.file_access, transforms_of_steps)
+
+        assert_that(str(error), is_("bad xml"))
+        assert_that(written, has_length(1))
+        assert_that(
+            written[0]["blocks.xml"].toxml(), is_('<?xml version="1.0" ?><config value="a"/>')
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
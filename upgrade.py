@@ -1,6 +1,9 @@
 import os
 import sys
 
+from src.common_upgrades.sql_utilities import SqlConnection
+from src.common_upgrades.sqlite_connection import SqliteDatabase
+from src.common_upgrades.step_result_cache import StepResultCache
 from src.file_access import FileAccess
 from src.git_utils import RepoFactory
 from src.local_logger import LocalLogger
@@ -87,6 +90,16 @@ UPGRADE_STEPS = [
     ## an upgrade to abort as it will not be able to find the starting version to upgrade from
 ]
 
+
+def configure_database() -> None:
+    """Apply the database steps to the SQLite file named by UPGRADE_SQLITE_DATABASE, if it is set,
+    instead of the MySQL server e.g. to try them out."""
+    if "UPGRADE_SQLITE_DATABASE" in os.environ:
+        SqlConnection.connection_factory = SqliteDatabase(
+            os.environ["UPGRADE_SQLITE_DATABASE"]
+        ).connect
+
+
 if __name__ == "__main__":
     config_root = os.path.abspath(os.path.join(os.environ["ICPCONFIGROOT"], os.pardir))
     log_dir = os.path.join(os.environ["ICPVARDIR"], "logs", "upgrade")
@@ -95,10 +108,16 @@ if __name__ == "__main__":
     file_access = FileAccess(logger, config_root)
     git_repo = RepoFactory.get_repo(config_root)
 
+    configure_database()
+
     upgrade = Upgrade(
         file_access=file_access,
         logger=logger,
         upgrade_steps=UPGRADE_STEPS,
         git_repo=git_repo,
+        step_cache=StepResultCache(logger),
     )
-    sys.exit(upgrade.upgrade())
+    result = upgrade.upgrade()
+    logger.info(RepoFactory.timing_summary())
+    RepoFactory.clear()
+    sys.exit(result)